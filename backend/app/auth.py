@@ -1,33 +1,100 @@
-from datetime import datetime, timedelta
+import hashlib
+import os
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from . import schemas, models
-from .database import SessionLocal
-
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
+from . import metrics, schemas, models
+from .cache import LatencyStats, TTLCache
+from .database import get_db
+from .executors import BoundedExecutor, ExecutorSaturated
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", 30))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1))
+)
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 32))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Token subject -> schemas.User, so authenticated requests from an active
+# user skip the users table entirely.
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+user_lookup_latency = LatencyStats()
+
+# bcrypt releases the GIL, so a few threads are enough to keep hashing off
+# the event loop without letting a login burst eat every core.
+password_executor = BoundedExecutor(
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE, name="bcrypt"
+)
+
+
+def invalidate_user(user_id: int):
+    # Matched by id so that a rename also drops the entry cached under
+    # the old username; user changes are rare enough to scan for.
+    user_cache.remove_if(lambda user: user.id == user_id)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    invalidate_user(target.id)
+
+
+metrics.registry.register_collector(
+    "user_cache", "Authenticated user cache", user_cache.stats
+)
+metrics.registry.register_collector(
+    "user_lookup", "Authenticated user lookups", user_lookup_latency.stats
+)
+metrics.registry.register_collector(
+    "password_executor", "bcrypt thread pool", password_executor.stats
+)
+
 
 def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+    with metrics.PASSWORD_HASH_DURATION.time(("verify",)):
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str):
-    return pwd_context.hash(password)
+    with metrics.PASSWORD_HASH_DURATION.time(("hash",)):
+        return pwd_context.hash(password)
+
+
+async def _run_password_hashing(fn, *args):
+    try:
+        return await password_executor.run(fn, *args)
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, try again later",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def averify_password(plain_password: str, hashed_password: str):
+    return await _run_password_hashing(
+        verify_password, plain_password, hashed_password
+    )
+
+
+async def aget_password_hash(password: str):
+    return await _run_password_hashing(get_password_hash, password)
 
 
 def get_user(db, username: str):
@@ -45,19 +112,132 @@ def authenticate_user(db, username: str, password: str):
     return user
 
 
+async def aget_user(db: AsyncSession, username: str):
+    stmt = select(models.User).where(models.User.username == username)
+    return (await db.scalars(stmt)).first()
+
+
+async def aauthenticate_user(db: AsyncSession, username: str, password: str):
+    user = await aget_user(db, username)
+    if not user:
+        return False
+    if not await averify_password(password, user.hashed_password):
+        return False
+    return user
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now() + expires_delta
-    else:
-        expire = datetime.now() + timedelta(minutes=15)
+    if expires_delta is None:
+        expires_delta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.now(timezone.utc) + expires_delta
     to_encode.update({"exp": expire})
-    print(to_encode)
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Refresh tokens are random and long, so a fast unsalted hash is enough
+# to keep the stored values useless to whoever reads the table
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _new_refresh_token(db: AsyncSession, user_id: int, family: str,
+                       now: datetime) -> str:
+    token = secrets.token_urlsafe(32)
+    db.add(models.RefreshToken(
+        token_hash=hash_refresh_token(token),
+        user_id=user_id,
+        family=family,
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+async def acreate_refresh_token(db: AsyncSession, user_id: int) -> str:
+    token = _new_refresh_token(
+        db, user_id, secrets.token_hex(16), _utcnow()
+    )
+    await db.commit()
+    return token
+
+
+async def arevoke_refresh_token_family(db: AsyncSession, family: str):
+    await db.execute(
+        update(models.RefreshToken)
+        .where(
+            models.RefreshToken.family == family,
+            models.RefreshToken.revoked_at.is_(None),
+        )
+        .values(revoked_at=_utcnow())
+    )
+    await db.commit()
+
+
+async def arevoke_refresh_token(db: AsyncSession, token: str):
+    family = await db.scalar(
+        select(models.RefreshToken.family).where(
+            models.RefreshToken.token_hash == hash_refresh_token(token)
+        )
+    )
+    if family is not None:
+        await arevoke_refresh_token_family(db, family)
+
+
+# Swaps a refresh token for a new one of the same family. Returns the
+# user's name and the new token, or None when the token is unknown,
+# expired or revoked.
+async def arotate_refresh_token(db: AsyncSession, token: str):
+    now = _utcnow()
+    token_hash = hash_refresh_token(token)
+    # Revoking and reading in one statement, so that two requests racing
+    # with the same token cannot both get a new one
+    rotated = (await db.execute(
+        update(models.RefreshToken)
+        .where(
+            models.RefreshToken.token_hash == token_hash,
+            models.RefreshToken.revoked_at.is_(None),
+            models.RefreshToken.expires_at > now,
+        )
+        .values(revoked_at=now)
+        .returning(models.RefreshToken.user_id, models.RefreshToken.family)
+    )).first()
+    if rotated is None:
+        stored = await db.get(models.RefreshToken, token_hash)
+        if stored is not None and stored.revoked_at is not None:
+            # Already swapped once, so someone else holds a copy
+            await arevoke_refresh_token_family(db, stored.family)
+        else:
+            await db.rollback()
+        return None
+    user_id, family = rotated
+    username = await db.scalar(
+        select(models.User.username).where(models.User.id == user_id)
+    )
+    if username is None:
+        await db.rollback()
+        return None
+    # Expired tokens are cleared here rather than at login, which keeps
+    # logins to one insert while they hold the write lock
+    await db.execute(
+        delete(models.RefreshToken).where(
+            models.RefreshToken.user_id == user_id,
+            models.RefreshToken.expires_at <= now,
+        )
+    )
+    new_token = _new_refresh_token(db, user_id, family, now)
+    await db.commit()
+    return username, new_token
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
+):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -72,8 +252,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
-    db = SessionLocal()
-    user = get_user(db, username=token_data.username)
+    start = time.perf_counter()
+    user = user_cache.get(token_data.username)
     if user is None:
-        raise credentials_exception
+        db_user = await aget_user(db, username=token_data.username)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.User.from_orm(db_user)
+        user_cache.set(token_data.username, user)
+    user_lookup_latency.observe(time.perf_counter() - start)
     return user
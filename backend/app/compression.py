@@ -0,0 +1,195 @@
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional, pip install brotli
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional, pip install zstandard
+    zstandard = None
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 500))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 1))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+
+# Already compressed, or streamed to the client as events arrive
+SKIP_CONTENT_TYPES = ("image/", "video/", "audio/", "text/event-stream")
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int = COMPRESSION_GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level: int = COMPRESSION_BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self, level: int = COMPRESSION_ZSTD_LEVEL):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Server preference when the client accepts several equally
+AVAILABLE_ENCODERS = {"gzip": GzipEncoder}
+if zstandard is not None:
+    AVAILABLE_ENCODERS = {"zstd": ZstdEncoder, **AVAILABLE_ENCODERS}
+if brotli is not None:
+    AVAILABLE_ENCODERS = {"br": BrotliEncoder, **AVAILABLE_ENCODERS}
+
+
+def choose_encoding(accept_encoding: str, encodings) -> str | None:
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            weights[name] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+# Pure ASGI so large bodies are compressed chunk by chunk as the app
+# streams them instead of being buffered whole. Small responses, ones that
+# already carry a Content-Encoding and media that is compressed anyway
+# pass through untouched.
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+                 encoders: dict | None = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = AVAILABLE_ENCODERS if encoders is None else encoders
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), self.encoders
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(
+            send, self.encoders[encoding], self.minimum_size
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoder_class, minimum_size: int):
+        self._send = send
+        self.encoder_class = encoder_class
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+
+    def _skip(self, headers: Headers) -> bool:
+        return (
+            "content-encoding" in headers
+            or headers.get("content-type", "").startswith(SKIP_CONTENT_TYPES)
+        )
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows whether the
+            # response is worth compressing
+            self.start_message = message
+            self.passthrough = self._skip(Headers(raw=message["headers"]))
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if self.passthrough or (
+                not more_body and len(body) < self.minimum_size
+            ):
+                self.passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+            self.encoder = self.encoder_class()
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoder.name
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # The compressed bytes differ from the identity ones, so
+                # the tag can only claim semantic equivalence
+                headers["ETag"] = f"W/{etag}"
+            if more_body:
+                del headers["Content-Length"]
+                await self._send(start)
+                await self._send_chunk(body, more_body)
+                return
+            compressed = self.encoder.compress(body) + self.encoder.flush()
+            headers["Content-Length"] = str(len(compressed))
+            await self._send(start)
+            await self._send({
+                "type": "http.response.body", "body": compressed
+            })
+            return
+
+        if self.passthrough:
+            await self._send(message)
+        else:
+            await self._send_chunk(body, more_body)
+
+    async def _send_chunk(self, body: bytes, more_body: bool):
+        data = self.encoder.compress(body)
+        if not more_body:
+            data += self.encoder.flush()
+        if data or not more_body:
+            await self._send({
+                "type": "http.response.body",
+                "body": data,
+                "more_body": more_body,
+            })
@@ -1,41 +1,123 @@
+import html
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from . import models, schemas
 
 
-def get_note(db: Session, note_id: int, user_id: int):
-    return (
-        db.query(models.Note)
-        .filter(models.Note.id == note_id, models.Note.owner_id == user_id)
-        .first()
+def _now() -> datetime:
+    # Naive UTC, which is what the DateTime columns store
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _select_note(note_id: int, user_id: int):
+    return select(models.Note).where(
+        models.Note.id == note_id, models.Note.owner_id == user_id
     )
 
 
-def get_notes(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+# Same columns, in the same order, as ``schemas.Note`` serializes them
+NOTE_COLUMNS = (
+    models.Note.title,
+    models.Note.content,
+    models.Note.id,
+    models.Note.owner_id,
+    models.Note.created_at,
+    models.Note.updated_at,
+)
+NOTE_FIELDS = {column.key: column for column in NOTE_COLUMNS}
+EXCERPT_LENGTH = 200
+
+
+def note_columns(fields: list[str]):
+    # Projection for ``fields=``; the id is always included so that rows
+    # can be paged and fetched individually
+    unknown = set(fields) - set(NOTE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    wanted = set(fields) | {"id"}
+    return tuple(
+        column for key, column in NOTE_FIELDS.items() if key in wanted
+    )
+
+
+def summary_columns(excerpt_length: int = EXCERPT_LENGTH):
+    # The excerpt is cut in SQL so the full body never leaves the database
     return (
-        db.query(models.Note)
-        .filter(models.Note.owner_id == user_id)
-        .offset(skip)
-        .limit(limit)
-        .all()
+        models.Note.id,
+        models.Note.title,
+        func.substr(models.Note.content, 1, excerpt_length).label("excerpt"),
+    )
+
+
+def _select_notes(
+    user_id: int,
+    skip: int,
+    limit: int,
+    after_id: int | None,
+    columns=(models.Note,),
+):
+    stmt = select(*columns).where(models.Note.owner_id == user_id)
+    if after_id is not None:
+        # Keyset paging: seek past the last seen id instead of re-scanning
+        # and discarding every earlier row like OFFSET does.
+        stmt = stmt.where(models.Note.id > after_id)
+    return stmt.order_by(models.Note.id).offset(skip).limit(limit)
+
+
+def _select_notes_version(user_id: int):
+    return select(models.NoteVersion.version).where(
+        models.NoteVersion.owner_id == user_id
     )
 
 
+def get_note(db: Session, note_id: int, user_id: int):
+    return db.scalars(_select_note(note_id, user_id)).first()
+
+
+def get_notes(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: int | None = None,
+):
+    return db.scalars(_select_notes(user_id, skip, limit, after_id)).all()
+
+
+def get_notes_version(db: Session, user_id: int) -> int:
+    return db.scalar(_select_notes_version(user_id)) or 0
+
+
 def create_note(db: Session, note: schemas.NoteCreate, user_id: int):
-    db_note = models.Note(**note.dict(), owner_id=user_id)
+    now = _now()
+    db_note = models.Note(
+        **note.dict(), owner_id=user_id, created_at=now, updated_at=now
+    )
     db.add(db_note)
     db.commit()
     db.refresh(db_note)
     return db_note
 
 
+def _changes_note(db_note: models.Note, note: schemas.NoteCreate) -> bool:
+    # Only title and content changes bump the owner's version, so saving
+    # the same text again must not move updated_at either; otherwise
+    # ETags and the change feed would keep serving the old timestamp
+    return (db_note.title, db_note.content) != (note.title, note.content)
+
+
 def update_note(
     db: Session, note_id: int, note: schemas.NoteCreate, user_id: int
 ):
     db_note = get_note(db, note_id, user_id)
-    if db_note:
+    if db_note and _changes_note(db_note, note):
         db_note.title = note.title
         db_note.content = note.content
+        db_note.updated_at = _now()
         db.commit()
         db.refresh(db_note)
     return db_note
@@ -45,5 +127,393 @@ def delete_note(db: Session, note_id: int, user_id: int):
     db_note = get_note(db, note_id, user_id)
     if db_note:
         db.delete(db_note)
+        db.flush()
+        _write_tombstones(db, [note_id], user_id)
         db.commit()
     return db_note
+
+
+# Batch operations run as one transaction with a single multi-row
+# statement each, instead of a commit and refresh per note. They return
+# plain rows rather than ORM instances, which would be expired on commit
+# and re-selected one by one.
+NOTES_TABLE = models.Note.__table__
+TOMBSTONES_TABLE = models.NoteTombstone.__table__
+
+
+def _insert_notes(notes: list[schemas.NoteCreate], user_id: int):
+    stmt = insert(NOTES_TABLE).returning(
+        *NOTES_TABLE.c, sort_by_parameter_order=True
+    )
+    now = _now()
+    params = [
+        {
+            **note.dict(),
+            "owner_id": user_id,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for note in notes
+    ]
+    return stmt, params
+
+
+def _select_owned_notes(ids: list[int], user_id: int):
+    return select(*NOTE_COLUMNS).where(
+        models.Note.owner_id == user_id, models.Note.id.in_(set(ids))
+    )
+
+
+def _update_rows(notes: list[schemas.NoteBatchUpdateItem], owned):
+    now = _now()
+    return [
+        {**note.dict(), "updated_at": now}
+        for note in notes
+        if note.id in owned
+    ]
+
+
+def _update_results(notes: list[schemas.NoteBatchUpdateItem], owned, rows):
+    # The stored row with the new values on top, so every column matches
+    # what a GET of the note returns afterwards
+    by_id = {row["id"]: row for row in rows}
+    results = []
+    for note in notes:
+        if note.id in by_id:
+            updated = {**owned[note.id], **by_id[note.id]}
+            results.append(
+                {"id": note.id, "status": "updated", "note": updated}
+            )
+        else:
+            results.append({"id": note.id, "status": "not_found"})
+    return results
+
+
+def _delete_notes(ids: list[int], user_id: int):
+    return (
+        delete(NOTES_TABLE)
+        .where(
+            NOTES_TABLE.c.owner_id == user_id, NOTES_TABLE.c.id.in_(set(ids))
+        )
+        .returning(*NOTES_TABLE.c)
+    )
+
+
+def _tombstone_rows(note_ids: list[int], user_id: int, version: int):
+    # The delete triggers bumped the owner's version once per note, so the
+    # last len(note_ids) versions belong to these deletes
+    now = _now()
+    first = version - len(note_ids) + 1
+    return [
+        {
+            "note_id": note_id,
+            "owner_id": user_id,
+            "deleted_at": now,
+            "change_version": first + i,
+        }
+        for i, note_id in enumerate(note_ids)
+    ]
+
+
+def _clear_tombstones(note_ids: list[int], user_id: int):
+    # SQLite may hand a deleted id out again; keep one tombstone per note
+    # of an owner, and leave other owners' tombstones of that id alone
+    return delete(TOMBSTONES_TABLE).where(
+        TOMBSTONES_TABLE.c.owner_id == user_id,
+        TOMBSTONES_TABLE.c.note_id.in_(note_ids),
+    )
+
+
+def _write_tombstones(db: Session, note_ids: list[int], user_id: int):
+    if note_ids:
+        version = get_notes_version(db, user_id)
+        db.execute(_clear_tombstones(note_ids, user_id))
+        db.execute(
+            insert(TOMBSTONES_TABLE),
+            _tombstone_rows(note_ids, user_id, version),
+        )
+
+
+async def _awrite_tombstones(
+    db: AsyncSession, note_ids: list[int], user_id: int
+):
+    if note_ids:
+        version = await aget_notes_version(db, user_id)
+        await db.execute(_clear_tombstones(note_ids, user_id))
+        await db.execute(
+            insert(TOMBSTONES_TABLE),
+            _tombstone_rows(note_ids, user_id, version),
+        )
+
+
+def _delete_results(ids: list[int], deleted):
+    by_id = {note.id: note for note in deleted}
+    results = []
+    for note_id in ids:
+        db_note = by_id.pop(note_id, None)
+        if db_note is not None:
+            results.append(
+                {"id": note_id, "status": "deleted", "note": db_note}
+            )
+        else:
+            results.append({"id": note_id, "status": "not_found"})
+    return results
+
+
+async def aget_note(db: AsyncSession, note_id: int, user_id: int):
+    return (await db.scalars(_select_note(note_id, user_id))).first()
+
+
+async def aget_notes(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: int | None = None,
+):
+    stmt = _select_notes(user_id, skip, limit, after_id)
+    return (await db.scalars(stmt)).all()
+
+
+async def aget_notes_version(db: AsyncSession, user_id: int) -> int:
+    return (await db.scalar(_select_notes_version(user_id))) or 0
+
+
+async def aget_note_rows(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: int | None = None,
+    columns=NOTE_COLUMNS,
+) -> list[dict]:
+    # Plain dicts straight from the cursor, for responses that skip ORM
+    # loading and pydantic validation, or that only need some columns
+    result = await db.execute(
+        _select_notes(user_id, skip, limit, after_id, columns)
+    )
+    return [row._asdict() for row in result]
+
+
+async def acreate_note(
+    db: AsyncSession, note: schemas.NoteCreate, user_id: int
+):
+    now = _now()
+    db_note = models.Note(
+        **note.dict(), owner_id=user_id, created_at=now, updated_at=now
+    )
+    db.add(db_note)
+    await db.commit()
+    await db.refresh(db_note)
+    return db_note
+
+
+async def aupdate_note(
+    db: AsyncSession, note_id: int, note: schemas.NoteCreate, user_id: int
+):
+    db_note = await aget_note(db, note_id, user_id)
+    if db_note and _changes_note(db_note, note):
+        db_note.title = note.title
+        db_note.content = note.content
+        db_note.updated_at = _now()
+        await db.commit()
+        # Every field the API returns is already loaded unless the commit
+        # expired them, so the usual session skips the re-SELECT
+        if db.sync_session.expire_on_commit:
+            await db.refresh(db_note)
+    return db_note
+
+
+async def adelete_note(db: AsyncSession, note_id: int, user_id: int):
+    db_note = await aget_note(db, note_id, user_id)
+    if db_note:
+        await db.delete(db_note)
+        await db.flush()
+        await _awrite_tombstones(db, [note_id], user_id)
+        await db.commit()
+    return db_note
+
+
+async def acreate_notes(
+    db: AsyncSession, notes: list[schemas.NoteCreate], user_id: int
+):
+    stmt, params = _insert_notes(notes, user_id)
+    db_notes = (await db.execute(stmt, params)).all()
+    await db.commit()
+    return [
+        {"id": note.id, "status": "created", "note": note}
+        for note in db_notes
+    ]
+
+
+async def aupdate_notes(
+    db: AsyncSession, notes: list[schemas.NoteBatchUpdateItem], user_id: int
+):
+    stmt = _select_owned_notes([n.id for n in notes], user_id)
+    owned = {row.id: row._asdict() for row in await db.execute(stmt)}
+    rows = _update_rows(notes, owned)
+    if rows:
+        await db.execute(update(models.Note), rows)
+    await db.commit()
+    return _update_results(notes, owned, rows)
+
+
+async def aget_notes_by_ids(db: AsyncSession, ids: list[int], user_id: int):
+    result = await db.scalars(
+        select(models.Note).where(
+            models.Note.owner_id == user_id, models.Note.id.in_(set(ids))
+        )
+    )
+    return result.all()
+
+
+async def adelete_notes(db: AsyncSession, ids: list[int], user_id: int):
+    deleted = (await db.execute(_delete_notes(ids, user_id))).all()
+    await _awrite_tombstones(db, [note.id for note in deleted], user_id)
+    await db.commit()
+    return _delete_results(ids, deleted)
+
+
+# Incremental sync. Every note and tombstone carries the owner's version
+# at the time of its change, so a client that has seen everything up to
+# ``since`` only needs rows above it; both lookups are range scans on an
+# (owner_id, change_version) index.
+def _select_changed_notes(user_id: int, since: int, until: int, limit: int):
+    return (
+        select(models.Note)
+        .where(
+            models.Note.owner_id == user_id,
+            models.Note.change_version > since,
+            models.Note.change_version <= until,
+        )
+        .order_by(models.Note.change_version)
+        .limit(limit)
+    )
+
+
+def _select_tombstones(user_id: int, since: int, until: int, limit: int):
+    return (
+        select(TOMBSTONES_TABLE.c.note_id, TOMBSTONES_TABLE.c.change_version)
+        .where(
+            TOMBSTONES_TABLE.c.owner_id == user_id,
+            TOMBSTONES_TABLE.c.change_version > since,
+            TOMBSTONES_TABLE.c.change_version <= until,
+        )
+        .order_by(TOMBSTONES_TABLE.c.change_version)
+        .limit(limit)
+    )
+
+
+def _changes(version: int, notes, tombstones, limit: int):
+    changes = sorted(
+        [(note.change_version, note) for note in notes]
+        + [(row.change_version, row.note_id) for row in tombstones],
+        key=lambda change: change[0],
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    upserts = [c for _, c in changes if isinstance(c, models.Note)]
+    live = {note.id for note in upserts}
+    return {
+        "token": changes[-1][0] if has_more else version,
+        "has_more": has_more,
+        "upserts": upserts,
+        # An id handed out again after a delete is reported as an upsert
+        "deletes": [
+            c for _, c in changes if isinstance(c, int) and c not in live
+        ],
+    }
+
+
+async def aget_changes(
+    db: AsyncSession, user_id: int, since: int = 0, limit: int = 500
+):
+    # The version is read first so that anything committed meanwhile is
+    # left for the next call rather than skipped
+    version = await aget_notes_version(db, user_id)
+    notes = (await db.scalars(
+        _select_changed_notes(user_id, since, version, limit + 1)
+    )).all()
+    tombstones = (await db.execute(
+        _select_tombstones(user_id, since, version, limit + 1)
+    )).all()
+    return _changes(version, notes, tombstones, limit)
+
+
+# Title matches weigh more than body matches; the owner column only
+# scopes the query and must not affect ranking.
+SEARCH_SQL = text(
+    """
+    SELECT
+        notes_fts.rowid AS id,
+        highlight(notes_fts, 0, :open, :close) AS title,
+        snippet(notes_fts, 1, :open, :close, '…', 16) AS snippet,
+        bm25(notes_fts, 10.0, 1.0, 0.0) AS rank
+    FROM notes_fts
+    WHERE notes_fts MATCH :match
+    ORDER BY rank
+    LIMIT :limit
+    """
+)
+
+
+def build_search_match(query: str, user_id: int):
+    terms = []
+    for term in query.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*")
+        if not term:
+            continue
+        # Quote every term so user input can never inject FTS5 syntax
+        quoted = '"' + term.replace('"', '""') + '"'
+        terms.append(quoted + "*" if prefix else quoted)
+    if not terms:
+        return None
+    return f'owner:"u{user_id}" AND {{title content}}: ({" ".join(terms)})'
+
+
+# FTS5 wraps matches around raw note text, so they are marked with
+# control characters and turned into <mark> tags only after escaping.
+_OPEN, _CLOSE = "\x02", "\x03"
+
+
+def _search_params(match: str, limit: int):
+    return {
+        "match": match,
+        "limit": limit,
+        "open": _OPEN,
+        "close": _CLOSE,
+    }
+
+
+def _mark(value: str) -> str:
+    return (
+        html.escape(value)
+        .replace(_OPEN, "<mark>")
+        .replace(_CLOSE, "</mark>")
+    )
+
+
+def _search_results(result):
+    return [
+        {**row, "title": _mark(row["title"]), "snippet": _mark(row["snippet"])}
+        for row in result.mappings()
+    ]
+
+
+def search_notes(db: Session, user_id: int, query: str, limit: int = 20):
+    match = build_search_match(query, user_id)
+    if match is None:
+        return []
+    result = db.execute(SEARCH_SQL, _search_params(match, limit))
+    return _search_results(result)
+
+
+async def asearch_notes(
+    db: AsyncSession, user_id: int, query: str, limit: int = 20
+):
+    match = build_search_match(query, user_id)
+    if match is None:
+        return []
+    result = await db.execute(SEARCH_SQL, _search_params(match, limit))
+    return _search_results(result)
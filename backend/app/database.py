@@ -1,11 +1,153 @@
-from sqlalchemy import create_engine
+import os
+import time
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./notes.db"
+from . import metrics, profiling
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL") or "sqlite:///./notes.db"
+
+# Applied to every new SQLite connection. WAL lets readers proceed while a
+# writer commits, and busy_timeout makes writers wait for the lock
+# instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    # Negative values are in KiB rather than pages
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -16000)),
+}
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite"}
+ASYNC_DRIVER_NAMES = ("aiosqlite",)
+
+
+# Records how long each checkout waits for a free connection (or opens a
+# new one). Subclassed rather than patched so pools recreated by
+# engine.dispose() keep the timing.
+class _TimedCheckout:
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_CHECKOUT.observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def to_async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if (
+        backend not in ASYNC_DRIVERS
+        or parsed.get_driver_name() in ASYNC_DRIVER_NAMES
+    ):
+        return url
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(
+        hide_password=False
+    )
+
+
+def check_url(url: str):
+    # Migrations, search (FTS5) and the version triggers are written for
+    # SQLite only
+    backend = make_url(url).get_backend_name()
+    if backend != "sqlite":
+        raise ValueError(f"Unsupported database backend: {backend}")
+
+
+def engine_options(url: str) -> dict:
+    parsed = make_url(url)
+    options = {}
+    if parsed.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if parsed.database in (None, "", ":memory:"):
+            # In-memory databases use a single-connection pool
+            return options
+    is_async = parsed.get_driver_name() in ASYNC_DRIVER_NAMES
+    options.update(
+        poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    return options
+
+
+def _install_sqlite_pragmas(engine, pragmas: dict):
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def create_db_engine(url: str, pragmas: dict | None = None, **kwargs):
+    check_url(url)
+    engine = create_engine(url, **{**engine_options(url), **kwargs})
+    _install_sqlite_pragmas(
+        engine, SQLITE_PRAGMAS if pragmas is None else pragmas
+    )
+    return engine
+
+
+def create_async_db_engine(url: str, pragmas: dict | None = None, **kwargs):
+    check_url(url)
+    url = to_async_url(url)
+    engine = create_async_engine(url, **{**engine_options(url), **kwargs})
+    _install_sqlite_pragmas(
+        engine.sync_engine, SQLITE_PRAGMAS if pragmas is None else pragmas
+    )
+    return engine
+
+
+# The sync engine is kept for migrations and scripts; request handling
+# goes through the async engine so DB waits never block the event loop.
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine(
+    os.getenv("ASYNC_DATABASE_URL") or SQLALCHEMY_DATABASE_URL
+)
+if metrics.METRICS_ENABLED:
+    metrics.instrument_engine(engine)
+    metrics.instrument_engine(async_engine.sync_engine)
+if profiling.QUERY_PROFILING_ENABLED:
+    profiling.instrument_engine(engine)
+    profiling.instrument_engine(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
+
+
+# Dependency. Statements run while the session is open are counted per
+# request, and repeated ones are reported when it closes.
+async def get_db(request: Request = None):
+    name = f"{request.method} {request.url.path}" if request else ""
+    async with AsyncSessionLocal() as db:
+        with profiling.profile_queries(name):
+            yield db
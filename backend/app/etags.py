@@ -0,0 +1,21 @@
+import hashlib
+
+
+def make_etag(user_id: int, version: int, *parts) -> str:
+    # The per-user notes version changes on every write, so it identifies
+    # the representation without hashing the response body. Query
+    # parameters go into ``parts`` so that each page gets its own tag.
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'"{user_id}-{version}-{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match uses the weak comparison function (RFC 9110, 13.1.2)
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag
+        for tag in if_none_match.split(",")
+    )
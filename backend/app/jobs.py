@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, owner_id: int, fn, args):
+        self.id = uuid.uuid4().hex
+        self.owner_id = owner_id
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self._fn = fn
+        self._args = args
+
+
+# Runs coroutine functions on a fixed number of asyncio worker tasks fed
+# by a bounded queue. Jobs are looked up by id while pending; finished
+# jobs move to a TTL cache so their results can be polled for a while
+# without the table growing forever.
+class JobQueue:
+    def __init__(self, workers: int, max_queue: int,
+                 result_ttl: float = 600.0, max_results: int = 10000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.busy = 0
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        self.results = TTLCache(maxsize=max_results, ttl=result_ttl)
+        self._pending: dict[str, Job] = {}
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._pending.clear()
+        self.busy = 0
+
+    def submit(self, owner_id: int, fn, *args) -> Job:
+        self.start()
+        job = Job(owner_id, fn, args)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull(f"{self.max_queue} jobs already queued")
+        self._pending[job.id] = job
+        self.submitted += 1
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        job = self._pending.get(job_id)
+        if job is None:
+            job = self.results.get(job_id)
+        return job
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self.busy += 1
+            job.status = RUNNING
+            try:
+                job.result = await job._fn(*job._args)
+                job.status = SUCCEEDED
+                self.succeeded += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.info("Job %s failed: %s", job.id, e)
+                job.error = str(e)
+                job.status = FAILED
+                self.failed += 1
+            finally:
+                self.busy -= 1
+                job.finished_at = datetime.now(timezone.utc)
+                self.results.set(job.id, job)
+                self._pending.pop(job.id, None)
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "utilization": self.busy / self.workers if self.workers else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "retained_results": len(self.results),
+        }
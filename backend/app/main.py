@@ -1,37 +1,77 @@
-from fastapi import FastAPI, Depends, HTTPException
+import os
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from fastapi import (
+    APIRouter, FastAPI, Depends, Header, HTTPException, Query, Response
+)
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from . import models, schemas, crud, auth, services
-from .database import SessionLocal, engine
+from . import (
+    models, schemas, crud, auth, pagination, migrations, metrics, ratelimit,
+)
+from .etags import etag_matches, make_etag
+from .compression import CompressionMiddleware
+from .database import async_engine, engine, get_db
 
-models.Base.metadata.create_all(bind=engine)
+# Serve note listings from plain rows encoded by orjson instead of ORM
+# objects validated by pydantic and encoded by the stdlib json module
+FAST_JSON_RESPONSES = os.getenv(
+    "FAST_JSON_RESPONSES", "false"
+).lower() in ("1", "true", "yes")
 
-app = FastAPI()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Everything that touches the database or the network happens here rather
+# than at import time, so importing the app (tests, scripts, workers
+# before they are forked) stays cheap and free of side effects. That
+# includes the translation stack and httpx, imported by the lifespan and
+# the translate routes.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from . import services
 
+    migrations.migrate(engine)
+    await services.startup()
+    yield
+    await services.shutdown()
+    # Pooled aiosqlite connections run on non-daemon threads that would
+    # otherwise keep the process alive after uvicorn has finished
+    await async_engine.dispose()
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+router = APIRouter()
+
+# Clients may keep note responses but must revalidate them every time
+NOTES_CACHE_CONTROL = "private, no-cache"
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = NOTES_CACHE_CONTROL
+
+
+def not_modified(etag: str) -> Response:
+    response = Response(status_code=304)
+    set_etag(response, etag)
+    return response
+
+
+def token_response(username: str, refresh_token: str) -> dict:
+    return {
+        "access_token": auth.create_access_token(data={"sub": username}),
+        "token_type": "bearer",
+        "expires_in": auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token,
+    }
 
 
-@app.post("/token", response_model=schemas.Token)
+@router.post("/token", response_model=schemas.Token)
 async def login_for_access_token(
-    user: schemas.UserCreate, db: Session = Depends(get_db)
+    user: schemas.UserCreate, db: AsyncSession = Depends(get_db)
 ):
-    authenticated_user = auth.authenticate_user(
+    authenticated_user = await auth.aauthenticate_user(
         db, user.username, user.password
     )
     if not authenticated_user:
@@ -40,56 +80,233 @@ async def login_for_access_token(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = auth.create_access_token(
-        data={"sub": authenticated_user.username},
+    refresh_token = await auth.acreate_refresh_token(
+        db, authenticated_user.id
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return token_response(authenticated_user.username, refresh_token)
 
 
-@app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = auth.get_user(db, username=user.username)
+# Trades a refresh token for new tokens without another bcrypt check;
+# the old refresh token stops working
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(
+    request: schemas.RefreshTokenRequest,
+    db: AsyncSession = Depends(get_db),
+):
+    rotated = await auth.arotate_refresh_token(db, request.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    username, refresh_token = rotated
+    return token_response(username, refresh_token)
+
+
+# Logs out: the refresh token and every token it was rotated into
+@router.post("/token/revoke", status_code=204)
+async def revoke_refresh_token(
+    request: schemas.RefreshTokenRequest,
+    db: AsyncSession = Depends(get_db),
+):
+    await auth.arevoke_refresh_token(db, request.refresh_token)
+    return Response(status_code=204)
+
+
+@router.post("/users/", response_model=schemas.User)
+async def create_user(
+    user: schemas.UserCreate, db: AsyncSession = Depends(get_db)
+):
+    db_user = await auth.aget_user(db, username=user.username)
     if db_user:
         raise HTTPException(
             status_code=400, detail="Username already registered"
         )
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await auth.aget_password_hash(user.password)
     db_user = models.User(
         username=user.username, hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
-@app.post("/notes/", response_model=schemas.Note)
-def create_note(
+@router.post("/notes/", response_model=schemas.Note)
+async def create_note(
     note: schemas.NoteCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    return await crud.acreate_note(db=db, note=note, user_id=current_user.id)
+
+
+@router.post("/notes/batch", response_model=list[schemas.NoteBatchResult])
+async def create_notes(
+    batch: schemas.NoteBatchCreate,
+    db: AsyncSession = Depends(get_db),
     current_user: schemas.User = Depends(auth.get_current_user),
 ):
-    return crud.create_note(db=db, note=note, user_id=current_user.id)
+    return await crud.acreate_notes(
+        db, notes=batch.notes, user_id=current_user.id
+    )
 
 
-@app.get("/notes/", response_model=list[schemas.Note])
-def read_notes(
+@router.put("/notes/batch", response_model=list[schemas.NoteBatchResult])
+async def update_notes(
+    batch: schemas.NoteBatchUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    return await crud.aupdate_notes(
+        db, notes=batch.notes, user_id=current_user.id
+    )
+
+
+@router.delete("/notes/batch", response_model=list[schemas.NoteBatchResult])
+async def delete_notes(
+    batch: schemas.NoteBatchDelete,
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    return await crud.adelete_notes(
+        db, ids=batch.ids, user_id=current_user.id
+    )
+
+
+@router.get("/notes/", response_model=list[schemas.Note])
+async def read_notes(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: str | None = None,
+    fields: str | None = None,
+    view: Literal["full", "summary"] = "full",
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    # fields=title returns only those columns (and always the id);
+    # view=summary returns schemas.NoteSummary rows. Both select only the
+    # columns they return, so unrequested note bodies are never read.
+    columns = None
+    if view == "summary":
+        if fields:
+            raise HTTPException(
+                status_code=400,
+                detail="fields cannot be combined with view=summary",
+            )
+        columns = crud.summary_columns()
+    elif fields:
+        try:
+            columns = crud.note_columns(
+                [name.strip() for name in fields.split(",") if name.strip()]
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    after_id = None
+    if cursor:
+        try:
+            owner_id, after_id = pagination.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if owner_id != current_user.id:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        skip = 0
+    # Read the version before the rows: a write landing in between then
+    # only costs the client an extra full response, never a stale 304
+    version = await crud.aget_notes_version(db, user_id=current_user.id)
+    projection = [column.key for column in columns or ()]
+    etag = make_etag(
+        current_user.id, version, "list", skip, limit, after_id, projection
+    )
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    if FAST_JSON_RESPONSES or columns is not None:
+        notes = await crud.aget_note_rows(
+            db,
+            user_id=current_user.id,
+            skip=skip,
+            limit=limit,
+            after_id=after_id,
+            columns=columns or crud.NOTE_COLUMNS,
+        )
+        last_id = notes[-1]["id"] if notes else None
+        # Headers set on the injected response are not copied onto a
+        # response returned directly
+        response = result = ORJSONResponse(notes)
+    else:
+        notes = result = await crud.aget_notes(
+            db,
+            user_id=current_user.id,
+            skip=skip,
+            limit=limit,
+            after_id=after_id,
+        )
+        last_id = notes[-1].id if notes else None
+    if notes and len(notes) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(
+            current_user.id, last_id
+        )
+    set_etag(response, etag)
+    return result
+
+
+@router.get("/notes/changes", response_model=schemas.NoteChanges)
+async def read_note_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
     current_user: schemas.User = Depends(auth.get_current_user),
 ):
-    return crud.get_notes(db, user_id=current_user.id, skip=skip, limit=limit)
+    return await crud.aget_changes(
+        db, user_id=current_user.id, since=since, limit=limit
+    )
 
 
-@app.put("/notes/{note_id}", response_model=schemas.Note)
-def update_note(
+@router.get("/notes/search", response_model=list[schemas.NoteSearchResult])
+async def search_notes(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    return await crud.asearch_notes(
+        db, user_id=current_user.id, query=q, limit=limit
+    )
+
+
+@router.get("/notes/{note_id}", response_model=schemas.Note)
+async def read_note(
+    note_id: int,
+    response: Response,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    # Looked up first: "If-None-Match: *" only matches a note that exists
+    db_note = await crud.aget_note(
+        db, note_id=note_id, user_id=current_user.id
+    )
+    if db_note is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    version = await crud.aget_notes_version(db, user_id=current_user.id)
+    etag = make_etag(current_user.id, version, "note", note_id)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    return db_note
+
+
+@router.put("/notes/{note_id}", response_model=schemas.Note)
+async def update_note(
     note_id: int,
     note: schemas.NoteCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: schemas.User = Depends(auth.get_current_user),
 ):
-    db_note = crud.update_note(
+    db_note = await crud.aupdate_note(
         db, note_id=note_id, note=note, user_id=current_user.id
     )
     if db_note is None:
@@ -97,33 +314,134 @@ def update_note(
     return db_note
 
 
-@app.delete("/notes/{note_id}", response_model=schemas.Note)
-def delete_note(
+@router.delete("/notes/{note_id}", response_model=schemas.Note)
+async def delete_note(
     note_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: schemas.User = Depends(auth.get_current_user),
 ):
-    db_note = crud.delete_note(db, note_id=note_id, user_id=current_user.id)
+    db_note = await crud.adelete_note(
+        db, note_id=note_id, user_id=current_user.id
+    )
     if db_note is None:
         raise HTTPException(status_code=404, detail="Note not found")
     return db_note
 
 
-@app.post("/translate/")
-def translate_text(
+@router.post("/translate/")
+async def translate_text(
     request: schemas.TranslationRequest,
     current_user: schemas.User = Depends(auth.get_current_user),
 ):
+    from . import services
+
     try:
-        translated_text = services.translate_text(request.text)
+        translated_text = await services.translate_text(request.text)
         return {"translated_text": translated_text}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@app.get("/users/me", response_model=schemas.User)
+@router.post(
+    "/translate/batch", response_model=schemas.TranslationBatchResponse
+)
+async def translate_batch(
+    request: schemas.TranslationBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    from . import services
+
+    texts = request.texts
+    if texts is None:
+        notes = await crud.aget_notes_by_ids(
+            db, ids=request.note_ids, user_id=current_user.id
+        )
+        contents = {note.id: note.content for note in notes}
+        if len(contents) != len(set(request.note_ids)):
+            raise HTTPException(status_code=404, detail="Note not found")
+        texts = [contents[note_id] for note_id in request.note_ids]
+    try:
+        translated_texts = await services.translate_texts(texts)
+        return {"translated_texts": translated_texts}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/translate/jobs", response_model=schemas.TranslationJob,
+             status_code=202)
+async def create_translation_job(
+    request: schemas.TranslationRequest,
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    from . import services
+    from .jobs import JobQueueFull
+
+    try:
+        job = services.translation_jobs.submit(
+            current_user.id, services.translate_text, request.text
+        )
+    except JobQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many translation jobs, try again later",
+            headers={"Retry-After": "1"},
+        )
+    return job
+
+
+@router.get("/translate/jobs/{job_id}", response_model=schemas.TranslationJob)
+async def read_translation_job(
+    job_id: str,
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    from . import services
+
+    job = services.translation_jobs.get(job_id)
+    if job is None or job.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/users/me", response_model=schemas.User)
 async def read_current_user(
     current_user: schemas.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db),
 ):
     return current_user
+
+
+# Prometheus text format. Not authenticated, like most scrape targets;
+# keep it off the public network or set METRICS_ENABLED=false.
+async def read_metrics():
+    return Response(
+        metrics.registry.render(), media_type=metrics.CONTENT_TYPE
+    )
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    # Innermost, so preflight requests are answered by CORS first and
+    # 429 responses still carry CORS headers
+    app.add_middleware(
+        ratelimit.RateLimitMiddleware, limiter=ratelimit.limiter
+    )
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag"],
+    )
+    app.add_middleware(CompressionMiddleware)
+    if metrics.METRICS_ENABLED:
+        app.add_api_route("/metrics", read_metrics, include_in_schema=False)
+        # Outermost, so the timings include compression and CORS handling
+        app.add_middleware(
+            metrics.MetricsMiddleware, routes=app.router.routes
+        )
+    return app
+
+
+app = create_app()
@@ -0,0 +1,318 @@
+import bisect
+import math
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv(
+    "METRICS_ENABLED", "true"
+).lower() not in ("0", "false", "no")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds. Requests mostly take a few milliseconds, single statements and
+# pool checkouts far less.
+REQUEST_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0,
+)
+DB_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.5, 1.0,
+)
+# Rate limiter decisions are meant to take microseconds
+RATE_LIMIT_BUCKETS = (
+    0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+    0.01,
+)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, bool) or (
+        isinstance(value, float) and value.is_integer()
+    ):
+        return str(int(value))
+    return str(value)
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _snapshot(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {self.type}"]
+        for labels, value in self._snapshot():
+            lines.append(
+                f"{self.name}{_format_labels(self.labels, labels)} "
+                f"{_format_value(value)}"
+            )
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, labels=(), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        return self._values.get(labels, 0)
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, labels=(), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(
+            time.perf_counter() - self.start, self.labels
+        )
+
+
+# Bucket counts are kept per bucket and only made cumulative when
+# rendered, so an observation is one bisect and two additions.
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(),
+                 buckets=REQUEST_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0
+                ]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, labels=()) -> _Timer:
+        return _Timer(self, labels)
+
+    def count(self, labels=()) -> int:
+        state = self._values.get(labels)
+        return sum(state[0]) if state else 0
+
+    def _snapshot(self):
+        with self._lock:
+            return sorted(
+                (labels, (list(counts), total))
+                for labels, (counts, total) in self._values.items()
+            )
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {self.type}"]
+        names = self.labels + ("le",)
+        for labels, (counts, total) in self._snapshot():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                bucket_labels = labels + (_format_value(bound),)
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(names, bucket_labels)} {cumulative}"
+                )
+            label_text = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels=()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels=(),
+                  buckets=REQUEST_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def register_collector(self, prefix: str, help: str, stats):
+        # stats() returns a flat dict such as TTLCache.stats(); each
+        # numeric entry is exported as the gauge <prefix>_<key>
+        self._collectors.append((prefix, help, stats))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, help, stats in self._collectors:
+            for key, value in stats().items():
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {help}: {key}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests handled",
+    ("method", "route", "status"),
+)
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests",
+    ("method", "route"),
+)
+REQUESTS_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight", "HTTP requests being handled",
+    ("method", "route"),
+)
+DB_STATEMENT_DURATION = registry.histogram(
+    "db_statement_duration_seconds", "Time spent executing SQL statements",
+    ("operation",), buckets=DB_BUCKETS,
+)
+DB_POOL_CHECKOUT = registry.histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting for a pooled database connection",
+    buckets=DB_BUCKETS,
+)
+PASSWORD_HASH_DURATION = registry.histogram(
+    "password_hash_duration_seconds", "Time spent in bcrypt",
+    ("operation",),
+)
+TRANSLATION_UPSTREAM_DURATION = registry.histogram(
+    "translation_upstream_duration_seconds",
+    "Time spent waiting for the translation backend",
+    ("backend", "outcome"),
+)
+
+RATE_LIMIT_DECISION_DURATION = registry.histogram(
+    "rate_limit_decision_duration_seconds",
+    "Time spent deciding whether to admit a request",
+    ("route_class",), buckets=RATE_LIMIT_BUCKETS,
+)
+RATE_LIMITED = registry.counter(
+    "rate_limited_requests_total", "Requests turned away with 429",
+    ("route_class",),
+)
+
+
+def _statement_operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else ""
+
+
+def instrument_engine(engine):
+    # Timed per cursor execution, so a batched executemany counts once
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_statement_timer(conn, cursor, statement, parameters,
+                               context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _observe_statement(conn, cursor, statement, parameters, context,
+                           executemany):
+        DB_STATEMENT_DURATION.observe(
+            time.perf_counter() - context._metrics_start,
+            (_statement_operation(statement),),
+        )
+
+
+# Pure ASGI like CompressionMiddleware. Requests are labelled with the
+# route template rather than the raw path, which keeps one series per
+# endpoint instead of one per note id.
+class MetricsMiddleware:
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    def route_path(self, path: str) -> str:
+        for route in self.routes:
+            path_regex = getattr(route, "path_regex", None)
+            if path_regex is not None and path_regex.match(path):
+                return route.path
+        return UNMATCHED_ROUTE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        labels = (scope["method"], self.route_path(scope["path"]))
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(labels)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_DURATION.observe(time.perf_counter() - start, labels)
+            REQUESTS_IN_FLIGHT.dec(labels)
+            REQUESTS.inc(labels + (str(status),))
@@ -0,0 +1,381 @@
+from typing import Callable, NamedTuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    # SQL, or a callable taking the connection for steps that have to
+    # look at the schema first
+    statements: list[str | Callable[[Connection], None]]
+
+
+def add_column(table: str, column: str, definition: str):
+    # ADD COLUMN has no IF NOT EXISTS in SQLite, and pysqlite commits DDL
+    # as it runs, so a migration stopped half-way can leave some of its
+    # columns behind; only add the ones that are missing
+    def apply(conn: Connection):
+        columns = {c["name"] for c in inspect(conn).get_columns(table)}
+        if column not in columns:
+            conn.execute(
+                text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            )
+
+    return apply
+
+
+# Number existing notes per owner on top of the owner's current version,
+# so every change of a user has its own version, then move the version
+# past them.
+BACKFILL_CHANGE_VERSIONS = [
+    """
+    UPDATE notes SET change_version = ranked.position + COALESCE((
+        SELECT version FROM note_versions
+        WHERE note_versions.owner_id = notes.owner_id
+    ), 0)
+    FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY owner_id ORDER BY id
+        ) AS position
+        FROM notes WHERE owner_id IS NOT NULL
+    ) AS ranked
+    WHERE notes.id = ranked.id
+    """,
+    """
+    INSERT INTO note_versions (owner_id, version)
+    SELECT owner_id, COUNT(*) FROM notes WHERE owner_id IS NOT NULL
+    GROUP BY owner_id
+    ON CONFLICT (owner_id) DO UPDATE
+    SET version = note_versions.version + excluded.version
+    """,
+]
+
+# Versions 7, 10 and 13 were PostgreSQL variants of 6, 9 and 12; they
+# are gone, and databases that recorded them are unaffected.
+#
+# Statements are written to be safe to re-run so that a database created
+# by the old ``create_all`` bootstrap, or a migration interrupted
+# half-way, can be brought up to date in place.
+MIGRATIONS = [
+    Migration(
+        1,
+        "baseline users and notes tables",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER NOT NULL,
+                username VARCHAR,
+                hashed_password VARCHAR,
+                PRIMARY KEY (id)
+            )
+            """,
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username "
+            "ON users (username)",
+            "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+            """
+            CREATE TABLE IF NOT EXISTS notes (
+                id INTEGER NOT NULL,
+                title VARCHAR,
+                content TEXT,
+                owner_id INTEGER,
+                PRIMARY KEY (id),
+                FOREIGN KEY(owner_id) REFERENCES users (id)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_notes_title ON notes (title)",
+            "CREATE INDEX IF NOT EXISTS ix_notes_id ON notes (id)",
+        ],
+    ),
+    Migration(
+        2,
+        "owner-scoped notes index",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_notes_owner_id_id "
+            "ON notes (owner_id, id)",
+            "DROP INDEX IF EXISTS ix_notes_title",
+        ],
+    ),
+    Migration(
+        3,
+        "full-text search index over notes",
+        [
+            # The owner is indexed as a "u<id>" token so that owner scoping
+            # is a posting-list intersection inside FTS5 rather than a
+            # post-filter over every matching note in the table.
+            """
+            CREATE VIEW IF NOT EXISTS notes_fts_source AS
+            SELECT id, title, content, 'u' || owner_id AS owner FROM notes
+            """,
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                title, content, owner,
+                content='notes_fts_source', content_rowid='id'
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS notes_fts_insert
+            AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_fts (rowid, title, content, owner)
+                VALUES (new.id, new.title, new.content, 'u' || new.owner_id);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS notes_fts_delete
+            AFTER DELETE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, title, content, owner)
+                VALUES (
+                    'delete', old.id, old.title, old.content,
+                    'u' || old.owner_id
+                );
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS notes_fts_update
+            AFTER UPDATE OF title, content, owner_id ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, title, content, owner)
+                VALUES (
+                    'delete', old.id, old.title, old.content,
+                    'u' || old.owner_id
+                );
+                INSERT INTO notes_fts (rowid, title, content, owner)
+                VALUES (new.id, new.title, new.content, 'u' || new.owner_id);
+            END
+            """,
+            "INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')",
+        ],
+    ),
+    Migration(
+        4,
+        "persistent translation cache",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS translation_cache (
+                cache_key VARCHAR NOT NULL,
+                source VARCHAR NOT NULL,
+                target VARCHAR NOT NULL,
+                translated_text TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (cache_key)
+            )
+            """,
+        ],
+    ),
+    Migration(
+        5,
+        "per-user notes version",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS note_versions (
+                owner_id INTEGER NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (owner_id),
+                FOREIGN KEY(owner_id) REFERENCES users (id)
+            )
+            """,
+        ],
+    ),
+    Migration(
+        6,
+        "notes version triggers",
+        [
+            """
+            CREATE TRIGGER IF NOT EXISTS notes_version_insert
+            AFTER INSERT ON notes BEGIN
+                INSERT INTO note_versions (owner_id, version)
+                SELECT new.owner_id, 1 WHERE new.owner_id IS NOT NULL
+                ON CONFLICT (owner_id) DO UPDATE
+                SET version = note_versions.version + 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS notes_version_delete
+            AFTER DELETE ON notes BEGIN
+                INSERT INTO note_versions (owner_id, version)
+                SELECT old.owner_id, 1 WHERE old.owner_id IS NOT NULL
+                ON CONFLICT (owner_id) DO UPDATE
+                SET version = note_versions.version + 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS notes_version_update
+            AFTER UPDATE ON notes BEGIN
+                INSERT INTO note_versions (owner_id, version)
+                SELECT old.owner_id, 1 WHERE old.owner_id IS NOT NULL
+                ON CONFLICT (owner_id) DO UPDATE
+                SET version = note_versions.version + 1;
+                INSERT INTO note_versions (owner_id, version)
+                SELECT new.owner_id, 1
+                WHERE new.owner_id IS NOT old.owner_id
+                AND new.owner_id IS NOT NULL
+                ON CONFLICT (owner_id) DO UPDATE
+                SET version = note_versions.version + 1;
+            END
+            """,
+        ],
+    ),
+    Migration(
+        8,
+        "note timestamps, change versions and tombstones",
+        [
+            add_column("notes", "created_at", "TIMESTAMP"),
+            add_column("notes", "updated_at", "TIMESTAMP"),
+            add_column(
+                "notes", "change_version", "INTEGER NOT NULL DEFAULT 0"
+            ),
+            "CREATE INDEX IF NOT EXISTS ix_notes_owner_id_change_version "
+            "ON notes (owner_id, change_version)",
+            """
+            CREATE TABLE IF NOT EXISTS note_tombstones (
+                note_id INTEGER NOT NULL,
+                owner_id INTEGER NOT NULL,
+                deleted_at TIMESTAMP NOT NULL,
+                change_version INTEGER NOT NULL,
+                PRIMARY KEY (note_id),
+                FOREIGN KEY(owner_id) REFERENCES users (id)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS "
+            "ix_note_tombstones_owner_id_change_version "
+            "ON note_tombstones (owner_id, change_version)",
+        ],
+    ),
+    Migration(
+        9,
+        "stamp notes with their change version",
+        [
+            # Only content and ownership changes count, so that stamping
+            # change_version does not re-trigger the update trigger
+            "DROP TRIGGER IF EXISTS notes_version_insert",
+            "DROP TRIGGER IF EXISTS notes_version_update",
+            """
+            CREATE TRIGGER notes_version_insert
+            AFTER INSERT ON notes BEGIN
+                INSERT INTO note_versions (owner_id, version)
+                SELECT new.owner_id, 1 WHERE new.owner_id IS NOT NULL
+                ON CONFLICT (owner_id) DO UPDATE
+                SET version = note_versions.version + 1;
+                UPDATE notes SET change_version = (
+                    SELECT version FROM note_versions
+                    WHERE owner_id = new.owner_id
+                )
+                WHERE id = new.id AND new.owner_id IS NOT NULL;
+            END
+            """,
+            """
+            CREATE TRIGGER notes_version_update
+            AFTER UPDATE OF title, content, owner_id ON notes BEGIN
+                INSERT INTO note_versions (owner_id, version)
+                SELECT old.owner_id, 1 WHERE old.owner_id IS NOT NULL
+                ON CONFLICT (owner_id) DO UPDATE
+                SET version = note_versions.version + 1;
+                INSERT INTO note_versions (owner_id, version)
+                SELECT new.owner_id, 1
+                WHERE new.owner_id IS NOT old.owner_id
+                AND new.owner_id IS NOT NULL
+                ON CONFLICT (owner_id) DO UPDATE
+                SET version = note_versions.version + 1;
+                UPDATE notes SET change_version = (
+                    SELECT version FROM note_versions
+                    WHERE owner_id = new.owner_id
+                )
+                WHERE id = new.id AND new.owner_id IS NOT NULL;
+            END
+            """,
+        ] + BACKFILL_CHANGE_VERSIONS,
+    ),
+    Migration(
+        11,
+        "refresh tokens",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS refresh_tokens (
+                token_hash VARCHAR NOT NULL,
+                user_id INTEGER NOT NULL,
+                family VARCHAR NOT NULL,
+                created_at TIMESTAMP NOT NULL,
+                expires_at TIMESTAMP NOT NULL,
+                revoked_at TIMESTAMP,
+                PRIMARY KEY (token_hash),
+                FOREIGN KEY(user_id) REFERENCES users (id)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_id "
+            "ON refresh_tokens (user_id)",
+            "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_family "
+            "ON refresh_tokens (family)",
+        ],
+    ),
+    Migration(
+        12,
+        "key tombstones by owner and note",
+        [
+            # SQLite cannot change a primary key, so the table is rebuilt.
+            # A copy left over by an interrupted run is started again.
+            "DROP TABLE IF EXISTS note_tombstones_rekeyed",
+            """
+            CREATE TABLE note_tombstones_rekeyed (
+                owner_id INTEGER NOT NULL,
+                note_id INTEGER NOT NULL,
+                deleted_at TIMESTAMP NOT NULL,
+                change_version INTEGER NOT NULL,
+                PRIMARY KEY (owner_id, note_id),
+                FOREIGN KEY(owner_id) REFERENCES users (id)
+            )
+            """,
+            """
+            INSERT INTO note_tombstones_rekeyed
+            SELECT owner_id, note_id, deleted_at, change_version
+            FROM note_tombstones
+            """,
+            "DROP TABLE note_tombstones",
+            "ALTER TABLE note_tombstones_rekeyed RENAME TO note_tombstones",
+            "CREATE INDEX IF NOT EXISTS "
+            "ix_note_tombstones_owner_id_change_version "
+            "ON note_tombstones (owner_id, change_version)",
+        ],
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def _ensure_version_table(conn: Connection):
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER NOT NULL PRIMARY KEY)"
+        )
+    )
+
+
+def current_version(conn: Connection) -> int:
+    _ensure_version_table(conn)
+    version = conn.execute(
+        text("SELECT MAX(version) FROM schema_migrations")
+    ).scalar()
+    return version or 0
+
+
+def apply_migrations(conn: Connection, target: int = LATEST_VERSION) -> int:
+    version = current_version(conn)
+    for migration in MIGRATIONS:
+        if migration.version <= version or migration.version > target:
+            continue
+        for statement in migration.statements:
+            if callable(statement):
+                statement(conn)
+            else:
+                conn.execute(text(statement))
+        conn.execute(
+            text("INSERT INTO schema_migrations (version) VALUES (:v)"),
+            {"v": migration.version},
+        )
+        version = migration.version
+    return version
+
+
+def migrate(engine: Engine, target: int = LATEST_VERSION) -> int:
+    with engine.begin() as conn:
+        return apply_migrations(conn, target)
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from sqlalchemy import (
+    Column, DateTime, ForeignKey, Index, Integer, String, Text, func
+)
 from .database import Base
 
 
@@ -14,6 +16,77 @@ class Note(Base):
     __tablename__ = "notes"
 
     id = Column(Integer, primary_key=True, index=True)
-    title = Column(String, index=True)
+    title = Column(String)
     content = Column(Text)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    # Timestamps are set by crud; change_version is stamped by database
+    # triggers with the owner's NoteVersion at the time of the change.
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    change_version = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+
+    __table_args__ = (
+        Index("ix_notes_owner_id_id", "owner_id", "id"),
+        Index(
+            "ix_notes_owner_id_change_version", "owner_id", "change_version"
+        ),
+    )
+
+
+# Left behind by deleted notes so that incremental sync can report them
+class NoteTombstone(Base):
+    __tablename__ = "note_tombstones"
+
+    # Per owner, since SQLite can hand a deleted note's id to another user
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    note_id = Column(Integer, primary_key=True)
+    deleted_at = Column(DateTime, nullable=False)
+    change_version = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "ix_note_tombstones_owner_id_change_version",
+            "owner_id",
+            "change_version",
+        ),
+    )
+
+
+# Bumped by database triggers on every insert, update and delete of a
+# user's notes; cheap to read and used to validate cached note listings.
+class NoteVersion(Base):
+    __tablename__ = "note_versions"
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# Only a hash of the token is stored. Each refresh replaces the token
+# with a new one of the same family, so a replayed old token shows the
+# family was copied and gets it revoked.
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    token_hash = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    family = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_refresh_tokens_user_id", "user_id"),
+        Index("ix_refresh_tokens_family", "family"),
+    )
+
+
+class TranslationCacheEntry(Base):
+    __tablename__ = "translation_cache"
+
+    cache_key = Column(String, primary_key=True)
+    source = Column(String, nullable=False)
+    target = Column(String, nullable=False)
+    translated_text = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.current_timestamp())
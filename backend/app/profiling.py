@@ -0,0 +1,170 @@
+import contextlib
+import contextvars
+import logging
+import os
+import time
+from collections import Counter
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+QUERY_PROFILING_ENABLED = os.getenv(
+    "QUERY_PROFILING_ENABLED", "true"
+).lower() not in ("0", "false", "no")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+# A statement run this many times in one request is likely an N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", 3))
+
+EXPLAIN_PREFIXES = {
+    "sqlite": "EXPLAIN QUERY PLAN ",
+}
+
+_current_profile = contextvars.ContextVar("query_profile", default=None)
+# Profiles that see every statement on every thread, for tests
+_captures: list["QueryProfile"] = []
+
+
+class QueryProfile:
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD):
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def report(self, threshold: int = QUERY_REPEAT_THRESHOLD):
+        for statement, count in self.repeated(threshold):
+            logger.warning(
+                "Statement ran %d times in %s, possible N+1: %s",
+                count, self.name or "one request", statement,
+            )
+
+
+def current_profile() -> QueryProfile | None:
+    return _current_profile.get()
+
+
+@contextlib.contextmanager
+def profile_queries(name: str = ""):
+    profile = QueryProfile(name)
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+        profile.report()
+
+
+@contextlib.contextmanager
+def capture_queries():
+    profile = QueryProfile("capture")
+    _captures.append(profile)
+    try:
+        yield profile
+    finally:
+        _captures.remove(profile)
+
+
+@contextlib.contextmanager
+def assert_max_queries(limit: int):
+    # Statements are counted on every instrumented engine and thread, so
+    # this works around TestClient calls as well as direct crud calls
+    with capture_queries() as profile:
+        yield profile
+    if profile.count > limit:
+        statements = "\n".join(
+            f"  {count} x {statement}"
+            for statement, count in profile.statements.items()
+        )
+        raise AssertionError(
+            f"{profile.count} queries, expected at most {limit}:\n"
+            f"{statements}"
+        )
+
+
+def parameter_shape(parameters, executemany: bool = False) -> str:
+    # Types only; values may hold note contents or password hashes
+    if executemany:
+        rows = list(parameters)
+        first = parameter_shape(rows[0]) if rows else "()"
+        return f"{len(rows)} x {first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(
+            f"{key}: {type(value).__name__}"
+            for key, value in parameters.items()
+        ) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(
+            type(value).__name__ for value in parameters
+        ) + ")"
+    return type(parameters).__name__
+
+
+def explain(conn, statement: str, parameters) -> list | None:
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+    if prefix is None:
+        return None
+    # On the raw DBAPI connection so the plan query is neither profiled
+    # nor sent through these events again
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [tuple(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _log_slow_query(conn, statement, parameters, executemany, seconds):
+    plan = None
+    if not executemany and statement.lstrip()[:6].upper() in (
+        "SELECT", "UPDATE", "DELETE", "INSERT"
+    ):
+        try:
+            plan = explain(conn, statement, parameters)
+        except Exception:
+            logger.debug("Could not explain slow query", exc_info=True)
+    profile = _current_profile.get()
+    logger.warning(
+        "Slow query (%.1f ms) in %s: %s\nparameters: %s\nplan: %s",
+        seconds * 1000,
+        profile.name if profile is not None else "no request",
+        statement,
+        parameter_shape(parameters, executemany),
+        plan,
+    )
+
+
+def instrument_engine(engine, slow_query_ms: float | None = None):
+    threshold = (
+        SLOW_QUERY_MS if slow_query_ms is None else slow_query_ms
+    ) / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query_timer(conn, cursor, statement, parameters, context,
+                           executemany):
+        context._profiling_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _record_query(conn, cursor, statement, parameters, context,
+                      executemany):
+        seconds = time.perf_counter() - context._profiling_start
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.record(statement, seconds)
+        for capture in _captures:
+            capture.record(statement, seconds)
+        if seconds >= threshold:
+            _log_slow_query(conn, statement, parameters, executemany,
+                            seconds)
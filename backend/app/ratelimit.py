@@ -0,0 +1,346 @@
+import ipaddress
+import math
+import os
+import time
+from typing import NamedTuple
+
+from jose import JWTError, jwt
+from starlette.responses import JSONResponse
+
+from . import auth, metrics
+from .cache import TTLCache
+
+RATE_LIMIT_ENABLED = os.getenv(
+    "RATE_LIMIT_ENABLED", "true"
+).lower() not in ("0", "false", "no")
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+# Anonymous requests from one address, and requests of one signed-in user
+RATE_LIMIT_IP = os.getenv("RATE_LIMIT_IP", "600/minute")
+RATE_LIMIT_USER = os.getenv("RATE_LIMIT_USER", "300/minute")
+# Logins and sign-ups run bcrypt, per client and across all clients
+RATE_LIMIT_AUTH = os.getenv("RATE_LIMIT_AUTH", "10/minute")
+RATE_LIMIT_AUTH_GLOBAL = os.getenv("RATE_LIMIT_AUTH_GLOBAL", "")
+# Translations spend the upstream quota, per user and across all users
+RATE_LIMIT_TRANSLATE = os.getenv("RATE_LIMIT_TRANSLATE", "30/minute")
+RATE_LIMIT_TRANSLATE_GLOBAL = os.getenv("RATE_LIMIT_TRANSLATE_GLOBAL", "")
+# Addresses or networks of proxies whose X-Forwarded-For is believed;
+# without any, the address is always the peer of the connection
+RATE_LIMIT_TRUSTED_PROXIES = os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "")
+
+UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Checked before anything else; the rest of /translate is matched by prefix
+ROUTE_CLASSES = {
+    ("POST", "/token"): "auth",
+    ("POST", "/users/"): "auth",
+}
+DEFAULT_ROUTE_CLASS = "default"
+
+
+def route_class(method: str, path: str) -> str:
+    name = ROUTE_CLASSES.get((method, path))
+    if name is not None:
+        return name
+    if path.startswith("/translate"):
+        return "translate"
+    return DEFAULT_ROUTE_CLASS
+
+
+def parse_limit(spec: str) -> tuple[float, float] | None:
+    # "10/minute" allows bursts of 10 requests, refilled at 10 a minute.
+    # An empty spec or a count of 0 turns the limit off.
+    count, _, unit = spec.strip().partition("/")
+    if not count or float(count) <= 0:
+        return None
+    unit = unit.strip().lower().removesuffix("s") or "second"
+    if unit not in UNITS:
+        raise ValueError(f"Unknown rate limit unit in {spec!r}")
+    return float(count) / UNITS[unit], float(count)
+
+
+class Rule(NamedTuple):
+    name: str
+    # "ip" (anonymous requests, per address), "user" (signed-in requests,
+    # per token subject), "client" (the subject when there is one, the
+    # address otherwise) or "global"
+    scope: str
+    rate: float
+    burst: float
+    # None applies the rule to every route class
+    route_class: str | None = None
+
+
+def rules_from_env() -> list[Rule]:
+    specs = [
+        ("ip", "ip", RATE_LIMIT_IP, None),
+        ("user", "user", RATE_LIMIT_USER, None),
+        ("auth", "client", RATE_LIMIT_AUTH, "auth"),
+        ("auth_global", "global", RATE_LIMIT_AUTH_GLOBAL, "auth"),
+        ("translate", "user", RATE_LIMIT_TRANSLATE, "translate"),
+        (
+            "translate_global", "global", RATE_LIMIT_TRANSLATE_GLOBAL,
+            "translate",
+        ),
+    ]
+    rules = []
+    for name, scope, spec, cls in specs:
+        limit = parse_limit(spec)
+        if limit is not None:
+            rules.append(Rule(name, scope, *limit, cls))
+    return rules
+
+
+# A bucket is (key, rate per second, burst). Stores take one token from
+# every bucket of a request, or from none of them when any is empty, and
+# return 0 or the seconds until all of them would have a token again. A
+# store shared by several workers has to do that atomically.
+class RateLimitStore:
+    async def acquire(self, buckets: list[tuple[str, float, float]]) -> float:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+# Per process, so every worker enforces the limits on its own. Only
+# touched from the event loop, which keeps it free of locks.
+class MemoryStore(RateLimitStore):
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS,
+                 timer=time.monotonic):
+        self.max_keys = max_keys
+        self.timer = timer
+        self.admitted = 0
+        self.rejected = 0
+        self.evictions = 0
+        # key -> [tokens, updated_at, rate, burst]
+        self._buckets = {}
+
+    def take(self, buckets: list[tuple[str, float, float]]) -> float:
+        now = self.timer()
+        states = []
+        wait = 0.0
+        for key, rate, burst in buckets:
+            state = self._buckets.get(key)
+            if state is None:
+                state = [burst, now, rate, burst]
+                self._buckets[key] = state
+            else:
+                state[0] = min(burst, state[0] + (now - state[1]) * rate)
+                state[1] = now
+            if state[0] < 1:
+                wait = max(wait, (1 - state[0]) / rate)
+            states.append(state)
+        if wait:
+            self.rejected += 1
+            return wait
+        for state in states:
+            state[0] -= 1
+        self.admitted += 1
+        if len(self._buckets) > self.max_keys:
+            self._evict(now)
+        return 0.0
+
+    async def acquire(self, buckets: list[tuple[str, float, float]]) -> float:
+        return self.take(buckets)
+
+    def _evict(self, now: float):
+        # Full buckets behave exactly like missing ones. If a flood of
+        # new keys leaves too few of those, the oldest keys go as well.
+        self._buckets = {
+            key: state for key, state in self._buckets.items()
+            if state[0] + (now - state[1]) * state[2] < state[3]
+        }
+        excess = len(self._buckets) - self.max_keys * 9 // 10
+        if excess > 0:
+            for key in list(self._buckets)[:excess]:
+                del self._buckets[key]
+            self.evictions += excess
+
+    def clear(self):
+        self._buckets.clear()
+        self.admitted = self.rejected = self.evictions = 0
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._buckets),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "evictions": self.evictions,
+        }
+
+
+STORES = {"memory": MemoryStore}
+
+
+def register_store(name: str, factory):
+    STORES[name] = factory
+
+
+def create_store(name: str) -> RateLimitStore:
+    if name not in STORES:
+        raise ValueError(f"Unknown rate limit store: {name}")
+    return STORES[name]()
+
+
+class RateLimiter:
+    def __init__(self, rules: list[Rule], store: RateLimitStore,
+                 enabled: bool = True):
+        self.rules = rules
+        self.store = store
+        self.enabled = enabled
+        self._rules_by_class = {}
+
+    def rules_for(self, route_class: str) -> list[Rule]:
+        rules = self._rules_by_class.get(route_class)
+        if rules is None:
+            rules = [
+                rule for rule in self.rules
+                if rule.route_class in (None, route_class)
+            ]
+            self._rules_by_class[route_class] = rules
+        return rules
+
+    def buckets(self, route_class: str, ip: str, user: str | None):
+        buckets = []
+        for rule in self.rules_for(route_class):
+            if rule.scope == "global":
+                key = rule.name
+            elif user is not None and rule.scope != "ip":
+                key = f"{rule.name}:user:{user}"
+            elif user is None and rule.scope != "user":
+                key = f"{rule.name}:ip:{ip}"
+            else:
+                # Signed-in users behind one address, such as everyone
+                # using the web frontend, are not counted together, and
+                # anonymous requests are left to the per-address rules
+                continue
+            buckets.append((key, rule.rate, rule.burst))
+        return buckets
+
+    async def acquire(self, route_class: str, ip: str,
+                      user: str | None) -> float:
+        return await self.store.acquire(
+            self.buckets(route_class, ip, user)
+        )
+
+
+# Access token -> (subject, expiry), so the signature of a token is
+# checked once rather than on every request it comes with
+_subjects = TTLCache(maxsize=RATE_LIMIT_MAX_KEYS, ttl=60)
+
+
+def token_subject(token: str | None) -> str | None:
+    if not token:
+        return None
+    entry = _subjects.get(token)
+    if entry is None:
+        try:
+            payload = jwt.decode(
+                token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]
+            )
+        except JWTError:
+            # Not cached, so random tokens cannot push out valid ones
+            return None
+        entry = (payload.get("sub"), payload.get("exp", math.inf))
+        _subjects.set(token, entry)
+    subject, expires_at = entry
+    return subject if expires_at > time.time() else None
+
+
+def bearer_token(scope) -> str | None:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                return token.strip()
+            return None
+    return None
+
+
+def parse_networks(spec: str) -> tuple:
+    return tuple(
+        ipaddress.ip_network(part.strip(), strict=False)
+        for part in spec.split(",") if part.strip()
+    )
+
+
+TRUSTED_PROXIES = parse_networks(RATE_LIMIT_TRUSTED_PROXIES)
+
+
+def _is_trusted(address: str, trusted: tuple) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def client_address(scope, trusted: tuple = ()) -> str:
+    client = scope.get("client")
+    address = client[0] if client else ""
+    if not trusted or not _is_trusted(address, trusted):
+        return address
+    hops = []
+    for name, value in scope["headers"]:
+        if name == b"x-forwarded-for":
+            hops.extend(value.decode("latin-1").split(","))
+    # Each proxy appends the address it got the request from, so walking
+    # back from the end, the first hop that is not a trusted proxy is the
+    # client; anything before it could have been made up by the client
+    for hop in reversed(hops):
+        hop = hop.strip()
+        if not hop:
+            continue
+        address = hop
+        if not _is_trusted(hop, trusted):
+            break
+    return address
+
+
+def too_many_requests(retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Too many requests"},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+# Pure ASGI like MetricsMiddleware. Runs ahead of routing, so requests over
+# the limit are turned away before any database, bcrypt or upstream work.
+class RateLimitMiddleware:
+    def __init__(self, app, limiter: RateLimiter,
+                 trusted_proxies: tuple = TRUSTED_PROXIES):
+        self.app = app
+        self.limiter = limiter
+        self.trusted_proxies = trusted_proxies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        cls = route_class(scope["method"], scope["path"])
+        retry_after = await self.limiter.acquire(
+            cls,
+            client_address(scope, self.trusted_proxies),
+            token_subject(bearer_token(scope)),
+        )
+        metrics.RATE_LIMIT_DECISION_DURATION.observe(
+            time.perf_counter() - start, (cls,)
+        )
+        if retry_after:
+            metrics.RATE_LIMITED.inc((cls,))
+            await too_many_requests(retry_after)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+limiter = RateLimiter(
+    rules_from_env(), create_store(RATE_LIMIT_STORE),
+    enabled=RATE_LIMIT_ENABLED,
+)
+
+metrics.registry.register_collector(
+    "rate_limit", "Rate limiter", lambda: limiter.store.stats()
+)
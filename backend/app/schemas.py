@@ -1,9 +1,21 @@
-from pydantic import BaseModel
+from datetime import datetime
+
+from pydantic import BaseModel, Field, conlist, root_validator
+
+MAX_BATCH_SIZE = 1000
+MAX_TRANSLATION_BATCH_SIZE = 500
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    # Seconds until the access token expires
+    expires_in: int | None = None
+    refresh_token: str | None = None
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
@@ -37,10 +49,90 @@ class NoteCreate(NoteBase):
 class Note(NoteBase):
     id: int
     owner_id: int
+    # Unset on notes written before timestamps were recorded
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
 
     class Config:
         orm_mode = True
 
 
+class NoteSummary(BaseModel):
+    id: int
+    title: str
+    excerpt: str
+
+
+class NoteBatchUpdateItem(NoteBase):
+    id: int
+
+
+class NoteBatchCreate(BaseModel):
+    notes: conlist(NoteCreate, min_items=1, max_items=MAX_BATCH_SIZE)
+
+
+class NoteBatchUpdate(BaseModel):
+    notes: conlist(NoteBatchUpdateItem, min_items=1, max_items=MAX_BATCH_SIZE)
+
+
+class NoteBatchDelete(BaseModel):
+    ids: conlist(int, min_items=1, max_items=MAX_BATCH_SIZE)
+
+
+class NoteBatchResult(BaseModel):
+    id: int
+    status: str
+    note: Note | None = None
+
+
+class NoteSearchResult(BaseModel):
+    id: int
+    title: str = Field(
+        description="HTML-escaped title, matches wrapped in <mark> tags"
+    )
+    snippet: str = Field(
+        description="HTML-escaped excerpt, matches wrapped in <mark> tags"
+    )
+    rank: float
+
+
 class TranslationRequest(BaseModel):
     text: str
+
+
+class TranslationBatchRequest(BaseModel):
+    texts: conlist(str, min_items=1,
+                   max_items=MAX_TRANSLATION_BATCH_SIZE) | None = None
+    note_ids: conlist(int, min_items=1,
+                      max_items=MAX_TRANSLATION_BATCH_SIZE) | None = None
+
+    @root_validator(skip_on_failure=True)
+    def check_one_source(cls, values):
+        if (values.get("texts") is None) == (values.get("note_ids") is None):
+            raise ValueError("Provide either texts or note_ids")
+        return values
+
+
+class TranslationBatchResponse(BaseModel):
+    translated_texts: list[str]
+
+
+class TranslationJob(BaseModel):
+    id: str
+    status: str
+    result: str | None = None
+    error: str | None = None
+    created_at: datetime
+    finished_at: datetime | None = None
+
+    class Config:
+        orm_mode = True
+
+
+class NoteChanges(BaseModel):
+    # Pass ``token`` back as ``since`` to get the next changes; keep going
+    # while ``has_more`` is set
+    token: int
+    has_more: bool
+    upserts: list[Note]
+    deletes: list[int]
@@ -1,25 +1,216 @@
+import asyncio
 import os
-import requests
-from dotenv import load_dotenv
+import time
 
-load_dotenv()
+import httpx
 
+from . import metrics
+from .database import async_engine
+from .jobs import JobQueue
+from .translation_backends import (
+    TranslationBackend, create_backend, register_backend
+)
+from .translation_cache import TranslationCache
 
-def translate_text(text: str, source: str = "en", target: str = "ru"):
-    try:
-        url = "https://deep-translate1.p.rapidapi.com/language/translate/v2"
+TRANSLATE_API_URL = os.getenv(
+    "TRANSLATE_API_URL",
+    "https://deep-translate1.p.rapidapi.com/language/translate/v2",
+)
+# One backend name, or several separated by commas to fall back in order
+TRANSLATE_BACKEND = os.getenv("TRANSLATE_BACKEND", "rapidapi")
+TRANSLATE_FALLBACK_TIMEOUT = (
+    float(os.getenv("TRANSLATE_FALLBACK_TIMEOUT"))
+    if os.getenv("TRANSLATE_FALLBACK_TIMEOUT") else None
+)
+TRANSLATE_MAX_CONNECTIONS = int(os.getenv("TRANSLATE_MAX_CONNECTIONS", 20))
+TRANSLATE_MAX_KEEPALIVE = int(os.getenv("TRANSLATE_MAX_KEEPALIVE", 10))
+TRANSLATE_CONNECT_TIMEOUT = float(os.getenv("TRANSLATE_CONNECT_TIMEOUT", 3))
+TRANSLATE_READ_TIMEOUT = float(os.getenv("TRANSLATE_READ_TIMEOUT", 10))
+# Upper bounds for one upstream request of a batch translation, and how
+# many of those requests a single batch may have in flight at once
+TRANSLATE_BATCH_MAX_TEXTS = int(os.getenv("TRANSLATE_BATCH_MAX_TEXTS", 50))
+TRANSLATE_BATCH_MAX_CHARS = int(os.getenv("TRANSLATE_BATCH_MAX_CHARS", 5000))
+TRANSLATE_BATCH_CONCURRENCY = int(
+    os.getenv("TRANSLATE_BATCH_CONCURRENCY", 4)
+)
+TRANSLATE_JOB_WORKERS = int(os.getenv("TRANSLATE_JOB_WORKERS", 4))
+TRANSLATE_JOB_MAX_QUEUE = int(os.getenv("TRANSLATE_JOB_MAX_QUEUE", 100))
+TRANSLATE_JOB_RESULT_TTL = float(os.getenv("TRANSLATE_JOB_RESULT_TTL", 600))
+TRANSLATION_CACHE_ENABLED = os.getenv(
+    "TRANSLATION_CACHE_ENABLED", "true"
+).lower() not in ("0", "false", "no")
+
+translation_cache = TranslationCache(
+    async_engine,
+    max_entries=int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", 10000)),
+    max_bytes=int(
+        os.getenv("TRANSLATION_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+    ),
+)
+
+translation_jobs = JobQueue(
+    workers=TRANSLATE_JOB_WORKERS,
+    max_queue=TRANSLATE_JOB_MAX_QUEUE,
+    result_ttl=TRANSLATE_JOB_RESULT_TTL,
+)
+
+metrics.registry.register_collector(
+    "translation_cache", "Translation cache", translation_cache.stats
+)
+metrics.registry.register_collector(
+    "translation_jobs", "Background translation jobs",
+    translation_jobs.stats,
+)
+
+# Shared across requests so connections to the upstream (and their TLS
+# sessions) are kept alive and reused. Opened and closed by the app
+# lifespan; created lazily for callers running outside of it.
+_http_client: httpx.AsyncClient | None = None
+
+
+def create_http_client(**kwargs) -> httpx.AsyncClient:
+    options = {
+        "limits": httpx.Limits(
+            max_connections=TRANSLATE_MAX_CONNECTIONS,
+            max_keepalive_connections=TRANSLATE_MAX_KEEPALIVE,
+        ),
+        "timeout": httpx.Timeout(
+            TRANSLATE_READ_TIMEOUT, connect=TRANSLATE_CONNECT_TIMEOUT
+        ),
+        "headers": {
+            "x-rapidapi-key": os.getenv("DEEP_TRANSLATE_API_KEY") or "",
+            "x-rapidapi-host": "deep-translate1.p.rapidapi.com",
+        },
+    }
+    options.update(kwargs)
+    return httpx.AsyncClient(**options)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+    return _http_client
+
+
+async def startup():
+    get_http_client()
+    translation_jobs.start()
+
+
+async def shutdown():
+    global _http_client
+    await translation_jobs.stop()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class RapidAPIBackend(TranslationBackend):
+    name = "rapidapi"
+
+    async def translate(self, texts: list[str], source: str,
+                        target: str) -> list[str]:
         payload = {
-            "q": text,
+            "q": texts[0] if len(texts) == 1 else texts,
             "source": source,
             "target": target
         }
-        headers = {
-            "x-rapidapi-key": os.getenv("DEEP_TRANSLATE_API_KEY"),
-            "x-rapidapi-host": "deep-translate1.p.rapidapi.com",
-            "Content-Type": "application/json"
-        }
-        response = requests.post(url,
-                                 json=payload, headers=headers, timeout=10)
-        return response.json()["data"]["translations"]["translatedText"][0]
+        response = await get_http_client().post(
+            TRANSLATE_API_URL, json=payload
+        )
+        response.raise_for_status()
+        translated = response.json()["data"]["translations"]["translatedText"]
+        if len(translated) != len(texts):
+            raise ValueError(
+                f"expected {len(texts)} translations, got {len(translated)}"
+            )
+        return translated
+
+
+register_backend("rapidapi", RapidAPIBackend)
+
+translation_backend = create_backend(
+    TRANSLATE_BACKEND, fallback_timeout=TRANSLATE_FALLBACK_TIMEOUT
+)
+
+
+async def _request_translations(texts: list[str], source: str, target: str):
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        translated = await translation_backend.translate(
+            texts, source, target
+        )
+        outcome = "ok"
+        return translated
     except Exception as e:
         raise Exception(f"Translation failed: {str(e)}")
+    finally:
+        metrics.TRANSLATION_UPSTREAM_DURATION.observe(
+            time.perf_counter() - start,
+            (translation_backend.name, outcome),
+        )
+
+
+async def _request_translation(text: str, source: str, target: str):
+    return (await _request_translations([text], source, target))[0]
+
+
+def chunk_texts(texts: list[str], max_texts: int, max_chars: int):
+    # Greedy packing in input order; a text longer than max_chars is sent
+    # on its own rather than split
+    chunks, chunk, chars = [], [], 0
+    for text in texts:
+        if chunk and (len(chunk) == max_texts
+                      or chars + len(text) > max_chars):
+            chunks.append(chunk)
+            chunk, chars = [], 0
+        chunk.append(text)
+        chars += len(text)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+async def translate_text(text: str, source: str = "en", target: str = "ru"):
+    if not TRANSLATION_CACHE_ENABLED:
+        return await _request_translation(text, source, target)
+    translated = await translation_cache.get(text, source, target)
+    if translated is None:
+        translated = await _request_translation(text, source, target)
+        await translation_cache.set(text, source, target, translated)
+    return translated
+
+
+async def translate_texts(
+    texts: list[str], source: str = "en", target: str = "ru"
+):
+    if TRANSLATION_CACHE_ENABLED:
+        translated = await translation_cache.get_many(texts, source, target)
+    else:
+        translated = {}
+    pending = [text for text in dict.fromkeys(texts) if text not in translated]
+    semaphore = asyncio.Semaphore(TRANSLATE_BATCH_CONCURRENCY)
+
+    async def translate_chunk(chunk):
+        async with semaphore:
+            return await _request_translations(chunk, source, target)
+
+    chunks = chunk_texts(
+        pending, TRANSLATE_BATCH_MAX_TEXTS, TRANSLATE_BATCH_MAX_CHARS
+    )
+    # The first failure cancels the other chunks rather than leaving them
+    # to spend quota on a request that has already failed
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(translate_chunk(c)) for c in chunks]
+    except ExceptionGroup as e:
+        raise e.exceptions[0] from None
+    fresh = {}
+    for chunk, task in zip(chunks, tasks):
+        fresh.update(zip(chunk, task.result()))
+    if TRANSLATION_CACHE_ENABLED:
+        await translation_cache.set_many(fresh, source, target)
+    translated.update(fresh)
+    return [translated[text] for text in texts]
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+TRANSLATE_LOCAL_LATENCY = float(os.getenv("TRANSLATE_LOCAL_LATENCY", 0))
+TRANSLATE_LOCAL_DICTIONARY = os.getenv("TRANSLATE_LOCAL_DICTIONARY")
+
+# Enough to make local translations recognisable in the UI and in tests
+DEFAULT_DICTIONARY = {
+    ("en", "ru"): {
+        "hello": "привет",
+        "world": "мир",
+        "note": "заметка",
+        "notes": "заметки",
+        "my": "мой",
+        "and": "и",
+        "good": "хороший",
+        "morning": "утро",
+        "thank": "спасибо",
+        "you": "ты",
+    },
+}
+
+WORD_RE = re.compile(r"\w+")
+
+
+class TranslationBackend:
+    name = "base"
+
+    async def translate(self, texts: list[str], source: str,
+                        target: str) -> list[str]:
+        raise NotImplementedError
+
+
+# Offline, deterministic stand-in for a real engine: replaces the words it
+# knows and keeps the rest, after sleeping ``latency`` seconds per call
+# to mimic an upstream round trip.
+class LocalBackend(TranslationBackend):
+    name = "local"
+
+    def __init__(self, latency: float = 0.0,
+                 dictionary: dict | None = None):
+        self.latency = latency
+        self.dictionary = (
+            DEFAULT_DICTIONARY if dictionary is None else dictionary
+        )
+        self.calls = 0
+
+    def _translate_word(self, words: dict, match) -> str:
+        word = match.group()
+        translated = words.get(word.lower())
+        if translated is None:
+            return word
+        if word[:1].isupper():
+            return translated[:1].upper() + translated[1:]
+        return translated
+
+    def translate_one(self, text: str, source: str, target: str) -> str:
+        words = self.dictionary.get((source, target), {})
+        return WORD_RE.sub(
+            lambda match: self._translate_word(words, match), text
+        )
+
+    async def translate(self, texts: list[str], source: str,
+                        target: str) -> list[str]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self.translate_one(text, source, target) for text in texts]
+
+
+# Tries each backend in order and returns the first answer. A backend that
+# raises, or takes longer than ``timeout`` seconds, hands over to the next.
+class FallbackBackend(TranslationBackend):
+    name = "fallback"
+
+    def __init__(self, backends: list[TranslationBackend],
+                 timeout: float | None = None):
+        self.backends = backends
+        self.timeout = timeout
+        self.fallbacks = 0
+
+    async def translate(self, texts: list[str], source: str,
+                        target: str) -> list[str]:
+        error = None
+        for backend in self.backends:
+            try:
+                return await asyncio.wait_for(
+                    backend.translate(texts, source, target), self.timeout
+                )
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = TimeoutError(f"{backend.name} timed out")
+                logger.warning("Translation backend %s failed: %s",
+                               backend.name, e)
+                self.fallbacks += 1
+                error = e
+        raise error
+
+
+def load_dictionary(path: str) -> dict:
+    # {"en:ru": {"word": "translation", ...}, ...}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        tuple(pair.split(":", 1)): {
+            word.lower(): translated for word, translated in words.items()
+        }
+        for pair, words in data.items()
+    }
+
+
+def create_local_backend() -> LocalBackend:
+    dictionary = None
+    if TRANSLATE_LOCAL_DICTIONARY:
+        dictionary = load_dictionary(TRANSLATE_LOCAL_DICTIONARY)
+    return LocalBackend(
+        latency=TRANSLATE_LOCAL_LATENCY, dictionary=dictionary
+    )
+
+
+BACKENDS = {"local": create_local_backend}
+
+
+def register_backend(name: str, factory):
+    BACKENDS[name] = factory
+
+
+def create_backend(
+    spec: str, fallback_timeout: float | None = None
+) -> TranslationBackend:
+    # "rapidapi" picks one backend, "rapidapi,local" chains them
+    names = [name.strip() for name in spec.split(",") if name.strip()]
+    if not names:
+        raise ValueError("No translation backend configured")
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown:
+        raise ValueError(
+            f"Unknown translation backend: {', '.join(unknown)}"
+        )
+    backends = [BACKENDS[name]() for name in names]
+    if len(backends) == 1:
+        return backends[0]
+    return FallbackBackend(backends, timeout=fallback_timeout)
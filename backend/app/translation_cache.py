@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import unicodedata
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from . import models
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TABLE = models.TranslationCacheEntry.__table__
+
+
+def normalize_text(text: str) -> str:
+    # Spacing within a line and Unicode composition differences do not
+    # change the translation, so they should not cause a cache miss
+    # either; line breaks do, as they carry the paragraphs of a note
+    lines = unicodedata.normalize("NFC", text).splitlines()
+    return "\n".join(" ".join(line.split()) for line in lines).strip()
+
+
+def cache_key(text: str, source: str, target: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode()).hexdigest()
+    return f"{source}:{target}:{digest}"
+
+
+# Two tiers: an in-process LRU bounded by the size of the cached
+# translations, in front of a table in the app database that survives
+# restarts and is shared between workers.
+class TranslationCache:
+    def __init__(self, engine: AsyncEngine, max_entries: int = 10000,
+                 max_bytes: int = 16 * 1024 * 1024):
+        self.engine = engine
+        self.memory = TTLCache(
+            maxsize=max_entries,
+            ttl=None,
+            max_bytes=max_bytes,
+            sizeof=lambda value: len(value.encode()),
+        )
+        self.db_hits = 0
+        self.misses = 0
+
+    async def get(self, text: str, source: str, target: str) -> str | None:
+        key = cache_key(text, source, target)
+        translated = self.memory.get(key)
+        if translated is not None:
+            return translated
+        try:
+            async with self.engine.connect() as conn:
+                result = await conn.execute(
+                    select(TABLE.c.translated_text).where(
+                        TABLE.c.cache_key == key
+                    )
+                )
+                translated = result.scalar()
+        except SQLAlchemyError:
+            logger.warning("Translation cache lookup failed", exc_info=True)
+            translated = None
+        if translated is None:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        self.memory.set(key, translated)
+        return translated
+
+    async def set(self, text: str, source: str, target: str,
+                  translated: str):
+        key = cache_key(text, source, target)
+        self.memory.set(key, translated)
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(
+                    insert(TABLE).values(
+                        cache_key=key,
+                        source=source,
+                        target=target,
+                        translated_text=translated,
+                    )
+                )
+        except IntegrityError:
+            # Another worker stored the same translation first
+            pass
+        except SQLAlchemyError:
+            logger.warning("Translation cache store failed", exc_info=True)
+
+    async def get_many(self, texts: list[str], source: str,
+                       target: str) -> dict[str, str]:
+        # One database round trip for every text missing from memory
+        found, missing = {}, {}
+        for text in texts:
+            key = cache_key(text, source, target)
+            translated = self.memory.get(key)
+            if translated is not None:
+                found[text] = translated
+            else:
+                missing.setdefault(key, []).append(text)
+        if not missing:
+            return found
+        try:
+            async with self.engine.connect() as conn:
+                result = await conn.execute(
+                    select(TABLE.c.cache_key, TABLE.c.translated_text).where(
+                        TABLE.c.cache_key.in_(list(missing))
+                    )
+                )
+                rows = result.all()
+        except SQLAlchemyError:
+            logger.warning("Translation cache lookup failed", exc_info=True)
+            rows = []
+        for key, translated in rows:
+            self.memory.set(key, translated)
+            for text in missing.pop(key):
+                found[text] = translated
+            self.db_hits += 1
+        self.misses += len(missing)
+        return found
+
+    async def set_many(self, translations: dict[str, str], source: str,
+                       target: str):
+        rows = {}
+        for text, translated in translations.items():
+            key = cache_key(text, source, target)
+            self.memory.set(key, translated)
+            rows[key] = translated
+        if not rows:
+            return
+        try:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(
+                    select(TABLE.c.cache_key).where(
+                        TABLE.c.cache_key.in_(list(rows))
+                    )
+                )
+                for key in result.scalars():
+                    del rows[key]
+                if rows:
+                    await conn.execute(insert(TABLE), [
+                        {
+                            "cache_key": key,
+                            "source": source,
+                            "target": target,
+                            "translated_text": translated,
+                        }
+                        for key, translated in rows.items()
+                    ])
+        except IntegrityError:
+            pass
+        except SQLAlchemyError:
+            logger.warning("Translation cache store failed", exc_info=True)
+
+    def clear(self):
+        self.memory.clear()
+        self.db_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        lookups = memory["hits"] + self.db_hits + self.misses
+        hits = memory["hits"] + self.db_hits
+        return {
+            "memory_entries": memory["size"],
+            "memory_bytes": memory["bytes"],
+            "memory_evictions": memory["evictions"],
+            "memory_hits": memory["hits"],
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
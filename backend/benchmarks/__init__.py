@@ -0,0 +1,4 @@
+import os
+
+# app.auth reads the signing key at import time
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
@@ -0,0 +1,137 @@
+"""Compare the async routes with a threadpool-bound sync baseline.
+
+Run from ``backend/``::
+
+    python -m benchmarks.async_db --threads 4 --concurrency 1 8 32 64
+
+The sync baseline serves the same query from a ``def`` route, so each
+request holds one of ``--threads`` worker threads for its whole DB call.
+The report includes the peak number of statements in flight, which the
+threadpool caps for the baseline but not for the async app.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import anyio
+import httpx
+from fastapi import Depends, FastAPI
+from jose import jwt
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app import auth, crud, schemas
+from app.database import create_db_engine
+
+from .common import app_client, auth_headers, percentile, seed
+
+
+class InFlight:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    def attach(self, engine):
+        event.listen(engine, "before_cursor_execute", self.enter)
+        event.listen(engine, "after_cursor_execute", self.exit)
+
+    def enter(self, *args):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+
+    def exit(self, *args):
+        self.current -= 1
+
+
+def build_baseline(path, in_flight):
+    engine = create_db_engine(f"sqlite:///{path}")
+    in_flight.attach(engine)
+    Session = sessionmaker(bind=engine)
+    baseline = FastAPI()
+
+    # Same work as the real route: token decode, user lookup, page query.
+    # The session is opened inside the handler rather than through a
+    # yield dependency, whose teardown would need a second threadpool
+    # token and can deadlock against the connection pool.
+    @baseline.get("/notes/", response_model=list[schemas.Note])
+    def read_notes(token: str = Depends(auth.oauth2_scheme)):
+        payload = jwt.decode(
+            token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]
+        )
+        with Session() as db:
+            user = auth.get_user(db, payload["sub"])
+            return crud.get_notes(db, user_id=user.id)
+
+    return baseline, engine
+
+
+async def drive(client, headers, concurrency, requests):
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.get("/notes/", headers=headers)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+    }
+
+
+async def main(args):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = (
+        args.threads
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, args.notes)
+        headers = auth_headers()
+
+        print(f"threadpool size: {args.threads}")
+        print(f"{'mode':<6} {'conc':>5} {'req/s':>9} {'p50 ms':>8} "
+              f"{'p99 ms':>8} {'peak in-flight':>15}")
+        for mode in ("sync", "async"):
+            for concurrency in args.concurrency:
+                in_flight = InFlight()
+                if mode == "sync":
+                    baseline, engine = build_baseline(path, in_flight)
+                    transport = httpx.ASGITransport(app=baseline)
+                    async with httpx.AsyncClient(
+                        transport=transport, base_url="http://bench"
+                    ) as client:
+                        result = await drive(
+                            client, headers, concurrency, args.requests
+                        )
+                    engine.dispose()
+                else:
+                    async with app_client(path, in_flight.attach) as client:
+                        result = await drive(
+                            client, headers, concurrency, args.requests
+                        )
+                print(f"{mode:<6} {concurrency:>5} {result['rps']:>9.0f} "
+                      f"{result['p50']:>8.2f} {result['p99']:>8.2f} "
+                      f"{in_flight.peak:>15}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--notes", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 8, 32, 64]
+    )
+    asyncio.run(main(parser.parse_args()))
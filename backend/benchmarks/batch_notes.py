@@ -0,0 +1,66 @@
+"""Notes written per second: one POST /notes/ per note vs /notes/batch.
+
+Run from ``backend/``::
+
+    python -m benchmarks.batch_notes --notes 2000 --batch-sizes 10 100 1000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from .common import app_client, auth_headers, seed
+
+
+async def single(client, headers, notes):
+    for i in range(notes):
+        response = await client.post(
+            "/notes/",
+            json={"title": f"Single {i}", "content": "x" * 256},
+            headers=headers,
+        )
+        assert response.status_code == 200
+
+
+async def batched(client, headers, notes, batch_size):
+    for start in range(0, notes, batch_size):
+        payload = [
+            {"title": f"Batch {i}", "content": "x" * 256}
+            for i in range(start, min(start + batch_size, notes))
+        ]
+        response = await client.post(
+            "/notes/batch", json={"notes": payload}, headers=headers
+        )
+        assert response.status_code == 200
+
+
+async def main(args):
+    print(f"{'mode':<12} {'notes/s':>9} {'requests':>9}")
+    runs = [("single", None)] + [
+        (f"batch {size}", size) for size in args.batch_sizes
+    ]
+    for label, batch_size in runs:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            seed(path)
+            headers = auth_headers()
+            async with app_client(path) as client:
+                start = time.perf_counter()
+                if batch_size is None:
+                    await single(client, headers, args.notes)
+                    requests = args.notes
+                else:
+                    await batched(client, headers, args.notes, batch_size)
+                    requests = -(-args.notes // batch_size)
+                elapsed = time.perf_counter() - start
+        print(f"{label:<12} {args.notes / elapsed:>9.0f} {requests:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[10, 100, 1000]
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,84 @@
+"""GET /notes/changes after a few edits vs re-reading the whole notebook.
+
+Run from ``backend/``::
+
+    python -m benchmarks.changes --sizes 1000 10000 50000 --edits 10
+
+The delta sync is a range scan over the (owner_id, change_version)
+indexes, so its cost follows the number of edits, not the notebook size.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from app import crud
+from app.database import create_db_engine
+
+from .common import app_client, auth_headers, seed
+
+
+def current_version(path, user_id):
+    engine = create_db_engine(f"sqlite:///{path}")
+    with sessionmaker(bind=engine)() as db:
+        version = crud.get_notes_version(db, user_id)
+    engine.dispose()
+    return version
+
+
+async def timed(client, url, headers, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return statistics.median(timings) * 1000, response
+
+
+async def run(size, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        user_id = seed(path, notes=size, content_size=args.content_size)
+        token = current_version(path, user_id)
+        headers = {**auth_headers(), "Accept-Encoding": "identity"}
+        async with app_client(path) as client:
+            for note_id in range(1, args.edits + 1):
+                response = await client.put(
+                    f"/notes/{note_id}",
+                    json={"title": "Edited", "content": "y"},
+                    headers=headers,
+                )
+                assert response.status_code == 200
+            await client.delete(f"/notes/{size}", headers=headers)
+
+            delta_ms, response = await timed(
+                client, f"/notes/changes?since={token}", headers, args.repeat
+            )
+            changes = response.json()
+            assert len(changes["upserts"]) == args.edits
+            assert changes["deletes"] == [size]
+            full_ms, _ = await timed(
+                client, f"/notes/?limit={size}", headers, args.repeat
+            )
+    print(f"{size:>8} {args.edits + 1:>8} {delta_ms:>9.2f} {full_ms:>9.2f}")
+
+
+async def main(args):
+    print(f"{'notes':>8} {'changes':>8} {'delta ms':>9} {'full ms':>9}")
+    for size in args.sizes:
+        await run(size, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 50000])
+    parser.add_argument("--edits", type=int, default=10)
+    parser.add_argument("--content-size", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,70 @@
+import contextlib
+
+import httpx
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app import auth, models, ratelimit
+from app.database import create_async_db_engine, create_db_engine
+from app.main import app, get_db
+from app.migrations import migrate
+
+
+def seed(path, notes=0, username="bench", content_size=512):
+    engine = create_db_engine(f"sqlite:///{path}")
+    migrate(engine)
+    with sessionmaker(bind=engine)() as db:
+        user = models.User(username=username, hashed_password="x")
+        db.add(user)
+        db.flush()
+        db.add_all(
+            models.Note(
+                title=f"Note {i}",
+                content="x" * content_size,
+                owner_id=user.id,
+            )
+            for i in range(notes)
+        )
+        db.commit()
+        user_id = user.id
+    engine.dispose()
+    return user_id
+
+
+def auth_headers(username="bench"):
+    token = auth.create_access_token({"sub": username})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@contextlib.asynccontextmanager
+async def app_client(path, on_engine=None, raise_app_exceptions=True):
+    # httpx client calling the app in-process, with the database at path
+    engine = create_async_db_engine(f"sqlite:///{path}")
+    if on_engine is not None:
+        on_engine(engine.sync_engine)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def override_get_db():
+        async with Session() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    # Every request comes from one address and a handful of users
+    ratelimit.limiter.enabled = False
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(
+                app=app, raise_app_exceptions=raise_app_exceptions
+            ),
+            base_url="http://bench",
+        ) as client:
+            yield client
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        ratelimit.limiter.enabled = ratelimit.RATE_LIMIT_ENABLED
+        await engine.dispose()
+
+
+def percentile(sorted_values, pct):
+    index = max(0, int(round(len(sorted_values) * pct / 100)) - 1)
+    return sorted_values[index]
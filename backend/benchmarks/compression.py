@@ -0,0 +1,88 @@
+"""Bytes saved and CPU spent compressing GET /notes/ responses.
+
+Run from ``backend/``::
+
+    python -m benchmarks.compression --sizes 10 100 1000 --repeat 20
+
+Notes are filled with random prose-like text. Each row compresses one
+real response body with one encoder and level; CPU time is process time
+per response.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from app.compression import AVAILABLE_ENCODERS
+
+from .common import app_client, auth_headers, seed
+
+WORDS = (
+    "the meeting notes project deadline review budget draft idea call "
+    "remember buy milk tomorrow friday release plan bug fix client email "
+    "shopping list travel ticket hotel summary question answer follow up"
+).split()
+LEVELS = {"gzip": [1, 6, 9], "br": [1, 4, 11], "zstd": [1, 3, 19]}
+
+
+def prose(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+async def fill(client, headers, notes, rng):
+    for start in range(0, notes, 1000):
+        batch = [
+            {"title": prose(rng, 4), "content": prose(rng, 80)}
+            for _ in range(min(1000, notes - start))
+        ]
+        response = await client.post(
+            "/notes/batch", json={"notes": batch}, headers=headers
+        )
+        assert response.status_code == 200
+
+
+def compress(encoder_class, level, body):
+    encoder = encoder_class(level)
+    return encoder.compress(body) + encoder.flush()
+
+
+async def main(args):
+    rng = random.Random(42)
+    print(f"encoders: {', '.join(AVAILABLE_ENCODERS)}")
+    print(f"{'notes':>6} {'encoding':<9} {'KiB':>8} {'saved':>6} "
+          f"{'cpu ms':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path)
+        headers = auth_headers()
+        async with app_client(path) as client:
+            await fill(client, headers, max(args.sizes), rng)
+            for size in args.sizes:
+                response = await client.get(
+                    f"/notes/?limit={size}",
+                    headers={**headers, "Accept-Encoding": "identity"},
+                )
+                body = response.content
+                print(f"{size:>6} {'identity':<9} {len(body) / 1024:>8.1f}")
+                for name, encoder_class in AVAILABLE_ENCODERS.items():
+                    for level in LEVELS[name]:
+                        start = time.process_time()
+                        for _ in range(args.repeat):
+                            compressed = compress(encoder_class, level, body)
+                        cpu = (time.process_time() - start) / args.repeat
+                        saved = 1 - len(compressed) / len(body)
+                        label = f"{name}-{level}"
+                        print(f"{size:>6} {label:<9} "
+                              f"{len(compressed) / 1024:>8.1f} "
+                              f"{saved:>6.0%} {cpu * 1000:>7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1000]
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,67 @@
+"""Repeated GET /notes/ with and without If-None-Match.
+
+Run from ``backend/``::
+
+    python -m benchmarks.conditional_get --notes 100 --requests 300
+
+"full" downloads the list every time, as the Streamlit frontend does on
+each rerun. "conditional" sends the ETag from the first response and gets
+304 while nothing changes. The notes column counts SQL statements that
+read the notes table.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import event
+
+from .common import app_client, auth_headers, percentile, seed
+
+
+async def main(args):
+    print(f"{args.notes} notes, {args.requests} requests")
+    print(f"{'mode':<12} {'req/s':>7} {'p50 ms':>7} {'p99 ms':>7} "
+          f"{'status':>6} {'notes':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, notes=args.notes)
+        headers = auth_headers()
+        note_reads = []
+
+        def count_note_reads(conn, cursor, statement, *args):
+            if "FROM notes" in statement:
+                note_reads.append(statement)
+
+        def on_engine(engine):
+            event.listen(engine, "before_cursor_execute", count_note_reads)
+
+        async with app_client(path, on_engine) as client:
+            first = await client.get("/notes/", headers=headers)
+            etag = first.headers["ETag"]
+            for label, extra in (
+                ("full", {}), ("conditional", {"If-None-Match": etag})
+            ):
+                note_reads.clear()
+                timings = []
+                start = time.perf_counter()
+                for _ in range(args.requests):
+                    request_start = time.perf_counter()
+                    response = await client.get(
+                        "/notes/", headers={**headers, **extra}
+                    )
+                    timings.append(time.perf_counter() - request_start)
+                elapsed = time.perf_counter() - start
+                timings.sort()
+                print(f"{label:<12} {args.requests / elapsed:>7.0f} "
+                      f"{percentile(timings, 50) * 1000:>7.2f} "
+                      f"{percentile(timings, 99) * 1000:>7.2f} "
+                      f"{response.status_code:>6} {len(note_reads):>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=300)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,304 @@
+"""Generate a large synthetic notes dataset for benchmark runs.
+
+Run from ``backend/``::
+
+    python -m benchmarks.dataset --users 10000 --notes 10000000
+    python -m benchmarks.dataset --database-url sqlite:////tmp/big.db \\
+        --notes 1000000 --skew 1.2 --languages en:50,ru:50
+
+Writes into ``DATABASE_URL`` unless ``--database-url`` is given, after
+migrating it. Note owners follow a Zipf-like distribution, so with the
+default ``--skew 1`` a handful of users own most of the notes (``0``
+spreads them evenly). Content sizes are drawn from ``--sizes``, a
+histogram of ``max_chars:weight`` buckets where each note gets between
+half and all of its bucket's limit, and the text is taken from
+word pools in the ``--languages`` mix.
+
+Secondary indexes and triggers on ``notes`` are dropped for the load and
+restored afterwards. Change versions, which the triggers would stamp,
+are computed here. The search index is rebuilt in one pass at the end.
+Every user gets the same ``--password``.
+"""
+import argparse
+import contextlib
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, text
+
+from app import auth, models
+from app.database import (
+    SQLALCHEMY_DATABASE_URL, SQLITE_PRAGMAS, create_db_engine,
+)
+from app.migrations import migrate
+
+DEFAULT_SIZES = "64:50,256:30,1024:15,8192:5"
+DEFAULT_LANGUAGES = "en:60,ru:20,de:5,es:5,fr:5,zh:5"
+POOL_SIZE = 256 * 1024
+TITLE_SIZE = 32
+
+WORDS = {
+    "en": (
+        "the meeting project notes today tomorrow idea list buy milk call "
+        "review draft budget travel plan weekly report book read remember "
+        "friday garden recipe coffee deadline team"
+    ).split(),
+    "ru": (
+        "встреча проект заметки сегодня завтра идея список купить молоко "
+        "позвонить отчёт черновик бюджет поездка план неделя книга "
+        "прочитать помнить пятница сад рецепт кофе срок команда"
+    ).split(),
+    "de": (
+        "Besprechung Projekt Notizen heute morgen Idee Liste kaufen Milch "
+        "anrufen Bericht Entwurf Budget Reise Plan Woche Buch lesen "
+        "Freitag Garten Rezept Kaffee Frist Team"
+    ).split(),
+    "es": (
+        "reunión proyecto notas hoy mañana idea lista comprar leche llamar "
+        "informe borrador presupuesto viaje plan semana libro leer viernes "
+        "jardín receta café plazo equipo"
+    ).split(),
+    "fr": (
+        "réunion projet notes aujourd'hui demain idée liste acheter lait "
+        "appeler rapport brouillon budget voyage plan semaine livre lire "
+        "vendredi jardin recette café échéance équipe"
+    ).split(),
+    "zh": (
+        "会议 项目 笔记 今天 明天 想法 清单 购买 牛奶 打电话 报告 草稿 预算 "
+        "旅行 计划 每周 书 阅读 记住 星期五 花园 食谱 咖啡 截止日期 团队"
+    ).split(),
+}
+# Written without spaces between words
+UNSPACED_LANGUAGES = {"zh"}
+
+
+def parse_histogram(spec: str, convert=str):
+    keys, weights = [], []
+    for item in spec.split(","):
+        key, _, weight = item.partition(":")
+        keys.append(convert(key.strip()))
+        weights.append(float(weight or 1))
+    return keys, weights
+
+
+def build_pool(rng, language: str, size: int) -> str:
+    words = WORDS[language]
+    separator = "" if language in UNSPACED_LANGUAGES else " "
+    parts, length = [], 0
+    while length < size:
+        sentence = separator.join(rng.choices(words, k=rng.randint(4, 12)))
+        sentence = sentence[:1].upper() + sentence[1:] + ". "
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)[:size]
+
+
+# Notes are slices of a pre-built pool of text per language, which keeps
+# generation cheap enough for tens of millions of rows
+class NoteGenerator:
+    def __init__(self, rng, user_ids, skew, sizes, languages):
+        self.rng = rng
+        self.user_ids = user_ids
+        self.owner_weights = _cumulative(
+            [1 / (rank + 1) ** skew for rank in range(len(user_ids))]
+        )
+        self.sizes, size_weights = parse_histogram(sizes, int)
+        if max(self.sizes) > POOL_SIZE:
+            raise ValueError(f"Content sizes are limited to {POOL_SIZE}")
+        self.size_weights = _cumulative(size_weights)
+        languages, language_weights = parse_histogram(languages)
+        unknown = [lang for lang in languages if lang not in WORDS]
+        if unknown:
+            raise ValueError(f"Unknown languages: {', '.join(unknown)}")
+        self.pools = [build_pool(rng, lang, POOL_SIZE) for lang in languages]
+        self.language_weights = _cumulative(language_weights)
+        self.versions = dict.fromkeys(user_ids, 0)
+        self.now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def chunk(self, count: int) -> list[dict]:
+        rng = self.rng
+        random_ = rng.random
+        owners = rng.choices(
+            self.user_ids, cum_weights=self.owner_weights, k=count
+        )
+        pools = rng.choices(
+            self.pools, cum_weights=self.language_weights, k=count
+        )
+        bounds = rng.choices(
+            self.sizes, cum_weights=self.size_weights, k=count
+        )
+        versions = self.versions
+        rows = []
+        for owner_id, pool, bound in zip(owners, pools, bounds):
+            size = max(1, int(bound * (0.5 + 0.5 * random_())))
+            offset = int(random_() * (POOL_SIZE - size))
+            title_offset = int(random_() * (POOL_SIZE - TITLE_SIZE))
+            # Spread over the past year
+            created_at = self.now - timedelta(seconds=random_() * 31536000)
+            versions[owner_id] += 1
+            rows.append({
+                "title": pool[title_offset:title_offset + TITLE_SIZE].strip(),
+                "content": pool[offset:offset + size],
+                "owner_id": owner_id,
+                "created_at": created_at,
+                "updated_at": created_at,
+                "change_version": versions[owner_id],
+            })
+        return rows
+
+
+def _cumulative(weights):
+    total, cumulative = 0.0, []
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+
+def _drop_sqlite_objects(conn):
+    objects = conn.execute(text(
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE tbl_name = 'notes' AND type IN ('index', 'trigger') "
+        "AND sql IS NOT NULL"
+    )).all()
+    for kind, name, _ in objects:
+        conn.exec_driver_sql(f"DROP {kind.upper()} {name}")
+    return [sql for _, _, sql in objects]
+
+
+DROP_OBJECTS = {
+    "sqlite": _drop_sqlite_objects,
+}
+
+
+def drop_indexes(engine) -> list[str]:
+    # Returns the statements that put them back
+    drop = DROP_OBJECTS.get(engine.dialect.name)
+    if drop is None:
+        return []
+    with engine.begin() as conn:
+        return drop(conn)
+
+
+def restore_indexes(engine, statements: list[str]):
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.exec_driver_sql(statement)
+
+
+def rebuild_search_index(engine):
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        has_fts = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'"
+        )).first()
+        if has_fts:
+            conn.exec_driver_sql(
+                "INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')"
+            )
+
+
+def insert_users(engine, count, prefix, hashed_password):
+    stmt = insert(models.User).returning(
+        models.User.id, sort_by_parameter_order=True
+    )
+    with engine.begin() as conn:
+        return list(conn.scalars(stmt, [
+            {"username": f"{prefix}{i}", "hashed_password": hashed_password}
+            for i in range(count)
+        ]))
+
+
+def insert_notes(engine, generator, count, chunk_size):
+    stmt = insert(models.Note)
+    written = 0
+    started = time.perf_counter()
+    while written < count:
+        rows = generator.chunk(min(chunk_size, count - written))
+        # One transaction per chunk keeps the journal from growing with
+        # the whole dataset
+        with engine.begin() as conn:
+            conn.execute(stmt, rows)
+        written += len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"\r  {written}/{count} notes, {written / elapsed:,.0f}/s",
+              end="", flush=True)
+    print()
+
+
+def insert_versions(engine, versions):
+    rows = [
+        {"owner_id": owner_id, "version": version}
+        for owner_id, version in versions.items()
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(models.NoteVersion), rows)
+
+
+@contextlib.contextmanager
+def phase(name):
+    started = time.perf_counter()
+    print(f"{name}...")
+    yield
+    print(f"{name}: {time.perf_counter() - started:.1f}s")
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    # Durability is pointless for a throwaway dataset
+    engine = create_db_engine(
+        args.database_url, pragmas={**SQLITE_PRAGMAS, "synchronous": "OFF"}
+    )
+
+    started = time.perf_counter()
+    try:
+        with phase("migrate"):
+            migrate(engine)
+        with phase(f"{args.users} users"):
+            user_ids = insert_users(
+                engine, args.users, args.username_prefix,
+                auth.get_password_hash(args.password),
+            )
+        generator = NoteGenerator(
+            rng, user_ids, args.skew, args.sizes, args.languages
+        )
+        restore = drop_indexes(engine)
+        try:
+            with phase(f"{args.notes} notes"):
+                insert_notes(engine, generator, args.notes, args.chunk_size)
+            with phase("note versions"):
+                insert_versions(engine, generator.versions)
+        finally:
+            # Put back even when the load fails part-way
+            with phase("indexes and triggers"):
+                restore_indexes(engine, restore)
+        with phase("search index"):
+            rebuild_search_index(engine)
+        with phase("analyze"):
+            with engine.begin() as conn:
+                conn.exec_driver_sql("ANALYZE")
+    finally:
+        engine.dispose()
+
+    counts = sorted(generator.versions.values(), reverse=True)
+    top = max(1, len(counts) // 100)
+    print(f"done in {time.perf_counter() - started:.1f}s; the top 1% of "
+          f"users own {sum(counts[:top]) / max(1, args.notes):.0%} "
+          f"of the notes, the busiest has {counts[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES)
+    parser.add_argument("--languages", default=DEFAULT_LANGUAGES)
+    parser.add_argument("--username-prefix", default="user")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,60 @@
+"""GET /notes/ latency: ORM + pydantic + json vs plain rows + orjson.
+
+Run from ``backend/``::
+
+    python -m benchmarks.json_list --sizes 100 1000 10000 --repeat 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from unittest.mock import patch
+
+from app import main as app_main
+
+from .common import app_client, auth_headers, seed
+
+
+async def timed_get(client, headers, limit):
+    start = time.perf_counter()
+    response = await client.get(f"/notes/?limit={limit}", headers=headers)
+    assert response.status_code == 200
+    return time.perf_counter() - start, len(response.content)
+
+
+async def main(args):
+    print(f"{'notes':>6} {'mode':<8} {'mean ms':>8} {'p50 ms':>8} "
+          f"{'KiB':>7} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, notes=max(args.sizes), content_size=args.content_size)
+        headers = auth_headers()
+        async with app_client(path) as client:
+            for size in args.sizes:
+                baseline = None
+                for label, fast in (("default", False), ("orjson", True)):
+                    with patch.object(app_main, "FAST_JSON_RESPONSES", fast):
+                        await timed_get(client, headers, size)
+                        runs = [
+                            await timed_get(client, headers, size)
+                            for _ in range(args.repeat)
+                        ]
+                    timings = [elapsed for elapsed, _ in runs]
+                    mean = statistics.mean(timings)
+                    baseline = baseline or mean
+                    print(f"{size:>6} {label:<8} {mean * 1000:>8.2f} "
+                          f"{statistics.median(timings) * 1000:>8.2f} "
+                          f"{runs[0][1] / 1024:>7.0f} "
+                          f"{baseline / mean:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 1000, 10000]
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--content-size", type=int, default=2048)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,377 @@
+"""End-to-end load test of the notes API under uvicorn.
+
+Run from ``backend/``::
+
+    python -m benchmarks.loadtest --concurrency 8 --duration 20
+    python -m benchmarks.loadtest --save-baseline
+    python -m benchmarks.loadtest --baseline
+
+The app runs in its own uvicorn process against a freshly seeded SQLite
+database, with the fake translation upstream from the tests. Every
+worker logs in as its own user and then picks operations at random from
+``--mix``. With ``--baseline`` the run fails (exit status 1) when
+throughput drops, p95 latency grows or the error rate rises by more than
+``--tolerance``. Both flags take a path and default to
+``benchmarks/loadtest_baseline.json``. Baselines are only comparable on
+the same machine with the same settings.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import insert, select
+
+from app import auth, models
+from app.database import create_db_engine
+from app.migrations import migrate
+from tests.fake_translate import FakeTranslateServer
+
+from .common import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = "127.0.0.1"
+PASSWORD = "load-password"
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "loadtest_baseline.json"
+)
+# Clients mostly reuse their token; each login costs a bcrypt verify
+DEFAULT_MIX = "login=1,list=50,create=10,update=10,delete=3,translate=5"
+PHRASES = [
+    "hello world", "good morning", "thank you", "my notes",
+    "see you tomorrow", "the meeting moved to friday",
+]
+# Settings that must match for a baseline to be comparable
+COMPARED_SETTINGS = (
+    "concurrency", "mix", "notes_per_user", "content_size",
+    "translate_keys", "upstream_latency",
+)
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {name.strip()}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def seed_database(path, users, notes_per_user, content_size):
+    engine = create_db_engine(f"sqlite:///{path}")
+    migrate(engine)
+    # One bcrypt hash shared by every user keeps seeding fast
+    hashed_password = auth.get_password_hash(PASSWORD)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"username": f"load{i}", "hashed_password": hashed_password}
+            for i in range(users)
+        ])
+        user_ids = conn.scalars(
+            select(models.User.id).order_by(models.User.id)
+        ).all()
+        conn.execute(insert(models.Note), [
+            {
+                "title": f"Note {n}",
+                "content": "x" * content_size,
+                "owner_id": user_id,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for user_id in user_ids
+            for n in range(notes_per_user)
+        ])
+        rows = conn.execute(select(models.Note.id, models.Note.owner_id))
+        note_ids = {user_id: [] for user_id in user_ids}
+        for note_id, owner_id in rows:
+            note_ids[owner_id].append(note_id)
+    engine.dispose()
+    return [note_ids[user_id] for user_id in user_ids]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve(env: dict, timeout: float = 30.0):
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", HOST, "--port", str(port),
+            "--log-level", "warning", "--no-access-log",
+        ],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"http://{HOST}:{port}"
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                httpx.get(f"{url}/docs", timeout=1.0)
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn did not start in time")
+                time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+class Worker:
+    def __init__(self, client, index, note_ids, args, rng):
+        self.client = client
+        self.username = f"load{index}"
+        self.note_ids = note_ids
+        self.args = args
+        self.rng = rng
+        self.headers = {}
+
+    async def login(self):
+        response = await self.client.post(
+            "/token", json={"username": self.username, "password": PASSWORD}
+        )
+        if response.status_code == 200:
+            token = response.json()["access_token"]
+            self.headers = {"Authorization": f"Bearer {token}"}
+        return response
+
+    async def list(self):
+        return await self.client.get(
+            "/notes/?limit=50", headers=self.headers
+        )
+
+    async def create(self):
+        response = await self.client.post(
+            "/notes/",
+            json={"title": "Load", "content": "y" * self.args.content_size},
+            headers=self.headers,
+        )
+        if response.status_code == 200:
+            self.note_ids.append(response.json()["id"])
+        return response
+
+    async def update(self):
+        if not self.note_ids:
+            return await self.create()
+        note_id = self.rng.choice(self.note_ids)
+        return await self.client.put(
+            f"/notes/{note_id}",
+            json={"title": "Edited", "content": "z" * self.args.content_size},
+            headers=self.headers,
+        )
+
+    async def delete(self):
+        if not self.note_ids:
+            return await self.create()
+        index = self.rng.randrange(len(self.note_ids))
+        note_id = self.note_ids.pop(index)
+        return await self.client.delete(
+            f"/notes/{note_id}", headers=self.headers
+        )
+
+    async def translate(self):
+        # Drawn from a fixed pool of texts so some hit the cache
+        key = self.rng.randrange(self.args.translate_keys)
+        text = f"{self.rng.choice(PHRASES)} {key}"
+        return await self.client.post(
+            "/translate/", json={"text": text}, headers=self.headers
+        )
+
+
+OPERATIONS = {
+    name: getattr(Worker, name)
+    for name in ("login", "list", "create", "update", "delete", "translate")
+}
+
+
+async def run_worker(worker, mix, start, deadline, results):
+    await worker.login()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.perf_counter() < deadline:
+        name = worker.rng.choices(names, weights)[0]
+        began = time.perf_counter()
+        try:
+            response = await OPERATIONS[name](worker)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        finished = time.perf_counter()
+        if began >= start:
+            latencies, errors = results.setdefault(name, ([], [0]))
+            latencies.append(finished - began)
+            errors[0] += not ok
+
+
+async def drive(url, note_ids, mix, args):
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=url, limits=limits, timeout=30.0
+    ) as client:
+        start = time.perf_counter() + args.warmup
+        deadline = start + args.duration
+        workers = [
+            Worker(client, i, note_ids[i], args, random.Random(args.seed + i))
+            for i in range(args.concurrency)
+        ]
+        await asyncio.gather(*(
+            run_worker(worker, mix, start, deadline, results)
+            for worker in workers
+        ))
+    return results
+
+
+def summarize(latencies, errors, duration) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput": round(len(ordered) / duration, 2),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+    }
+
+
+def report(results, duration) -> dict:
+    summary = {
+        name: summarize(latencies, errors[0], duration)
+        for name, (latencies, errors) in sorted(results.items())
+    }
+    summary["total"] = summarize(
+        [value for latencies, _ in results.values() for value in latencies],
+        sum(errors[0] for _, errors in results.values()),
+        duration,
+    )
+    print(f"{'operation':<10} {'requests':>8} {'errors':>6} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, row in summary.items():
+        print(f"{name:<10} {row['requests']:>8} {row['errors']:>6} "
+              f"{row['throughput']:>8.1f} {row['p50_ms']:>8.2f} "
+              f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+    return summary
+
+
+def compare(summary, settings, baseline, tolerance) -> list[str]:
+    different = [
+        key for key in COMPARED_SETTINGS
+        if baseline["settings"].get(key) != settings[key]
+    ]
+    if different:
+        return [f"baseline was recorded with different {', '.join(different)}"]
+    failures = []
+    for name, expected in baseline["results"].items():
+        actual = summary.get(name)
+        if actual is None:
+            failures.append(f"{name}: no requests")
+            continue
+        if actual["throughput"] < expected["throughput"] * (1 - tolerance):
+            failures.append(
+                f"{name}: {actual['throughput']:.1f} req/s, baseline "
+                f"{expected['throughput']:.1f}"
+            )
+        if actual["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            failures.append(
+                f"{name}: p95 {actual['p95_ms']:.2f} ms, baseline "
+                f"{expected['p95_ms']:.2f}"
+            )
+        error_rate = actual["errors"] / max(actual["requests"], 1)
+        expected_rate = expected["errors"] / max(expected["requests"], 1)
+        if error_rate > expected_rate + tolerance / 10:
+            failures.append(
+                f"{name}: {error_rate:.1%} errors, baseline "
+                f"{expected_rate:.1%}"
+            )
+    return failures
+
+
+def main(args):
+    mix = parse_mix(args.mix)
+    settings = {
+        "concurrency": args.concurrency,
+        "mix": mix,
+        "notes_per_user": args.notes_per_user,
+        "content_size": args.content_size,
+        "translate_keys": args.translate_keys,
+        "upstream_latency": args.upstream_latency,
+        "duration": args.duration,
+    }
+    with tempfile.TemporaryDirectory() as tmp, \
+            FakeTranslateServer(latency=args.upstream_latency) as upstream:
+        path = os.path.join(tmp, "loadtest.db")
+        note_ids = seed_database(
+            path, args.concurrency, args.notes_per_user, args.content_size
+        )
+        env = {
+            "DATABASE_URL": f"sqlite:///{path}",
+            "SECRET_KEY": os.getenv("SECRET_KEY") or "loadtest-secret",
+            "TRANSLATE_API_URL": upstream.url,
+            "TRANSLATE_BACKEND": "rapidapi",
+            # All workers share one address; the limits would cap the
+            # load this generates rather than measure the app
+            "RATE_LIMIT_ENABLED": "false",
+        }
+        with serve(env) as url:
+            print(f"{args.concurrency} workers for {args.duration}s "
+                  f"against {url}")
+            results = asyncio.run(drive(url, note_ids, mix, args))
+    summary = report(results, args.duration)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"settings": settings, "results": summary}, f,
+                      indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(summary, settings, baseline, args.tolerance)
+        if failures:
+            print(f"REGRESSION against {args.baseline} "
+                  f"(tolerance {args.tolerance:.0%}):")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print(f"Within {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help="operation=weight pairs, e.g. list=10,create=1")
+    parser.add_argument("--notes-per-user", type=int, default=200)
+    parser.add_argument("--content-size", type=int, default=512)
+    parser.add_argument("--translate-keys", type=int, default=100)
+    parser.add_argument("--upstream-latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", nargs="?", const=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", nargs="?",
+                        const=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    main(parser.parse_args())
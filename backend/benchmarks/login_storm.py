@@ -0,0 +1,104 @@
+"""GET /notes/ latency while a burst of logins runs bcrypt.
+
+Run from ``backend/``::
+
+    python -m benchmarks.login_storm --logins 16 --requests 200
+
+"inline" verifies passwords on the event loop, as the app used to;
+"pooled" uses the bounded bcrypt executor in ``app.auth``. Every login
+also stores a refresh token. Inline, a login holds the SQLite write lock
+until the loop gets back to it past the other logins' bcrypt calls, so
+some give up on the lock; those are counted as "failed" rather than
+ending the run.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+from unittest.mock import patch
+
+from sqlalchemy.orm import sessionmaker
+
+from app import auth, models
+from app.database import create_db_engine
+
+from .common import app_client, auth_headers, percentile, seed
+
+PASSWORD = "storm-password"
+
+
+def add_login_user(path):
+    engine = create_db_engine(f"sqlite:///{path}")
+    with sessionmaker(bind=engine)() as db:
+        db.add(models.User(
+            username="storm",
+            hashed_password=auth.get_password_hash(PASSWORD),
+        ))
+        db.commit()
+    engine.dispose()
+
+
+async def inline_verify(plain_password, hashed_password):
+    return auth.verify_password(plain_password, hashed_password)
+
+
+async def run(path, logins, requests):
+    headers = auth_headers()
+    latencies = []
+    statuses = Counter()
+    stop = asyncio.Event()
+
+    async with app_client(path, raise_app_exceptions=False) as client:
+
+        async def login_loop():
+            while not stop.is_set():
+                response = await client.post(
+                    "/token", json={"username": "storm", "password": PASSWORD}
+                )
+                assert response.status_code in (200, 500, 503)
+                statuses[response.status_code] += 1
+
+        storm = [asyncio.ensure_future(login_loop()) for _ in range(logins)]
+        await asyncio.sleep(0.2)
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.get("/notes/", headers=headers)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+        stop.set()
+        await asyncio.gather(*storm)
+
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "failed": statuses[500],
+    }
+
+
+async def main(args):
+    print(f"{'mode':<8} {'logins':>7} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'failed':>7}")
+    for mode in ("inline", "pooled"):
+        for logins in (0, args.logins):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "bench.db")
+                seed(path, 100)
+                add_login_user(path)
+                if mode == "inline":
+                    with patch.object(auth, "averify_password", inline_verify):
+                        result = await run(path, logins, args.requests)
+                else:
+                    result = await run(path, logins, args.requests)
+            print(f"{mode:<8} {logins:>7} {result['p50']:>8.1f} "
+                  f"{result['p99']:>8.1f} {result['failed']:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
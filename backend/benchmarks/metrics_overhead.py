@@ -0,0 +1,110 @@
+"""Per-request and per-statement cost of the metrics instrumentation.
+
+Run from ``backend/``::
+
+    python -m benchmarks.metrics_overhead --requests 100000
+
+Calls a bare ASGI app with and without MetricsMiddleware (matched
+against the real route table), runs ``SELECT 1`` on an engine with and
+without the statement events, and puts both next to an in-process
+``GET /notes/{id}`` for scale.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from app import metrics
+from app.database import create_db_engine
+from app.main import app as notes_app
+
+from .common import app_client, auth_headers, seed
+
+START = {"type": "http.response.start", "status": 200, "headers": []}
+BODY = {"type": "http.response.body", "body": b"{}"}
+
+
+async def bare_app(scope, receive, send):
+    await send(START)
+    await send(BODY)
+
+
+async def receive():
+    return {"type": "http.request"}
+
+
+async def send(message):
+    pass
+
+
+async def time_asgi(app, path, requests):
+    scope = {"type": "http", "method": "GET", "path": path}
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def time_statements(path, statements, instrumented):
+    engine = create_db_engine(f"sqlite:///{path}")
+    if instrumented:
+        metrics.instrument_engine(engine)
+    try:
+        with engine.connect() as conn:
+            query = text("SELECT 1")
+            start = time.perf_counter()
+            for _ in range(statements):
+                conn.execute(query)
+            return (time.perf_counter() - start) / statements
+    finally:
+        engine.dispose()
+
+
+async def time_endpoint(path, repeat):
+    headers = auth_headers()
+    timings = []
+    async with app_client(path) as client:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = await client.get("/notes/1", headers=headers)
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200
+    return statistics.median(timings)
+
+
+async def main(args):
+    wrapped = metrics.MetricsMiddleware(
+        bare_app, routes=notes_app.router.routes
+    )
+    # /notes/{note_id} sits near the end of the route table
+    bare = await time_asgi(bare_app, "/notes/123", args.requests)
+    middleware = await time_asgi(wrapped, "/notes/123", args.requests)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, notes=1)
+        plain = time_statements(path, args.statements, False)
+        timed = time_statements(path, args.statements, True)
+        endpoint = await time_endpoint(path, args.repeat)
+
+    request_cost = middleware - bare
+    statement_cost = timed - plain
+    print(f"{'':<22} {'us':>8}")
+    print(f"{'middleware / request':<22} {request_cost * 1e6:>8.2f}")
+    print(f"{'events / statement':<22} {statement_cost * 1e6:>8.2f}")
+    print(f"{'GET /notes/{id}':<22} {endpoint * 1e6:>8.0f}")
+    # The note lookup runs three statements: auth, version and the note
+    overhead = (request_cost + 3 * statement_cost) / endpoint
+    print(f"overhead on GET /notes/{{id}}: {overhead:.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--statements", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,52 @@
+"""GET /notes/ full vs ``fields=title`` vs ``view=summary``.
+
+Run from ``backend/``::
+
+    python -m benchmarks.projection --notes 1000 --content-size 8192
+
+Large notes spill into SQLite overflow pages, which the projected and
+summary queries never read.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from .common import app_client, auth_headers, seed
+
+MODES = [
+    ("full", ""),
+    ("fields", "&fields=title"),
+    ("summary", "&view=summary"),
+]
+
+
+async def main(args):
+    print(f"{args.notes} notes of {args.content_size} bytes")
+    print(f"{'mode':<8} {'mean ms':>8} {'p50 ms':>8} {'KiB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, notes=args.notes, content_size=args.content_size)
+        headers = {**auth_headers(), "Accept-Encoding": "identity"}
+        async with app_client(path) as client:
+            for label, query in MODES:
+                url = f"/notes/?limit={args.notes}{query}"
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    response = await client.get(url, headers=headers)
+                    timings.append(time.perf_counter() - start)
+                    assert response.status_code == 200
+                print(f"{label:<8} {statistics.mean(timings) * 1000:>8.2f} "
+                      f"{statistics.median(timings) * 1000:>8.2f} "
+                      f"{len(response.content) / 1024:>8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=1000)
+    parser.add_argument("--content-size", type=int, default=8192)
+    parser.add_argument("--repeat", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
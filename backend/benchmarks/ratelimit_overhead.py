@@ -0,0 +1,91 @@
+"""Cost of a rate limiter decision, alone and as middleware.
+
+Run from ``backend/``::
+
+    python -m benchmarks.ratelimit_overhead --requests 100000
+
+"store" is ``MemoryStore.take`` with the buckets of a signed-in note
+request (one, per user); "many keys" spreads those requests over
+``--clients`` users. "middleware"
+is the extra time ``RateLimitMiddleware`` adds to a bare ASGI app with
+the app's default rules, including reading the bearer token (its
+signature is checked once, then cached) and the decision histogram.
+"""
+import argparse
+import asyncio
+import time
+
+from app import auth
+from app.ratelimit import (
+    MemoryStore, RateLimiter, RateLimitMiddleware, rules_from_env,
+)
+
+START = {"type": "http.response.start", "status": 200, "headers": []}
+BODY = {"type": "http.response.body", "body": b"[]"}
+
+
+async def bare_app(scope, receive, send):
+    await send(START)
+    await send(BODY)
+
+
+async def receive():
+    return {"type": "http.request"}
+
+
+async def send(message):
+    pass
+
+
+def unlimited_limiter():
+    # The default rules with rates high enough to admit everything
+    rules = [
+        rule._replace(rate=1e12, burst=1e12) for rule in rules_from_env()
+    ]
+    return RateLimiter(rules, MemoryStore())
+
+
+def time_store(requests, clients):
+    limiter = unlimited_limiter()
+    store = limiter.store
+    buckets = [
+        limiter.buckets("default", f"10.0.{i // 256}.{i % 256}", f"user{i}")
+        for i in range(clients)
+    ]
+    start = time.perf_counter()
+    for i in range(requests):
+        store.take(buckets[i % clients])
+    return (time.perf_counter() - start) / requests
+
+
+async def time_asgi(app, requests):
+    token = auth.create_access_token({"sub": "bench"})
+    scope = {
+        "type": "http", "method": "GET", "path": "/notes/",
+        "client": ("10.0.0.1", 5000),
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    }
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+async def main(args):
+    one_client = time_store(args.requests, 1)
+    many_keys = time_store(args.requests, args.clients)
+    bare = await time_asgi(bare_app, args.requests)
+    wrapped = RateLimitMiddleware(bare_app, limiter=unlimited_limiter())
+    middleware = await time_asgi(wrapped, args.requests)
+
+    print(f"{'':<24} {'us':>8}")
+    print(f"{'store, one client':<24} {one_client * 1e6:>8.2f}")
+    print(f"{'store, many keys':<24} {many_keys * 1e6:>8.2f}")
+    print(f"{'middleware / request':<24} {(middleware - bare) * 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=50000)
+    asyncio.run(main(parser.parse_args()))
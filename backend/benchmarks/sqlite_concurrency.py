@@ -0,0 +1,93 @@
+"""Concurrent read/write throughput with default vs tuned SQLite settings.
+
+Run from ``backend/``::
+
+    python -m benchmarks.sqlite_concurrency --readers 8 --writers 2
+
+Each mode gets a fresh database. Writers insert and commit one note at a
+time; readers list a page of notes. "default" is the engine the app used
+to build (rollback journal, no pragmas); "tuned" uses the pragmas and
+pool settings from ``app.database``.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, schemas
+from app.database import SQLITE_PRAGMAS, create_db_engine
+from app.migrations import migrate
+
+
+def run(url, pragmas, args):
+    engine = create_db_engine(url, pragmas=pragmas)
+    migrate(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        user = models.User(username="bench", hashed_password="x")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        for i in range(args.seed):
+            db.add(models.Note(title=f"Seed {i}", content="x" * 256,
+                               owner_id=user_id))
+        db.commit()
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        while time.perf_counter() < deadline:
+            try:
+                with Session() as db:
+                    crud.get_notes(db, user_id=user_id, limit=50)
+                count("reads")
+            except OperationalError:
+                count("errors")
+
+    def writer():
+        note = schemas.NoteCreate(title="Bench", content="y" * 256)
+        while time.perf_counter() < deadline:
+            try:
+                with Session() as db:
+                    crud.create_note(db, note, user_id)
+                count("writes")
+            except OperationalError:
+                count("errors")
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return {key: value / args.seconds for key, value in counts.items()}
+
+
+def main(args):
+    print(f"{'mode':<8} {'reads/s':>9} {'writes/s':>9} {'errors/s':>9}")
+    for mode, pragmas in (("default", {}), ("tuned", SQLITE_PRAGMAS)):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            result = run(url, pragmas, args)
+        print(f"{mode:<8} {result['reads']:>9.0f} {result['writes']:>9.0f} "
+              f"{result['errors']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=1000)
+    main(parser.parse_args())
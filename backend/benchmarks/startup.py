@@ -0,0 +1,91 @@
+"""Cold start: importing ``app.main`` and process start to first response.
+
+Run from ``backend/``::
+
+    python -m benchmarks.startup --repeat 10
+
+Each sample is a fresh interpreter. "import" times ``import app.main``
+alone; "first response" starts uvicorn against an empty database and
+polls until ``GET /users/me`` answers (401, which is enough to have gone
+through routing and authentication).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from .loadtest import BACKEND_DIR, HOST, free_port
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def env_for(path):
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{path}",
+        "SECRET_KEY": os.getenv("SECRET_KEY") or "startup-secret",
+    }
+    # Deployed workers start from cached bytecode
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def time_import(path) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR, env=env_for(path), check=True,
+        capture_output=True, text=True,
+    ).stdout
+    return float(output.split()[-1])
+
+
+def time_first_response(path, timeout=30.0) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", HOST, "--port", str(port), "--log-level", "warning",
+        ],
+        cwd=BACKEND_DIR, env=env_for(path), stdout=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://{HOST}:{port}") as client:
+            while time.perf_counter() - start < timeout:
+                try:
+                    response = client.get("/users/me")
+                    assert response.status_code == 401
+                    return time.perf_counter() - start
+                except httpx.TransportError:
+                    time.sleep(0.005)
+        raise RuntimeError("uvicorn did not answer in time")
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def main(args):
+    imports, responses = [], []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            imports.append(time_import(os.path.join(tmp, "import.db")))
+            responses.append(time_first_response(os.path.join(tmp, "s.db")))
+    print(f"{'':<16} {'median ms':>10} {'min ms':>8}")
+    for label, samples in (("import", imports),
+                           ("first response", responses)):
+        print(f"{label:<16} {statistics.median(samples) * 1000:>10.0f} "
+              f"{min(samples) * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,103 @@
+"""CPU spent keeping a client signed in, with and without refresh tokens.
+
+Run from ``backend/``::
+
+    python -m benchmarks.token_refresh --renewals 50 --session-hours 8
+
+A client has to renew its access token every ``JWT_EXPIRE_MINUTES``.
+Without refresh tokens each renewal is a password login, so a full
+bcrypt verify; with them, it is a ``POST /token/refresh`` and only the
+first login of the session pays for bcrypt. Process CPU time (every
+thread, so the bcrypt pool is included) is measured for each kind of
+request in-process and scaled to one session-hour.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from app import auth, models
+from app.database import create_db_engine
+
+from .common import app_client, seed
+
+USERNAME = "refresh"
+PASSWORD = "refresh-password"
+
+
+def add_login_user(path):
+    engine = create_db_engine(f"sqlite:///{path}")
+    with sessionmaker(bind=engine)() as db:
+        db.add(models.User(
+            username=USERNAME,
+            hashed_password=auth.get_password_hash(PASSWORD),
+        ))
+        db.commit()
+    engine.dispose()
+
+
+async def cpu_per_request(renewals, send):
+    await send()
+    start = time.process_time()
+    for _ in range(renewals):
+        await send()
+    return (time.process_time() - start) / renewals
+
+
+async def run(path, renewals):
+    credentials = {"username": USERNAME, "password": PASSWORD}
+    async with app_client(path) as client:
+
+        async def login():
+            response = await client.post("/token", json=credentials)
+            assert response.status_code == 200
+            return response.json()
+
+        refresh_token = (await login())["refresh_token"]
+
+        async def refresh():
+            nonlocal refresh_token
+            response = await client.post(
+                "/token/refresh", json={"refresh_token": refresh_token}
+            )
+            assert response.status_code == 200
+            refresh_token = response.json()["refresh_token"]
+
+        login_cpu = await cpu_per_request(renewals, login)
+        refresh_cpu = await cpu_per_request(renewals, refresh)
+    return login_cpu, refresh_cpu
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path)
+        add_login_user(path)
+        login_cpu, refresh_cpu = asyncio.run(run(path, args.renewals))
+
+    per_hour = 60 / auth.ACCESS_TOKEN_EXPIRE_MINUTES
+    renewals = per_hour * args.session_hours
+    without = login_cpu * per_hour
+    # One login, then refreshes for the rest of the session
+    with_refresh = (
+        login_cpu + refresh_cpu * max(0, renewals - 1)
+    ) / args.session_hours
+
+    print(f"access tokens last {auth.ACCESS_TOKEN_EXPIRE_MINUTES} min, "
+          f"sessions {args.session_hours:g} h")
+    print(f"{'':<22} {'CPU ms':>8}")
+    print(f"{'POST /token':<22} {login_cpu * 1000:>8.2f}")
+    print(f"{'POST /token/refresh':<22} {refresh_cpu * 1000:>8.2f}")
+    print(f"{'session-hour, logins':<22} {without * 1000:>8.2f}")
+    print(f"{'session-hour, refresh':<22} {with_refresh * 1000:>8.2f}")
+    print(f"{without / with_refresh:.1f}x less CPU with refresh tokens")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--renewals", type=int, default=50)
+    parser.add_argument("--session-hours", type=float, default=8)
+    main(parser.parse_args())
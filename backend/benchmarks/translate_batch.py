@@ -0,0 +1,83 @@
+"""Notes translated per second: one /translate/ per note vs /translate/batch.
+
+Run from ``backend/``::
+
+    python -m benchmarks.translate_batch --notes 200 --latency 0.05
+
+Both modes hit a local fake upstream over HTTP that sleeps ``--latency``
+seconds per request, or with ``--backend local`` the in-process local
+backend with the same injected latency. The translation cache is disabled
+so every text goes upstream.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from app import services
+from app.translation_backends import LocalBackend
+from tests.fake_translate import FakeTranslateServer
+
+from .common import app_client, auth_headers, seed
+
+
+def texts(notes):
+    return [f"Note number {i} about the weather" for i in range(notes)]
+
+
+async def single(client, headers, notes):
+    for text in texts(notes):
+        response = await client.post(
+            "/translate/", json={"text": text}, headers=headers
+        )
+        assert response.status_code == 200
+
+
+async def batched(client, headers, notes):
+    response = await client.post(
+        "/translate/batch", json={"texts": texts(notes)}, headers=headers
+    )
+    assert response.status_code == 200
+
+
+async def main(args):
+    print(f"{args.backend} backend, latency: {args.latency * 1000:.0f} ms")
+    if args.backend == "local":
+        backend = LocalBackend(latency=args.latency)
+    else:
+        backend = services.RapidAPIBackend()
+    print(f"{'mode':<8} {'notes/s':>9} {'upstream calls':>15}")
+    with FakeTranslateServer(latency=args.latency) as upstream, \
+            tempfile.TemporaryDirectory() as tmp, \
+            patch.object(services, "TRANSLATE_API_URL", upstream.url), \
+            patch.object(services, "TRANSLATION_CACHE_ENABLED", False), \
+            patch.object(services, "translation_backend", backend):
+        path = os.path.join(tmp, "bench.db")
+        seed(path)
+        headers = auth_headers()
+        async with app_client(path) as client:
+            for label, run in (("single", single), ("batch", batched)):
+                upstream.requests.clear()
+                local_calls = getattr(backend, "calls", 0)
+                start = time.perf_counter()
+                await run(client, headers, args.notes)
+                elapsed = time.perf_counter() - start
+                if args.backend == "local":
+                    calls = backend.calls - local_calls
+                else:
+                    calls = len(upstream.requests)
+                print(f"{label:<8} {args.notes / elapsed:>9.0f} {calls:>15}")
+        await services.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument(
+        "--backend", choices=["fake-upstream", "local"],
+        default="fake-upstream",
+    )
+    asyncio.run(main(parser.parse_args()))
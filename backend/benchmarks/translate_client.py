@@ -0,0 +1,85 @@
+"""Per-call latency and throughput against a local translation upstream.
+
+Run from ``backend/``::
+
+    python -m benchmarks.translate_client --calls 300 --concurrency 32
+
+"requests" is the old path: ``requests.post`` without a session, one new
+connection per call, run on a thread pool the size of Starlette's.
+"pooled" is the shared keep-alive ``httpx.AsyncClient`` from
+``app.services``.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from app import services
+from tests.fake_translate import FakeTranslateServer
+
+PAYLOAD = {"q": "hello world", "source": "en", "target": "ru"}
+
+
+def requests_call(url):
+    start = time.perf_counter()
+    response = requests.post(url, json=PAYLOAD, timeout=10)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def pooled_call(client, url):
+    start = time.perf_counter()
+    response = await client.post(url, json=PAYLOAD)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def run_requests(url, calls, concurrency):
+    sequential = [requests_call(url) for _ in range(calls)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(requests_call, [url] * calls))
+    return sequential, calls / (time.perf_counter() - start)
+
+
+async def run_pooled(url, calls, concurrency):
+    async with services.create_http_client() as client:
+        sequential = [await pooled_call(client, url) for _ in range(calls)]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded():
+            async with semaphore:
+                await pooled_call(client, url)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(bounded() for _ in range(calls)))
+        return sequential, calls / (time.perf_counter() - start)
+
+
+def main(args):
+    print(f"upstream latency: {args.latency * 1000:.0f} ms")
+    print(f"{'client':<10} {'mean ms':>8} {'p50 ms':>8} {'calls/s':>9}")
+    with FakeTranslateServer(latency=args.latency) as upstream:
+        for name in ("requests", "pooled"):
+            if name == "requests":
+                sequential, throughput = run_requests(
+                    upstream.url, args.calls, args.concurrency
+                )
+            else:
+                sequential, throughput = asyncio.run(run_pooled(
+                    upstream.url, args.calls, args.concurrency
+                ))
+            print(f"{name:<10} {statistics.mean(sequential) * 1000:>8.2f} "
+                  f"{statistics.median(sequential) * 1000:>8.2f} "
+                  f"{throughput:>9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.02)
+    main(parser.parse_args())
@@ -0,0 +1,67 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Local stand-in for the deep-translate1 API. "Translates" by upper-casing
+# the text, records every request and can add latency or fail on demand.
+class FakeTranslateServer:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.fail = False
+        self.requests = []
+        self.connections = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                payload = json.loads(self.rfile.read(length))
+                server.requests.append(payload)
+                server.connections.add(self.client_address)
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.fail:
+                    body = b'{"message": "quota exceeded"}'
+                    self.send_response(429)
+                else:
+                    texts = payload["q"]
+                    if isinstance(texts, str):
+                        texts = [texts]
+                    body = json.dumps({"data": {"translations": {
+                        "translatedText": [text.upper() for text in texts]
+                    }}}).encode()
+                    self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/language/translate/v2"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
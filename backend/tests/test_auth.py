@@ -1,20 +1,33 @@
+import time
+
 import pytest
 from datetime import timedelta
+from jose import jwt
 from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi import HTTPException, status
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
-from app import models
+from app import models, schemas
+from app.executors import ExecutorSaturated
 from app.auth import (
     verify_password,
     get_password_hash,
     get_user,
     authenticate_user,
+    aget_user,
+    aauthenticate_user,
+    averify_password,
+    aget_password_hash,
     create_access_token,
     get_current_user,
     SECRET_KEY,
     ALGORITHM,
     ACCESS_TOKEN_EXPIRE_MINUTES,
-    pwd_context
+    pwd_context,
+    user_cache,
+    user_lookup_latency,
 )
 
 
@@ -27,6 +40,13 @@ def mock_env_vars():
         yield
 
 
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    user_cache.clear()
+    yield
+    user_cache.clear()
+
+
 @pytest.fixture
 def db_():
     db = MagicMock()
@@ -37,6 +57,7 @@ def db_():
 def sample_user():
     hashed_password = get_password_hash("testpassword")
     return models.User(
+        id=1,
         username="testuser",
         hashed_password=hashed_password
     )
@@ -67,6 +88,33 @@ def test_get_password_hash():
     assert pwd_context.verify(password, hashed)
 
 
+# Test cases for the pooled bcrypt calls
+@pytest.mark.asyncio
+async def test_averify_password(sample_user):
+    assert await averify_password(
+        "testpassword", sample_user.hashed_password
+    ) is True
+    assert await averify_password(
+        "wrongpassword", sample_user.hashed_password
+    ) is False
+
+
+@pytest.mark.asyncio
+async def test_aget_password_hash():
+    hashed = await aget_password_hash("testpassword")
+    assert pwd_context.verify("testpassword", hashed)
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_saturated():
+    with patch('app.auth.password_executor.run',
+               side_effect=ExecutorSaturated("busy")):
+        with pytest.raises(HTTPException) as exc_info:
+            await aget_password_hash("testpassword")
+    assert exc_info.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert exc_info.value.headers["Retry-After"] == "1"
+
+
 # Test cases for get_user
 def test_get_user_found(db_, sample_user):
     db_.query.return_value.filter.return_value.first.return_value = sample_user
@@ -99,6 +147,37 @@ def test_authenticate_user_not_found(db_):
     assert result is False
 
 
+@pytest.fixture
+def async_db_():
+    db = MagicMock()
+    db.scalars = AsyncMock(return_value=MagicMock())
+    return db
+
+
+# Test cases for the async lookups
+@pytest.mark.asyncio
+async def test_aget_user_found(async_db_, sample_user):
+    async_db_.scalars.return_value.first.return_value = sample_user
+    result = await aget_user(async_db_, "testuser")
+    assert result == sample_user
+
+
+@pytest.mark.asyncio
+async def test_aauthenticate_user(async_db_, sample_user):
+    async_db_.scalars.return_value.first.return_value = sample_user
+    assert await aauthenticate_user(
+        async_db_, "testuser", "testpassword"
+    ) == sample_user
+    assert await aauthenticate_user(
+        async_db_, "testuser", "wrongpassword"
+    ) is False
+
+    async_db_.scalars.return_value.first.return_value = None
+    assert await aauthenticate_user(
+        async_db_, "nonexistent", "testpassword"
+    ) is False
+
+
 # Test cases for create_access_token
 def test_create_access_token():
     data = {"sub": "testuser"}
@@ -106,6 +185,14 @@ def test_create_access_token():
     assert isinstance(token, str)
 
 
+def test_create_access_token_default_expiry():
+    token = create_access_token({"sub": "testuser"})
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    lifetime = payload["exp"] - time.time()
+    assert ACCESS_TOKEN_EXPIRE_MINUTES * 60 - 5 < lifetime
+    assert lifetime <= ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+
 def test_create_access_token_with_expiry():
     data = {"sub": "testuser"}
     expires_delta = timedelta(minutes=30)
@@ -116,12 +203,13 @@ def test_create_access_token_with_expiry():
 @pytest.mark.asyncio
 async def test_get_current_user_valid_token(sample_user, valid_token):
     # Mock just the get_user function to return our sample user
-    with patch('app.auth.get_user', return_value=sample_user), \
+    with patch('app.auth.aget_user', return_value=sample_user), \
         patch('app.auth.oauth2_scheme',
               new_callable=AsyncMock) as mock_scheme:
         mock_scheme.return_value = valid_token
-        user = await get_current_user(token=valid_token)
-        assert user == sample_user
+        user = await get_current_user(token=valid_token, db=AsyncMock())
+        assert user.id == sample_user.id
+        assert user.username == sample_user.username
 
 
 @pytest.mark.asyncio
@@ -130,7 +218,7 @@ async def test_get_current_user_invalid_token():
                new_callable=AsyncMock) as mock_scheme:
         mock_scheme.return_value = "invalidtoken"
         with pytest.raises(HTTPException) as exc_info:
-            await get_current_user(token="invalidtoken")
+            await get_current_user(token="invalidtoken", db=AsyncMock())
         assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
 
 
@@ -144,10 +232,60 @@ async def test_get_current_user_missing_subject(db_):
                new_callable=AsyncMock) as mock_scheme:
         mock_scheme.return_value = token_without_sub
         with pytest.raises(HTTPException) as exc_info:
-            await get_current_user(token=token_without_sub)
+            await get_current_user(
+                token=token_without_sub, db=AsyncMock()
+            )
         assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
 
 
+@pytest.mark.asyncio
+async def test_get_current_user_uses_cache(sample_user, valid_token):
+    with patch('app.auth.aget_user', return_value=sample_user) as mock_get:
+        first = await get_current_user(token=valid_token, db=AsyncMock())
+        second = await get_current_user(token=valid_token, db=AsyncMock())
+    assert first == second
+    mock_get.assert_awaited_once()
+    assert user_cache.stats()["hits"] == 1
+    assert user_lookup_latency.count >= 2
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_unknown_user_not_cached(valid_token):
+    with patch('app.auth.aget_user', return_value=None):
+        with pytest.raises(HTTPException):
+            await get_current_user(token=valid_token, db=AsyncMock())
+    assert len(user_cache) == 0
+
+
+def test_user_cache_invalidated_on_change():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = models.User(username="cached", hashed_password="x")
+    db.add(user)
+    db.commit()
+
+    other = schemas.User(id=user.id + 1, username="other")
+    user_cache.set("other", other)
+
+    user_cache.set("cached", schemas.User.from_orm(user))
+    user.username = "renamed"
+    db.commit()
+    assert user_cache.get("cached") is None
+
+    user_cache.set("renamed", schemas.User.from_orm(user))
+    db.delete(user)
+    db.commit()
+    assert user_cache.get("renamed") is None
+    assert user_cache.get("other") == other
+    db.close()
+    engine.dispose()
+
+
 # Test environment variables
 def test_environment_variables():
     assert SECRET_KEY is not None
@@ -0,0 +1,112 @@
+from app.cache import TTLCache, LatencyStats
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_get_and_set():
+    cache = TTLCache(maxsize=2, ttl=10)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("missing", "default") == "default"
+    assert cache.stats() == {
+        "size": 1,
+        "bytes": 0,
+        "hits": 1,
+        "misses": 2,
+        "evictions": 0,
+        "hit_rate": 1 / 3,
+    }
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=2, ttl=10, timer=timer)
+    cache.set("a", 1)
+    timer.now = 9.9
+    assert cache.get("a") == 1
+    timer.now = 10
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_without_ttl_never_expires():
+    timer = FakeTimer()
+    cache = TTLCache(ttl=None, timer=timer)
+    cache.set("a", 1)
+    timer.now = 10 ** 9
+    assert cache.get("a") == 1
+
+
+def test_ttl_cache_evicts_by_size():
+    cache = TTLCache(maxsize=100, ttl=None, max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "yyyy")
+    assert cache.bytes == 8
+    cache.set("c", "zzzz")
+    assert cache.get("a") is None
+    assert cache.bytes == 8
+
+    # Test replacing a key accounts for the old value
+    cache.set("b", "y")
+    assert cache.bytes == 5
+
+    # Test values larger than the whole budget are not cached
+    cache.set("d", "w" * 11)
+    assert cache.get("d") is None
+    assert cache.get("c") == "zzzz"
+    cache.pop("c")
+    assert cache.bytes == 1
+
+
+def test_ttl_cache_remove_if():
+    cache = TTLCache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert cache.remove_if(lambda value: value % 2 == 1) == 2
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_ttl_cache_pop_and_clear():
+    cache = TTLCache()
+    cache.set("a", 1)
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    cache.set("b", 2)
+    cache.get("b")
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats()["hits"] == 0
+
+
+def test_latency_stats():
+    stats = LatencyStats()
+    assert stats.stats()["avg_seconds"] == 0.0
+    stats.observe(0.1)
+    stats.observe(0.3)
+    assert stats.stats()["count"] == 2
+    assert abs(stats.stats()["avg_seconds"] - 0.2) < 1e-9
+    assert stats.stats()["max_seconds"] == 0.3
+    stats.reset()
+    assert stats.stats()["count"] == 0
@@ -0,0 +1,133 @@
+import gzip
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from app.compression import (
+    AVAILABLE_ENCODERS, CompressionMiddleware, GzipEncoder, choose_encoding,
+)
+
+BIG = "note body " * 200
+
+
+def build_app(**kwargs):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, **kwargs)
+
+    @app.get("/big")
+    def big():
+        return PlainTextResponse(BIG, headers={"ETag": '"1-2-abc"'})
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("tiny")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(
+            (BIG for _ in range(5)), media_type="text/plain"
+        )
+
+    @app.get("/encoded")
+    def encoded():
+        return PlainTextResponse(
+            gzip.compress(BIG.encode()),
+            headers={"Content-Encoding": "gzip"},
+        )
+
+    @app.get("/image")
+    def image():
+        return PlainTextResponse(BIG, media_type="image/png")
+
+    return app
+
+
+async def fetch(app, path, accept_encoding="gzip"):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        return await client.get(
+            path, headers={"Accept-Encoding": accept_encoding}
+        )
+
+
+def test_choose_encoding():
+    encodings = ["br", "zstd", "gzip"]
+    assert choose_encoding("gzip, deflate", encodings) == "gzip"
+    assert choose_encoding("gzip, br", encodings) == "br"
+    assert choose_encoding("br;q=0.5, gzip", encodings) == "gzip"
+    assert choose_encoding("zstd;q=0.8, gzip;q=0.8", encodings) == "zstd"
+    assert choose_encoding("*", encodings) == "br"
+    assert choose_encoding("gzip;q=0, *;q=0.1", ["gzip"]) is None
+    assert choose_encoding("identity", encodings) is None
+    assert choose_encoding("", encodings) is None
+
+
+@pytest.mark.asyncio
+async def test_compresses_large_responses():
+    response = await fetch(build_app(), "/big")
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) < len(BIG) / 10
+    assert response.text == BIG
+    # Test the strong tag is weakened for the compressed representation
+    assert response.headers["ETag"] == 'W/"1-2-abc"'
+
+
+@pytest.mark.asyncio
+async def test_passes_through_when_not_worth_it():
+    app = build_app()
+    response = await fetch(app, "/small")
+    assert "Content-Encoding" not in response.headers
+    assert response.text == "tiny"
+
+    response = await fetch(app, "/big", accept_encoding="identity")
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["ETag"] == '"1-2-abc"'
+
+    for path in ("/image", "/encoded"):
+        response = await fetch(app, path, accept_encoding="br, gzip")
+        assert response.text == BIG
+
+
+@pytest.mark.asyncio
+async def test_minimum_size():
+    response = await fetch(build_app(minimum_size=2), "/small")
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.text == "tiny"
+
+
+@pytest.mark.asyncio
+async def test_streams_large_responses():
+    response = await fetch(build_app(), "/stream")
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert response.text == BIG * 5
+
+
+class ReverseEncoder:
+    # Stand-in for an optional codec: "compresses" by reversing chunks
+    name = "reverse"
+
+    def compress(self, data):
+        return data[::-1]
+
+    def flush(self):
+        return b"!"
+
+
+@pytest.mark.asyncio
+async def test_custom_encoders():
+    app = build_app(encoders={"reverse": ReverseEncoder, "gzip": GzipEncoder})
+    response = await fetch(app, "/big", accept_encoding="gzip, reverse")
+    assert response.headers["Content-Encoding"] == "reverse"
+    assert response.content == BIG.encode()[::-1] + b"!"
+
+
+def test_gzip_always_available():
+    assert "gzip" in AVAILABLE_ENCODERS
+    encoder = GzipEncoder(level=1)
+    data = encoder.compress(BIG.encode()) + encoder.flush()
+    assert gzip.decompress(data) == BIG.encode()
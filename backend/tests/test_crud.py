@@ -1,6 +1,8 @@
 import pytest
+import pytest_asyncio
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
@@ -13,7 +15,23 @@ from app.crud import (
     create_note,
     update_note,
     delete_note,
+    build_search_match,
+    search_notes,
+    aget_note,
+    aget_notes,
+    aget_note_rows,
+    note_columns,
+    summary_columns,
+    acreate_note,
+    aupdate_note,
+    adelete_note,
+    acreate_notes,
+    aupdate_notes,
+    adelete_notes,
+    asearch_notes,
+    aget_changes,
 )
+from app.migrations import migrate, apply_migrations
 
 # Setup test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -208,3 +226,339 @@ def test_delete_note(db, test_user, test_note):
         db.query(models.Note).filter(models.Note.id == another_note.id).first()
     )
     assert db_note is not None
+
+
+def test_get_notes_after_id(db, test_user, test_note):
+    for i in range(1, 6):
+        note_data = schemas.NoteCreate(
+            title=f"Note {i}", content=f"Content {i}"
+        )
+        create_note(db, note_data, test_user.id)
+
+    # Test keyset paging walks every note exactly once
+    first_page = get_notes(db, test_user.id, limit=4)
+    assert len(first_page) == 4
+    assert first_page[0].id == test_note.id
+
+    second_page = get_notes(
+        db, test_user.id, limit=4, after_id=first_page[-1].id
+    )
+    assert len(second_page) == 2
+    assert second_page[0].id > first_page[-1].id
+    assert second_page[-1].title == "Note 5"
+
+    # Test paging past the last note
+    empty_page = get_notes(
+        db, test_user.id, limit=4, after_id=second_page[-1].id
+    )
+    assert len(empty_page) == 0
+
+
+@pytest.fixture
+def migrated_db():
+    # FTS5 tables and triggers only exist in the migrated schema
+    migrated_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    migrate(migrated_engine)
+    db = sessionmaker(bind=migrated_engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        migrated_engine.dispose()
+
+
+def test_build_search_match():
+    assert build_search_match("hello world", 3) == (
+        'owner:"u3" AND {title content}: ("hello" "world")'
+    )
+    assert build_search_match('say "hi" pre*', 3) == (
+        'owner:"u3" AND {title content}: ("say" """hi""" "pre"*)'
+    )
+    assert build_search_match("   ", 3) is None
+    assert build_search_match("*", 3) is None
+
+
+def test_search_notes(migrated_db):
+    db = migrated_db
+    owner = models.User(username="searcher", hashed_password="fake")
+    other = models.User(username="stranger", hashed_password="fake")
+    db.add_all([owner, other])
+    db.commit()
+
+    kept = create_note(
+        db, schemas.NoteCreate(title="Trip", content="Pack the tent"), owner.id
+    )
+    edited = create_note(
+        db, schemas.NoteCreate(title="Old", content="nothing"), owner.id
+    )
+    removed = create_note(
+        db, schemas.NoteCreate(title="Tent", content="buy one"), owner.id
+    )
+    create_note(
+        db, schemas.NoteCreate(title="Tent", content="theirs"), other.id
+    )
+
+    # Test the index follows create, update and delete
+    update_note(
+        db,
+        edited.id,
+        schemas.NoteCreate(title="Camping", content="tent pegs"),
+        owner.id,
+    )
+    delete_note(db, removed.id, owner.id)
+
+    results = search_notes(db, owner.id, "tent")
+    assert {r["id"] for r in results} == {kept.id, edited.id}
+    assert all("<mark>tent</mark>" in r["snippet"] for r in results)
+    assert search_notes(db, owner.id, "nothing") == []
+
+    # Test prefix queries and limits
+    assert len(search_notes(db, owner.id, "te*", limit=1)) == 1
+    assert search_notes(db, owner.id, "") == []
+
+
+def test_search_notes_escapes_html(migrated_db):
+    db = migrated_db
+    owner = models.User(username="searcher", hashed_password="fake")
+    db.add(owner)
+    db.commit()
+    create_note(
+        db,
+        schemas.NoteCreate(
+            title="<b>tent</b>",
+            content="a <script>alert('tent')</script> & more",
+        ),
+        owner.id,
+    )
+
+    [result] = search_notes(db, owner.id, "tent")
+    assert result["title"] == "&lt;b&gt;<mark>tent</mark>&lt;/b&gt;"
+    assert "<script>" not in result["snippet"]
+    assert "&lt;script&gt;alert(&#x27;<mark>tent</mark>&#x27;)" in (
+        result["snippet"]
+    )
+    assert "&amp; more" in result["snippet"]
+
+
+@pytest_asyncio.fixture
+async def async_db():
+    async_engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:", poolclass=StaticPool
+    )
+    async with async_engine.begin() as conn:
+        await conn.run_sync(apply_migrations)
+    db = async_sessionmaker(async_engine, expire_on_commit=False)()
+    try:
+        yield db
+    finally:
+        await db.close()
+        await async_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_async_crud(async_db):
+    db = async_db
+    user = models.User(username="asyncuser", hashed_password="fake")
+    other = models.User(username="asyncother", hashed_password="fake")
+    db.add_all([user, other])
+    await db.commit()
+
+    # Test create and get
+    note = await acreate_note(
+        db, schemas.NoteCreate(title="Async", content="Body"), user.id
+    )
+    assert note.id is not None
+    assert note.owner_id == user.id
+    fetched = await aget_note(db, note.id, user.id)
+    assert fetched.title == "Async"
+    assert await aget_note(db, note.id, other.id) is None
+
+    # Test paging, both offset and keyset
+    for i in range(3):
+        await acreate_note(
+            db, schemas.NoteCreate(title=f"N{i}", content="x"), user.id
+        )
+    notes = await aget_notes(db, user.id, skip=1, limit=2)
+    assert [n.title for n in notes] == ["N0", "N1"]
+    notes = await aget_notes(db, user.id, after_id=notes[-1].id)
+    assert [n.title for n in notes] == ["N2"]
+
+    # Test plain rows match the schema, field order included
+    rows = await aget_note_rows(db, user.id, skip=1, limit=2)
+    assert rows == [
+        schemas.Note.from_orm(n).dict()
+        for n in await aget_notes(db, user.id, skip=1, limit=2)
+    ]
+    assert list(rows[0]) == list(schemas.Note.__fields__)
+    assert await aget_note_rows(db, other.id) == []
+
+    # Test update
+    updated = await aupdate_note(
+        db, note.id, schemas.NoteCreate(title="Renamed", content="y"), user.id
+    )
+    assert updated.title == "Renamed"
+    assert await aupdate_note(
+        db, note.id, schemas.NoteCreate(title="No", content="n"), other.id
+    ) is None
+
+    # Test search
+    results = await asearch_notes(db, user.id, "renamed")
+    assert [r["id"] for r in results] == [note.id]
+
+    # Test delete
+    assert await adelete_note(db, note.id, other.id) is None
+    deleted = await adelete_note(db, note.id, user.id)
+    assert deleted.id == note.id
+    assert await aget_note(db, note.id, user.id) is None
+
+
+@pytest.mark.asyncio
+async def test_batch_notes(async_db):
+    db = async_db
+    user = models.User(username="batcher", hashed_password="fake")
+    other = models.User(username="outsider", hashed_password="fake")
+    db.add_all([user, other])
+    await db.commit()
+    user_id, other_id = user.id, other.id
+
+    # Test bulk create keeps input order
+    created = await acreate_notes(
+        db,
+        [
+            schemas.NoteCreate(title=f"Bulk {i}", content=f"Body {i}")
+            for i in range(3)
+        ],
+        user_id,
+    )
+    assert [r["status"] for r in created] == ["created"] * 3
+    assert [r["note"].title for r in created] == ["Bulk 0", "Bulk 1", "Bulk 2"]
+    ids = [r["id"] for r in created]
+    foreign = (await acreate_note(
+        db, schemas.NoteCreate(title="Theirs", content="x"), other_id
+    )).id
+
+    # Test bulk update skips notes the user does not own
+    updated = await aupdate_notes(
+        db,
+        [
+            schemas.NoteBatchUpdateItem(id=ids[0], title="New", content="n"),
+            schemas.NoteBatchUpdateItem(id=foreign, title="X", content="x"),
+        ],
+        user_id,
+    )
+    assert [r["status"] for r in updated] == ["updated", "not_found"]
+    assert updated[0]["note"]["created_at"] == created[0]["note"].created_at
+    db.expire_all()
+    assert (await aget_note(db, ids[0], user_id)).title == "New"
+    assert (await aget_note(db, foreign, other_id)).title == "Theirs"
+    assert (await asearch_notes(db, user_id, "new"))[0]["id"] == ids[0]
+
+    # Test bulk delete
+    deleted = await adelete_notes(db, [ids[1], 999, foreign], user_id)
+    assert [r["status"] for r in deleted] == [
+        "deleted", "not_found", "not_found"
+    ]
+    assert deleted[0]["note"].title == "Bulk 1"
+    assert [n.id for n in await aget_notes(db, user_id)] == [ids[0], ids[2]]
+    assert await aget_note(db, foreign, other_id) is not None
+
+
+@pytest.mark.asyncio
+async def test_note_projections(async_db):
+    db = async_db
+    user = models.User(username="projector", hashed_password="fake")
+    db.add(user)
+    await db.commit()
+    note = await acreate_note(
+        db, schemas.NoteCreate(title="Long", content="word " * 100), user.id
+    )
+
+    rows = await aget_note_rows(db, user.id, columns=note_columns(["title"]))
+    assert rows == [{"title": "Long", "id": note.id}]
+    rows = await aget_note_rows(
+        db, user.id, columns=note_columns(["owner_id", "content", "id"])
+    )
+    assert list(rows[0]) == ["content", "id", "owner_id"]
+    with pytest.raises(ValueError, match="Unknown fields: secret"):
+        note_columns(["title", "secret"])
+
+    rows = await aget_note_rows(db, user.id, columns=summary_columns(12))
+    assert rows == [
+        {"id": note.id, "title": "Long", "excerpt": "word word wo"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_changes(async_db):
+    db = async_db
+    user = models.User(username="syncer", hashed_password="fake")
+    db.add(user)
+    await db.commit()
+    notes = [
+        result["note"] for result in await acreate_notes(
+            db,
+            [schemas.NoteCreate(title=f"N{i}", content="x") for i in range(3)],
+            user.id,
+        )
+    ]
+    assert notes[0].created_at is not None
+    assert notes[0].updated_at == notes[0].created_at
+
+    changes = await aget_changes(db, user.id)
+    assert [n.id for n in changes["upserts"]] == [n.id for n in notes]
+    assert changes["deletes"] == []
+    assert changes["has_more"] is False
+    token = changes["token"]
+
+    assert (await aget_changes(db, user.id, since=token))["upserts"] == []
+
+    await aupdate_note(
+        db, notes[1].id, schemas.NoteCreate(title="Edited", content="x"),
+        user.id,
+    )
+    await adelete_notes(db, [notes[0].id, notes[2].id], user.id)
+    changes = await aget_changes(db, user.id, since=token)
+    assert [n.title for n in changes["upserts"]] == ["Edited"]
+    assert changes["deletes"] == [notes[0].id, notes[2].id]
+
+    page = await aget_changes(db, user.id, since=token, limit=2)
+    assert page["has_more"] is True
+    assert [n.id for n in page["upserts"]] == [notes[1].id]
+    assert page["deletes"] == [notes[0].id]
+    page = await aget_changes(db, user.id, since=page["token"], limit=2)
+    assert page["has_more"] is False
+    assert page["deletes"] == [notes[2].id]
+    assert page["token"] == changes["token"]
+
+    # SQLite reuses the highest rowid once it is free again
+    reused = await acreate_note(
+        db, schemas.NoteCreate(title="Again", content="x"), user.id
+    )
+    assert reused.id == notes[2].id
+    changes = await aget_changes(db, user.id, since=token)
+    assert [n.id for n in changes["upserts"]] == [notes[1].id, reused.id]
+    assert changes["deletes"] == [notes[0].id]
+
+
+@pytest.mark.asyncio
+async def test_tombstones_are_per_owner(async_db):
+    db = async_db
+    first = models.User(username="first", hashed_password="fake")
+    second = models.User(username="second", hashed_password="fake")
+    db.add_all([first, second])
+    await db.commit()
+    note = schemas.NoteCreate(title="T", content="x")
+
+    deleted = (await acreate_note(db, note, first.id)).id
+    await adelete_note(db, deleted, first.id)
+    # SQLite hands the freed id to the next note, whoever owns it
+    reused = (await acreate_note(db, note, second.id)).id
+    assert reused == deleted
+    await adelete_notes(db, [reused], second.id)
+
+    assert (await aget_changes(db, first.id))["deletes"] == [deleted]
+    assert (await aget_changes(db, second.id))["deletes"] == [reused]
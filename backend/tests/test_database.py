@@ -0,0 +1,94 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import database
+from app.database import (
+    to_async_url,
+    engine_options,
+    create_db_engine,
+    create_async_db_engine,
+    get_db,
+)
+
+
+def test_to_async_url():
+    assert to_async_url("sqlite:///./notes.db") == (
+        "sqlite+aiosqlite:///./notes.db"
+    )
+    assert to_async_url("sqlite+aiosqlite:///./notes.db") == (
+        "sqlite+aiosqlite:///./notes.db"
+    )
+    assert to_async_url("mysql://u@db/notes") == "mysql://u@db/notes"
+
+
+@pytest.mark.parametrize("url", [
+    "postgresql://u:secret@db/notes", "mysql://u@db/notes",
+])
+def test_other_backends_rejected(url):
+    with pytest.raises(ValueError, match="Unsupported database backend"):
+        create_db_engine(url)
+    with pytest.raises(ValueError, match="Unsupported database backend"):
+        create_async_db_engine(url)
+
+
+def test_engine_options_file_database():
+    options = engine_options("sqlite:///./notes.db")
+    assert options["connect_args"] == {"check_same_thread": False}
+    assert options["pool_size"] == database.DB_POOL_SIZE
+    assert options["max_overflow"] == database.DB_MAX_OVERFLOW
+    assert options["pool_timeout"] == database.DB_POOL_TIMEOUT
+
+
+def test_engine_options_memory_database():
+    options = engine_options("sqlite:///:memory:")
+    assert "pool_size" not in options
+
+
+def test_sqlite_pragmas_applied(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'pragmas.db'}")
+    try:
+        with engine.connect() as conn:
+            pragma = conn.exec_driver_sql
+            assert pragma("PRAGMA journal_mode").scalar() == "wal"
+            # NORMAL
+            assert pragma("PRAGMA synchronous").scalar() == 1
+            assert pragma("PRAGMA busy_timeout").scalar() == (
+                database.SQLITE_PRAGMAS["busy_timeout"]
+            )
+            assert pragma("PRAGMA cache_size").scalar() == (
+                database.SQLITE_PRAGMAS["cache_size"]
+            )
+    finally:
+        engine.dispose()
+
+
+def test_sqlite_pragmas_can_be_disabled(tmp_path):
+    engine = create_db_engine(
+        f"sqlite:///{tmp_path / 'default.db'}", pragmas={}
+    )
+    try:
+        with engine.connect() as conn:
+            mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+            assert mode == "delete"
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_async_engine_pragmas_applied(tmp_path):
+    engine = create_async_db_engine(f"sqlite:///{tmp_path / 'async.db'}")
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(text("PRAGMA journal_mode"))
+            assert result.scalar() == "wal"
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_get_db_yields_async_session():
+    generator = get_db()
+    db = await generator.__anext__()
+    assert isinstance(db, AsyncSession)
+    await generator.aclose()
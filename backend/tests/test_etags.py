@@ -0,0 +1,20 @@
+from app.etags import etag_matches, make_etag
+
+
+def test_make_etag():
+    etag = make_etag(1, 5, "list", 0, 100, None)
+    assert etag.startswith('"1-5-') and etag.endswith('"')
+    assert etag == make_etag(1, 5, "list", 0, 100, None)
+    assert etag != make_etag(1, 6, "list", 0, 100, None)
+    assert etag != make_etag(2, 5, "list", 0, 100, None)
+    assert etag != make_etag(1, 5, "list", 0, 10, None)
+
+
+def test_etag_matches():
+    etag = make_etag(1, 5)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+    assert not etag_matches('"other"', etag)
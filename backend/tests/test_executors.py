@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.executors import BoundedExecutor, ExecutorSaturated
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_runs_off_the_event_loop():
+    executor = BoundedExecutor(workers=2, max_queue=2, name="test")
+    try:
+        thread_name = await executor.run(
+            lambda: threading.current_thread().name
+        )
+        assert thread_name.startswith("test")
+        assert await executor.run(pow, 2, 10) == 1024
+        assert executor.in_flight == 0
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_rejects_when_saturated():
+    executor = BoundedExecutor(workers=1, max_queue=1, name="test")
+    release = threading.Event()
+    try:
+        running = asyncio.ensure_future(executor.run(release.wait))
+        queued = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0)
+        assert executor.stats()["in_flight"] == 2
+        assert executor.stats()["queued"] == 1
+
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(release.wait)
+        assert executor.stats()["rejected"] == 1
+
+        release.set()
+        assert await running is True
+        assert await queued is True
+        assert executor.in_flight == 0
+    finally:
+        release.set()
+        executor.shutdown()
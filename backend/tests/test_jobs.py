@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from app.jobs import FAILED, SUCCEEDED, JobQueue, JobQueueFull
+
+
+async def wait_for(queue, job):
+    for _ in range(100):
+        if queue.get(job.id).status in (SUCCEEDED, FAILED):
+            return queue.get(job.id)
+        await asyncio.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+async def double(value):
+    return value * 2
+
+
+async def fail():
+    raise ValueError("boom")
+
+
+@pytest.mark.asyncio
+async def test_job_queue_runs_jobs():
+    queue = JobQueue(workers=2, max_queue=10)
+    try:
+        job = queue.submit(1, double, 21)
+        assert job.owner_id == 1
+        assert (await wait_for(queue, job)).result == 42
+        assert job.finished_at >= job.created_at
+
+        failed = await wait_for(queue, queue.submit(1, fail))
+        assert failed.status == FAILED
+        assert failed.error == "boom"
+        assert queue.stats()["succeeded"] == 1
+        assert queue.stats()["failed"] == 1
+        assert queue.stats()["retained_results"] == 2
+    finally:
+        await queue.stop()
+    assert queue.get("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_job_queue_rejects_when_full():
+    queue = JobQueue(workers=1, max_queue=1)
+    release = asyncio.Event()
+    try:
+        running = queue.submit(1, release.wait)
+        await asyncio.sleep(0)
+        queue.submit(1, release.wait)
+
+        stats = queue.stats()
+        assert stats["busy"] == 1
+        assert stats["utilization"] == 1.0
+        assert stats["queue_depth"] == 1
+
+        with pytest.raises(JobQueueFull):
+            queue.submit(1, release.wait)
+        assert queue.stats()["rejected"] == 1
+
+        release.set()
+        assert (await wait_for(queue, running)).result is True
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_job_results_expire():
+    queue = JobQueue(workers=1, max_queue=1, result_ttl=0.05)
+    try:
+        job = await wait_for(queue, queue.submit(1, double, 1))
+        assert queue.get(job.id) is job
+        await asyncio.sleep(0.1)
+        assert queue.get(job.id) is None
+    finally:
+        await queue.stop()
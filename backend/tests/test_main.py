@@ -1,31 +1,42 @@
+import os
+import subprocess
+import sys
+import time
+
 import pytest
+from unittest.mock import patch
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-from app.main import app, get_db
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import profiling, ratelimit, services
+from app.auth import user_cache
+from app.etags import make_etag
+from app.main import app, create_app, get_db
+from app.migrations import migrate
 from app.models import Base
 
+from .fake_translate import FakeTranslateServer
+
 # Test database setup
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
-TestingSessionLocal = sessionmaker(
-    autocommit=False, autoflush=False, bind=engine
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db")
+TestingSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
 )
 
 # Create tables
-Base.metadata.create_all(bind=engine)
+migrate(engine)
+profiling.instrument_engine(async_engine.sync_engine)
 
 
 # Dependency override
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 app.dependency_overrides[get_db] = override_get_db
@@ -62,7 +73,7 @@ def test_user(client, test_user_data):
 def auth_token(client, test_user, test_user_data):
     response = client.post(
         "/token",
-        data={
+        json={
             "username": test_user_data["username"],
             "password": test_user_data["password"],
         },
@@ -91,10 +102,12 @@ def test_note(client, auth_headers, test_note_data):
 @pytest.fixture(autouse=True)
 def cleanup_db():
     yield
-    # Clear all data after each test
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    # Clear all data after each test, keeping the migrated schema
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    user_cache.clear()
+    ratelimit.limiter.store.clear()
 
 
 def test_login_for_access_token(client, test_user, test_user_data):
@@ -129,6 +142,111 @@ def test_login_for_access_token(client, test_user, test_user_data):
     assert response.status_code == 401
 
 
+def login(client, test_user_data):
+    response = client.post("/token", json=test_user_data)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_refresh_token(client, test_user, test_user_data):
+    tokens = login(client, test_user_data)
+    assert tokens["expires_in"] == 30 * 60
+    assert tokens["refresh_token"]
+
+    with patch("app.auth.verify_password") as verify_password:
+        response = client.post(
+            "/token/refresh",
+            json={"refresh_token": tokens["refresh_token"]},
+        )
+    assert response.status_code == 200
+    # No password check on refresh
+    verify_password.assert_not_called()
+    refreshed = response.json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    response = client.get(
+        "/users/me",
+        headers={"Authorization": f"Bearer {refreshed['access_token']}"},
+    )
+    assert response.status_code == 200
+    assert response.json()["username"] == test_user_data["username"]
+
+    response = client.post(
+        "/token/refresh", json={"refresh_token": "not-a-token"}
+    )
+    assert response.status_code == 401
+
+
+def test_refresh_token_reuse_revokes_family(client, test_user,
+                                            test_user_data):
+    first = login(client, test_user_data)["refresh_token"]
+    other = login(client, test_user_data)["refresh_token"]
+    second = client.post(
+        "/token/refresh", json={"refresh_token": first}
+    ).json()["refresh_token"]
+
+    # The rotated token is used again: it and its successor stop working
+    response = client.post("/token/refresh", json={"refresh_token": first})
+    assert response.status_code == 401
+    response = client.post("/token/refresh", json={"refresh_token": second})
+    assert response.status_code == 401
+    # Tokens from other logins are unaffected
+    response = client.post("/token/refresh", json={"refresh_token": other})
+    assert response.status_code == 200
+
+
+def test_revoke_refresh_token(client, test_user, test_user_data):
+    first = login(client, test_user_data)["refresh_token"]
+    second = client.post(
+        "/token/refresh", json={"refresh_token": first}
+    ).json()["refresh_token"]
+
+    response = client.post("/token/revoke", json={"refresh_token": first})
+    assert response.status_code == 204
+    response = client.post("/token/refresh", json={"refresh_token": second})
+    assert response.status_code == 401
+    # Unknown tokens are ignored
+    response = client.post("/token/revoke", json={"refresh_token": "x"})
+    assert response.status_code == 204
+
+
+def test_refresh_clears_expired_tokens(client, test_user, test_user_data):
+    def refresh_tokens():
+        with engine.connect() as conn:
+            return conn.execute(
+                text("SELECT token_hash FROM refresh_tokens")
+            ).scalars().all()
+
+    token = login(client, test_user_data)["refresh_token"]
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO refresh_tokens "
+            "(token_hash, user_id, family, created_at, expires_at) "
+            "VALUES ('old', :user_id, 'old', '2020-01-01', '2020-01-31')"
+        ), {"user_id": test_user["id"]})
+
+    # Logging in only adds its own token
+    login(client, test_user_data)
+    assert "old" in refresh_tokens()
+    response = client.post("/token/refresh", json={"refresh_token": token})
+    assert response.status_code == 200
+    assert "old" not in refresh_tokens()
+
+
+def test_login_rate_limited(client):
+    # Over the limit (RATE_LIMIT_AUTH in pytest.ini), failed logins are
+    # turned away before any lookup
+    credentials = {"username": "nobody", "password": "guess"}
+    statuses = [
+        client.post("/token", json=credentials).status_code
+        for _ in range(6)
+    ]
+    assert statuses == [401] * 5 + [429]
+    with profiling.assert_max_queries(0):
+        response = client.post("/token", json=credentials)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
 def test_create_user(client):
     # Test successful user creation
     user_data = {"username": "newuser", "password": "newpass"}
@@ -149,9 +267,15 @@ def test_unauthenticated_access_to_protected_routes(client):
     protected_routes = [
         ("POST", "/notes/", {}),
         ("GET", "/notes/", None),
+        ("GET", "/notes/changes", None),
+        ("GET", "/notes/1", None),
         ("PUT", "/notes/1", {}),
         ("DELETE", "/notes/1", None),
+        ("POST", "/notes/batch", {"notes": []}),
         ("POST", "/translate/", {"text": "hello"}),
+        ("POST", "/translate/batch", {"texts": ["hello"]}),
+        ("POST", "/translate/jobs", {"text": "hello"}),
+        ("GET", "/translate/jobs/1", None),
         ("GET", "/users/me", None),
     ]
 
@@ -167,3 +291,461 @@ def test_unauthenticated_access_to_protected_routes(client):
 
         assert response.status_code == 401
         assert "Not authenticated" in response.json()["detail"]
+
+
+def test_read_notes_cursor_pagination(client, auth_headers):
+    for i in range(5):
+        response = client.post(
+            "/notes/",
+            json={"title": f"Note {i}", "content": f"Content {i}"},
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+
+    # Test first page hands out a cursor
+    response = client.get("/notes/?limit=3", headers=auth_headers)
+    assert response.status_code == 200
+    assert [n["title"] for n in response.json()] == [
+        "Note 0", "Note 1", "Note 2"
+    ]
+    cursor = response.headers["X-Next-Cursor"]
+
+    # Test following the cursor returns the rest without a new cursor
+    response = client.get(
+        f"/notes/?limit=3&cursor={cursor}", headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert [n["title"] for n in response.json()] == ["Note 3", "Note 4"]
+    assert "X-Next-Cursor" not in response.headers
+
+    # Test skip/limit still work for older clients
+    response = client.get("/notes/?skip=4&limit=3", headers=auth_headers)
+    assert [n["title"] for n in response.json()] == ["Note 4"]
+
+    # Test malformed cursor
+    response = client.get("/notes/?cursor=garbage", headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_search_notes(client, auth_headers):
+    notes = [
+        {"title": "Groceries", "content": "Buy milk, eggs and bread"},
+        {"title": "Milk tasting", "content": "Compare oat and cow milk"},
+        {"title": "Work", "content": "Finish the quarterly report"},
+    ]
+    for note in notes:
+        response = client.post("/notes/", json=note, headers=auth_headers)
+        assert response.status_code == 200
+
+    # Test ranked, highlighted results
+    response = client.get("/notes/search?q=milk", headers=auth_headers)
+    assert response.status_code == 200
+    results = response.json()
+    assert len(results) == 2
+    assert results[0]["title"] == "<mark>Milk</mark> tasting"
+    assert "<mark>milk</mark>" in results[1]["snippet"]
+
+    # Test other users cannot see the notes
+    client.post("/users/", json={"username": "other", "password": "pass"})
+    token = client.post(
+        "/token", json={"username": "other", "password": "pass"}
+    ).json()["access_token"]
+    response = client.get(
+        "/notes/search?q=milk",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+
+    # Test a query is required
+    response = client.get("/notes/search", headers=auth_headers)
+    assert response.status_code == 422
+
+
+def test_batch_notes(client, auth_headers):
+    # Test batch create
+    response = client.post(
+        "/notes/batch",
+        json={"notes": [
+            {"title": f"Batch {i}", "content": f"Body {i}"} for i in range(3)
+        ]},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    created = response.json()
+    assert [r["status"] for r in created] == ["created"] * 3
+    assert [r["note"]["title"] for r in created] == [
+        "Batch 0", "Batch 1", "Batch 2"
+    ]
+    ids = [r["id"] for r in created]
+
+    # Test batch update
+    response = client.put(
+        "/notes/batch",
+        json={"notes": [
+            {"id": ids[0], "title": "Changed", "content": "New body"},
+            {"id": 9999, "title": "Missing", "content": "Nope"},
+        ]},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()] == ["updated", "not_found"]
+    assert response.json()[0]["note"]["title"] == "Changed"
+    # The whole stored note comes back, as a GET would return it
+    stored = client.get(f"/notes/{ids[0]}", headers=auth_headers).json()
+    assert response.json()[0]["note"] == stored
+    assert stored["created_at"] is not None
+
+    # Test batch delete
+    response = client.request(
+        "DELETE",
+        "/notes/batch",
+        json={"ids": [ids[1], 9999]},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()] == ["deleted", "not_found"]
+
+    response = client.get("/notes/", headers=auth_headers)
+    assert [n["title"] for n in response.json()] == ["Changed", "Batch 2"]
+
+    # Test empty batches are rejected
+    response = client.post(
+        "/notes/batch", json={"notes": []}, headers=auth_headers
+    )
+    assert response.status_code == 422
+
+
+def test_translate(client, auth_headers):
+    with FakeTranslateServer() as upstream, \
+            patch.object(services, "TRANSLATE_API_URL", upstream.url), \
+            patch.object(services, "TRANSLATION_CACHE_ENABLED", False):
+        response = client.post(
+            "/translate/", json={"text": "hello"}, headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert response.json() == {"translated_text": "HELLO"}
+
+        upstream.fail = True
+        response = client.post(
+            "/translate/", json={"text": "hello"}, headers=auth_headers
+        )
+        assert response.status_code == 400
+        assert "Translation failed" in response.json()["detail"]
+
+
+def test_translate_batch(client, auth_headers):
+    ids = [
+        client.post(
+            "/notes/", json={"title": "t", "content": content},
+            headers=auth_headers,
+        ).json()["id"]
+        for content in ("first", "second")
+    ]
+    with FakeTranslateServer() as upstream, \
+            patch.object(services, "TRANSLATE_API_URL", upstream.url), \
+            patch.object(services, "TRANSLATION_CACHE_ENABLED", False):
+        response = client.post(
+            "/translate/batch", json={"texts": ["a", "b", "a"]},
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+        assert response.json() == {"translated_texts": ["A", "B", "A"]}
+        assert upstream.requests == [
+            {"q": ["a", "b"], "source": "en", "target": "ru"}
+        ]
+
+        response = client.post(
+            "/translate/batch", json={"note_ids": ids[::-1]},
+            headers=auth_headers,
+        )
+        assert response.json() == {"translated_texts": ["SECOND", "FIRST"]}
+
+        # Test notes that do not exist (or belong to others) are rejected
+        response = client.post(
+            "/translate/batch", json={"note_ids": [ids[0], 999999]},
+            headers=auth_headers,
+        )
+        assert response.status_code == 404
+
+    # Test exactly one of texts and note_ids is required
+    for payload in ({}, {"texts": ["a"], "note_ids": ids}, {"texts": []}):
+        response = client.post(
+            "/translate/batch", json=payload, headers=auth_headers
+        )
+        assert response.status_code == 422
+
+
+def test_translation_jobs(client, auth_headers):
+    with FakeTranslateServer() as upstream, \
+            patch.object(services, "TRANSLATE_API_URL", upstream.url), \
+            patch.object(services, "TRANSLATION_CACHE_ENABLED", False):
+        response = client.post(
+            "/translate/jobs", json={"text": "hello"}, headers=auth_headers
+        )
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] in ("queued", "running", "succeeded")
+
+        for _ in range(100):
+            job = client.get(
+                f"/translate/jobs/{job['id']}", headers=auth_headers
+            ).json()
+            if job["status"] not in ("queued", "running"):
+                break
+            time.sleep(0.01)
+        assert job["status"] == "succeeded"
+        assert job["result"] == "HELLO"
+
+    response = client.get("/translate/jobs/unknown", headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_read_notes_conditional_get(client, auth_headers, test_note):
+    response = client.get("/notes/", headers=auth_headers)
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    # Test a matching tag is answered without loading any notes
+    with patch("app.main.crud.aget_notes") as aget_notes:
+        response = client.get(
+            "/notes/", headers={**auth_headers, "If-None-Match": etag}
+        )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    aget_notes.assert_not_called()
+
+    # Test each page has its own tag
+    response = client.get(
+        "/notes/?limit=1", headers={**auth_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+
+    # Test any write invalidates the tag
+    client.put(
+        f"/notes/{test_note['id']}",
+        json={"title": "Changed", "content": "Changed"},
+        headers=auth_headers,
+    )
+    response = client.get(
+        "/notes/", headers={**auth_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["title"] == "Changed"
+    assert response.headers["ETag"] != etag
+
+
+def test_read_note(client, auth_headers, test_note):
+    url = f"/notes/{test_note['id']}"
+    response = client.get(url, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == test_note
+    etag = response.headers["ETag"]
+
+    response = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.post(
+        "/notes/", json={"title": "Other", "content": "x"},
+        headers=auth_headers,
+    )
+    response = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+
+    response = client.get("/notes/999999", headers=auth_headers)
+    assert response.status_code == 404
+    # Test a wildcard or a guessed tag does not hide a missing note
+    user_id, version, _ = etag.strip('"').split("-")
+    missing_etag = make_etag(int(user_id), int(version), "note", 999999)
+    for tag in ("*", missing_etag):
+        response = client.get(
+            "/notes/999999", headers={**auth_headers, "If-None-Match": tag}
+        )
+        assert response.status_code == 404
+    response = client.get(url, headers={**auth_headers, "If-None-Match": "*"})
+    assert response.status_code == 304
+
+
+def test_read_notes_fast_json(client, auth_headers):
+    client.post(
+        "/notes/batch",
+        json={"notes": [
+            {"title": f"Note {i}", "content": "é" * i} for i in range(3)
+        ]},
+        headers=auth_headers,
+    )
+    default = client.get("/notes/?limit=2", headers=auth_headers)
+    with patch("app.main.FAST_JSON_RESPONSES", True):
+        fast = client.get("/notes/?limit=2", headers=auth_headers)
+        response = client.get(
+            "/notes/?limit=2",
+            headers={**auth_headers, "If-None-Match": fast.headers["ETag"]},
+        )
+        assert response.status_code == 304
+
+    assert fast.status_code == 200
+    assert fast.json() == default.json()
+    for header in ("ETag", "X-Next-Cursor", "Cache-Control"):
+        assert fast.headers[header] == default.headers[header]
+
+
+def test_read_notes_projections(client, auth_headers, test_note):
+    response = client.get("/notes/?fields=title", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == [
+        {"title": test_note["title"], "id": test_note["id"]}
+    ]
+    projected_etag = response.headers["ETag"]
+
+    response = client.get("/notes/?view=summary", headers=auth_headers)
+    assert response.json() == [{
+        "id": test_note["id"],
+        "title": test_note["title"],
+        "excerpt": test_note["content"][:200],
+    }]
+    assert response.headers["ETag"] != projected_etag
+    assert client.get(
+        "/notes/", headers={**auth_headers, "If-None-Match": projected_etag}
+    ).status_code == 200
+
+    for query in ("fields=secret", "fields=title&view=summary"):
+        response = client.get(f"/notes/?{query}", headers=auth_headers)
+        assert response.status_code == 400
+    response = client.get("/notes/?view=compact", headers=auth_headers)
+    assert response.status_code == 422
+
+
+def test_read_note_changes(client, auth_headers, test_note):
+    response = client.get("/notes/changes", headers=auth_headers)
+    assert response.status_code == 200
+    changes = response.json()
+    assert [n["id"] for n in changes["upserts"]] == [test_note["id"]]
+    assert changes["upserts"][0]["updated_at"] is not None
+    assert changes["deletes"] == []
+    assert changes["has_more"] is False
+
+    client.delete(f"/notes/{test_note['id']}", headers=auth_headers)
+    response = client.get(
+        f"/notes/changes?since={changes['token']}", headers=auth_headers
+    )
+    assert response.json()["upserts"] == []
+    assert response.json()["deletes"] == [test_note["id"]]
+
+    for query in ("since=-1", "limit=0", "limit=1001"):
+        response = client.get(f"/notes/changes?{query}", headers=auth_headers)
+        assert response.status_code == 422
+
+
+def test_unchanged_update_keeps_versions(client, auth_headers, test_note):
+    url = f"/notes/{test_note['id']}"
+    etag = client.get("/notes/", headers=auth_headers).headers["ETag"]
+    token = client.get("/notes/changes", headers=auth_headers).json()["token"]
+
+    # Saving the same text is not a change: nothing moves, and the cached
+    # listing and the change feed stay accurate
+    response = client.put(
+        url,
+        json={"title": test_note["title"], "content": test_note["content"]},
+        headers=auth_headers,
+    )
+    assert response.json()["updated_at"] == test_note["updated_at"]
+    response = client.get(
+        "/notes/", headers={**auth_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    changes = client.get(
+        f"/notes/changes?since={token}", headers=auth_headers
+    ).json()
+    assert changes == {
+        "token": token, "has_more": False, "upserts": [], "deletes": [],
+    }
+
+    response = client.put(
+        url, json={"title": "Edited", "content": test_note["content"]},
+        headers=auth_headers,
+    )
+    updated_at = response.json()["updated_at"]
+    assert updated_at != test_note["updated_at"]
+    response = client.get(
+        "/notes/", headers={**auth_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["updated_at"] == updated_at
+    changes = client.get(
+        f"/notes/changes?since={token}", headers=auth_headers
+    ).json()
+    assert [n["updated_at"] for n in changes["upserts"]] == [updated_at]
+
+
+def test_metrics(client, auth_headers, test_note):
+    client.get(f"/notes/{test_note['id']}", headers=auth_headers)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert (
+        'http_requests_total{method="GET",route="/notes/{note_id}",'
+        'status="200"}'
+    ) in response.text
+    assert "http_request_duration_seconds_bucket" in response.text
+    assert "password_hash_duration_seconds_count" in response.text
+    assert "user_cache_hits" in response.text
+    assert "translation_jobs_queue_depth" in response.text
+
+
+def test_create_app():
+    # Each call builds an independent app with the same routes
+    other = create_app()
+    assert other is not app
+    assert (
+        {route.path for route in other.routes}
+        == {route.path for route in app.routes}
+    )
+    other.dependency_overrides[get_db] = override_get_db
+    assert get_db not in create_app().dependency_overrides
+
+
+def test_import_leaves_translation_stack_unloaded():
+    # A fresh interpreter, since this one has loaded everything already
+    script = (
+        "import sys, app.main; "
+        "print(sorted({'app.services', 'app.jobs', 'httpx'} "
+        "& set(sys.modules)))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        check=True, capture_output=True, text=True,
+    ).stdout
+    assert output.strip() == "[]"
+
+
+def test_query_counts(client, auth_headers, test_note, test_user_data):
+    note_url = f"/notes/{test_note['id']}"
+    payload = {"title": "Counted", "content": "Body"}
+    # Test the user is cached after the first authenticated request
+    client.get("/users/me", headers=auth_headers)
+    budgets = [
+        ("GET", "/notes/", 2),
+        ("GET", note_url, 2),
+        ("GET", "/notes/changes", 3),
+        ("POST", "/notes/", 2),
+        ("PUT", note_url, 2),
+        ("DELETE", note_url, 5),
+    ]
+    for method, url, limit in budgets:
+        with profiling.assert_max_queries(limit):
+            response = client.request(
+                method, url, headers=auth_headers,
+                json=payload if method in ("POST", "PUT") else None,
+            )
+        assert response.status_code == 200
+
+    refresh_token = login(client, test_user_data)["refresh_token"]
+    with profiling.assert_max_queries(4):
+        response = client.post(
+            "/token/refresh", json={"refresh_token": refresh_token}
+        )
+    assert response.status_code == 200
@@ -0,0 +1,95 @@
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from sqlalchemy import text
+
+from app import metrics
+from app.database import create_db_engine
+from app.metrics import MetricsMiddleware, Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram(
+        "work_seconds", "Work", ("kind",), buckets=(0.1, 1.0)
+    )
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, ("a",))
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == [
+        "# HELP work_seconds Work", "# TYPE work_seconds histogram"
+    ]
+    assert lines[2:] == [
+        'work_seconds_bucket{kind="a",le="0.1"} 2',
+        'work_seconds_bucket{kind="a",le="1"} 3',
+        'work_seconds_bucket{kind="a",le="+Inf"} 4',
+        'work_seconds_sum{kind="a"} 3.65',
+        'work_seconds_count{kind="a"} 4',
+    ]
+    assert histogram.count(("a",)) == 4
+
+
+def test_counters_gauges_and_collectors():
+    registry = Registry()
+    counter = registry.counter("hits_total", "Hits", ("path",))
+    gauge = registry.gauge("busy", "Busy")
+    counter.inc(('say "hi"\n',))
+    counter.inc(('say "hi"\n',), 2)
+    gauge.inc()
+    gauge.dec()
+    registry.register_collector(
+        "cache", "Cache", lambda: {"size": 3, "hit_rate": 0.5, "name": "x"}
+    )
+
+    output = registry.render()
+    assert 'hits_total{path="say \\"hi\\"\\n"} 3' in output
+    assert "busy 0" in output
+    assert "cache_size 3" in output
+    assert "cache_hit_rate 0.5" in output
+    assert "cache_name" not in output
+
+
+@pytest.mark.asyncio
+async def test_middleware_labels_route_templates():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+
+    @app.get("/metrics-test/{item_id}")
+    def read_item(item_id: int):
+        if item_id == 0:
+            raise HTTPException(status_code=404)
+        return {"id": item_id}
+
+    route = ("GET", "/metrics-test/{item_id}")
+    before = metrics.REQUEST_DURATION.count(route)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        for item_id in (1, 2, 0):
+            await client.get(f"/metrics-test/{item_id}")
+        await client.get("/metrics-test")
+
+    assert metrics.REQUEST_DURATION.count(route) == before + 3
+    assert metrics.REQUESTS.get(route + ("200",)) >= 2
+    assert metrics.REQUESTS.get(route + ("404",)) >= 1
+    assert metrics.REQUESTS.get(
+        ("GET", metrics.UNMATCHED_ROUTE, "404")
+    ) >= 1
+    assert metrics.REQUESTS_IN_FLIGHT.get(route) == 0
+
+
+def test_instrument_engine(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    metrics.instrument_engine(engine)
+    selects = metrics.DB_STATEMENT_DURATION.count(("SELECT",))
+    checkouts = metrics.DB_POOL_CHECKOUT.count()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("  select 2"))
+    finally:
+        engine.dispose()
+
+    assert metrics.DB_STATEMENT_DURATION.count(("SELECT",)) == selects + 2
+    assert metrics.DB_POOL_CHECKOUT.count() == checkouts + 1
@@ -0,0 +1,261 @@
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models, schemas, crud
+from app.migrations import (
+    MIGRATIONS, migrate, current_version, LATEST_VERSION,
+)
+
+# Schema produced by the old ``create_all`` bootstrap
+BASELINE_SCHEMA = [
+    "CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR, "
+    "hashed_password VARCHAR, PRIMARY KEY (id))",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE TABLE notes (id INTEGER NOT NULL, title VARCHAR, content TEXT, "
+    "owner_id INTEGER, PRIMARY KEY (id), "
+    "FOREIGN KEY(owner_id) REFERENCES users (id))",
+    "CREATE INDEX ix_notes_title ON notes (title)",
+    "CREATE INDEX ix_notes_id ON notes (id)",
+]
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    migrate(engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def index_names(engine, table):
+    return {index["name"] for index in inspect(engine).get_indexes(table)}
+
+
+def test_migrate_fresh_database(engine):
+    assert migrate(engine) == LATEST_VERSION
+    assert {"users", "notes", "refresh_tokens"} <= set(
+        inspect(engine).get_table_names()
+    )
+    assert "ix_notes_owner_id_id" in index_names(engine, "notes")
+    assert "ix_notes_title" not in index_names(engine, "notes")
+
+
+def test_migrate_is_idempotent(engine):
+    migrate(engine)
+    assert migrate(engine) == LATEST_VERSION
+    with engine.connect() as conn:
+        versions = conn.execute(
+            text("SELECT version FROM schema_migrations")
+        ).scalars().all()
+    assert sorted(versions) == [m.version for m in MIGRATIONS]
+
+
+def test_migrate_existing_database_in_place(engine):
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(
+            text("INSERT INTO users (id, username) VALUES (1, 'olduser')")
+        )
+        conn.execute(
+            text(
+                "INSERT INTO notes (id, title, content, owner_id) "
+                "VALUES (1, 'Old', 'Old content', 1)"
+            )
+        )
+        assert current_version(conn) == 0
+
+    assert migrate(engine) == LATEST_VERSION
+    assert "ix_notes_owner_id_id" in index_names(engine, "notes")
+    assert "ix_notes_title" not in index_names(engine, "notes")
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT title, owner_id FROM notes")).one()
+        assert tuple(row) == ("Old", 1)
+        # Existing notes are backfilled into the full-text index
+        matched = conn.execute(
+            text("SELECT rowid FROM notes_fts WHERE notes_fts MATCH 'old'")
+        ).scalars().all()
+        assert matched == [1]
+
+
+def test_migrate_to_target_version(engine):
+    assert migrate(engine, target=1) == 1
+    assert "ix_notes_owner_id_id" not in index_names(engine, "notes")
+    assert migrate(engine) == LATEST_VERSION
+
+
+def test_migrate_resumes_half_applied_migration(engine):
+    migrate(engine, target=7)
+    # What an interrupted migration 8 leaves behind: its first column was
+    # committed, but not the version record
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE notes ADD COLUMN created_at TIMESTAMP"))
+
+    assert migrate(engine) == LATEST_VERSION
+    columns = [c["name"] for c in inspect(engine).get_columns("notes")]
+    assert columns.count("created_at") == 1
+    assert {"updated_at", "change_version"} <= set(columns)
+
+
+def test_crud_queries_use_indexes(engine, db):
+    user = models.User(username="planuser", hashed_password="fake")
+    db.add(user)
+    db.commit()
+    note = crud.create_note(
+        db, schemas.NoteCreate(title="T", content="C"), user.id
+    )
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(
+            ("SELECT", "UPDATE", "DELETE")
+        ) and "notes" in statement:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        crud.get_note(db, note.id, user.id)
+        crud.get_notes(db, user.id)
+        crud.get_notes(db, user.id, after_id=note.id)
+        update = schemas.NoteCreate(title="T2", content="C2")
+        crud.update_note(db, note.id, update, user.id)
+        db.execute(crud._select_changed_notes(user.id, 1, 2, 501)).all()
+        db.execute(crud._select_tombstones(user.id, 1, 2, 501)).all()
+        crud.delete_note(db, note.id, user.id)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert len(statements) >= 6
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            plan = conn.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            ).all()
+            details = [row[-1] for row in plan]
+            assert not any(
+                detail.startswith("SCAN") for detail in details
+            ), (statement, details)
+            assert any(
+                "INDEX" in detail or "PRIMARY KEY" in detail
+                for detail in details
+            ), (statement, details)
+
+
+def test_notes_version_triggers(engine, db):
+    first = models.User(username="first", hashed_password="fake")
+    second = models.User(username="second", hashed_password="fake")
+    db.add_all([first, second])
+    db.commit()
+    assert crud.get_notes_version(db, first.id) == 0
+
+    note = crud.create_note(
+        db, schemas.NoteCreate(title="T", content="C"), first.id
+    )
+    assert crud.get_notes_version(db, first.id) == 1
+    crud.update_note(
+        db, note.id, schemas.NoteCreate(title="T2", content="C"), first.id
+    )
+    assert crud.get_notes_version(db, first.id) == 2
+    db.add_all([
+        models.Note(title="B", content="C", owner_id=first.id)
+        for _ in range(3)
+    ])
+    db.commit()
+    assert crud.get_notes_version(db, first.id) == 5
+
+    # Test moving a note bumps both owners
+    note.owner_id = second.id
+    db.commit()
+    assert crud.get_notes_version(db, first.id) == 6
+    assert crud.get_notes_version(db, second.id) == 1
+
+    crud.delete_note(db, note.id, second.id)
+    assert crud.get_notes_version(db, second.id) == 2
+    assert crud.get_notes_version(db, first.id) == 6
+
+
+def test_notes_change_versions(engine, db):
+    user = models.User(username="stamped", hashed_password="fake")
+    db.add(user)
+    db.commit()
+    first = crud.create_note(
+        db, schemas.NoteCreate(title="A", content="a"), user.id
+    )
+    second = crud.create_note(
+        db, schemas.NoteCreate(title="B", content="b"), user.id
+    )
+    assert (first.change_version, second.change_version) == (1, 2)
+
+    crud.update_note(
+        db, first.id, schemas.NoteCreate(title="A2", content="a"), user.id
+    )
+    assert first.change_version == 3
+    assert crud.get_notes_version(db, user.id) == 3
+
+
+def test_migrate_backfills_change_versions(engine):
+    migrate(engine, target=7)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username) VALUES (1, 'u')"))
+        conn.execute(text("INSERT INTO users (id, username) VALUES (2, 'v')"))
+        for note_id, owner_id in ((1, 1), (2, 2), (3, 1)):
+            conn.execute(
+                text(
+                    "INSERT INTO notes (id, title, content, owner_id) "
+                    "VALUES (:id, 't', 'c', :owner_id)"
+                ),
+                {"id": note_id, "owner_id": owner_id},
+            )
+
+    migrate(engine)
+    with engine.connect() as conn:
+        stamped = conn.execute(
+            text("SELECT id, change_version FROM notes ORDER BY id")
+        ).all()
+        versions = conn.execute(
+            text("SELECT owner_id, version FROM note_versions ORDER BY 1")
+        ).all()
+    # Test versions 1 and 2 came from the insert triggers of migration 6
+    assert [tuple(row) for row in stamped] == [(1, 3), (2, 2), (3, 4)]
+    assert [tuple(row) for row in versions] == [(1, 4), (2, 2)]
+
+
+def test_migrate_rekeys_tombstones(engine):
+    migrate(engine, target=11)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username) VALUES (1, 'u')"))
+        conn.execute(text(
+            "INSERT INTO note_tombstones "
+            "(note_id, owner_id, deleted_at, change_version) "
+            "VALUES (7, 1, '2024-01-01 00:00:00', 3)"
+        ))
+
+    assert migrate(engine) == LATEST_VERSION
+    keys = inspect(engine).get_pk_constraint("note_tombstones")
+    assert keys["constrained_columns"] == ["owner_id", "note_id"]
+    assert "ix_note_tombstones_owner_id_change_version" in index_names(
+        engine, "note_tombstones"
+    )
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT owner_id, note_id, change_version "
+                 "FROM note_tombstones")
+        ).one()
+    assert tuple(row) == (1, 7, 3)
@@ -0,0 +1,16 @@
+import pytest
+
+from app.pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(7, 12345)
+    assert isinstance(cursor, str)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (7, 12345)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "!!!", "MTIz"])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
@@ -0,0 +1,68 @@
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import profiling
+from app.profiling import (
+    assert_max_queries, parameter_shape, profile_queries,
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'profiling.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY)"))
+    yield engine
+    engine.dispose()
+
+
+def test_parameter_shape():
+    assert parameter_shape((1, "secret", None)) == "(int, str, NoneType)"
+    assert parameter_shape({"id": 1}) == "{id: int}"
+    assert parameter_shape([(1, "a"), (2, "b")], executemany=True) == (
+        "2 x (int, str)"
+    )
+
+
+def test_profile_reports_repeated_statements(engine, caplog):
+    profiling.instrument_engine(engine, slow_query_ms=1000)
+    with caplog.at_level(logging.WARNING, logger="app.profiling"):
+        with profile_queries("GET /items") as profile:
+            with engine.connect() as conn:
+                for item_id in range(3):
+                    conn.execute(
+                        text("SELECT id FROM items WHERE id = :id"),
+                        {"id": item_id},
+                    )
+                conn.execute(text("SELECT count(*) FROM items"))
+    assert profile.count == 4
+    assert profile.repeated() == [("SELECT id FROM items WHERE id = ?", 3)]
+    assert "ran 3 times in GET /items, possible N+1" in caplog.text
+    assert profiling.current_profile() is None
+
+
+def test_slow_queries_are_logged_with_their_plan(engine, caplog):
+    profiling.instrument_engine(engine, slow_query_ms=0)
+    with caplog.at_level(logging.WARNING, logger="app.profiling"):
+        with engine.connect() as conn:
+            conn.execute(
+                text("SELECT id FROM items WHERE id = :id"), {"id": "1"}
+            )
+    assert "Slow query" in caplog.text
+    assert "parameters: (str)" in caplog.text
+    assert "SEARCH items USING INTEGER PRIMARY KEY" in caplog.text
+
+
+def test_assert_max_queries(engine):
+    profiling.instrument_engine(engine, slow_query_ms=1000)
+    with engine.connect() as conn:
+        with assert_max_queries(2) as profile:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        assert profile.count == 2
+        with pytest.raises(AssertionError, match="3 queries"):
+            with assert_max_queries(2):
+                for _ in range(3):
+                    conn.execute(text("SELECT 1"))
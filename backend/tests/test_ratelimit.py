@@ -0,0 +1,292 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app import auth, metrics
+from app.ratelimit import (
+    MemoryStore,
+    RateLimiter,
+    RateLimitMiddleware,
+    RateLimitStore,
+    Rule,
+    client_address,
+    parse_limit,
+    parse_networks,
+    route_class,
+    token_subject,
+)
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+# Stand-in for a store shared between workers, such as Redis: one dict
+# behind an awaited call, used by several limiters
+class SharedStore(RateLimitStore):
+    def __init__(self, timer):
+        self.backend = MemoryStore(timer=timer)
+        self.calls = 0
+
+    async def acquire(self, buckets):
+        self.calls += 1
+        return self.backend.take(buckets)
+
+
+def test_parse_limit():
+    assert parse_limit("10/minute") == (10 / 60, 10)
+    assert parse_limit("5/seconds") == (5, 5)
+    assert parse_limit("2") == (2, 2)
+    assert parse_limit("") is None
+    assert parse_limit("0/minute") is None
+    with pytest.raises(ValueError):
+        parse_limit("10/fortnight")
+
+
+def test_route_class():
+    assert route_class("POST", "/token") == "auth"
+    assert route_class("POST", "/users/") == "auth"
+    assert route_class("POST", "/token/refresh") == "default"
+    assert route_class("POST", "/translate/batch") == "translate"
+    assert route_class("GET", "/notes/") == "default"
+
+
+def test_memory_store_refills():
+    timer = FakeTimer()
+    store = MemoryStore(timer=timer)
+    buckets = [("a", 1.0, 2)]
+    assert store.take(buckets) == 0
+    assert store.take(buckets) == 0
+    assert store.take(buckets) == pytest.approx(1.0)
+
+    timer.now += 0.5
+    assert store.take(buckets) == pytest.approx(0.5)
+    timer.now += 0.5
+    assert store.take(buckets) == 0
+    assert store.stats()["admitted"] == 3
+    assert store.stats()["rejected"] == 2
+
+
+def test_memory_store_takes_all_buckets_or_none():
+    store = MemoryStore(timer=FakeTimer())
+    assert store.take([("wide", 1.0, 5), ("narrow", 1.0, 1)]) == 0
+    assert store.take([("wide", 1.0, 5), ("narrow", 1.0, 1)]) > 0
+    # The rejected request did not use up the wide bucket
+    for _ in range(4):
+        assert store.take([("wide", 1.0, 5)]) == 0
+    assert store.take([("wide", 1.0, 5)]) > 0
+
+
+def test_memory_store_evicts_keys():
+    timer = FakeTimer()
+    store = MemoryStore(max_keys=10, timer=timer)
+    for i in range(10):
+        store.take([(f"idle{i}", 1.0, 1)])
+    timer.now += 5
+    # The idle buckets have refilled and can go
+    store.take([("busy", 1.0, 1)])
+    assert store.stats()["keys"] == 1
+
+    # Nothing has refilled, so the oldest keys make room
+    for i in range(10):
+        store.take([(f"new{i}", 1.0, 1)])
+    assert store.stats()["keys"] == 9
+    assert store.stats()["evictions"] == 2
+
+
+def test_rate_limiter_buckets():
+    limiter = RateLimiter([
+        Rule("ip", "ip", 1.0, 10),
+        Rule("user", "user", 1.0, 5),
+        Rule("auth", "client", 1.0, 2, "auth"),
+        Rule("auth_global", "global", 1.0, 100, "auth"),
+    ], MemoryStore())
+
+    # Anonymous requests are counted per address only
+    anonymous_login = limiter.buckets("auth", "1.2.3.4", None)
+    assert [key for key, _, _ in anonymous_login] == [
+        "ip:ip:1.2.3.4", "auth:ip:1.2.3.4", "auth_global",
+    ]
+    # Signed-in requests are counted per user, not per address
+    listing = limiter.buckets("default", "1.2.3.4", "bob")
+    assert [key for key, _, _ in listing] == ["user:user:bob"]
+    login = limiter.buckets("auth", "1.2.3.4", "bob")
+    assert [key for key, _, _ in login] == [
+        "user:user:bob", "auth:user:bob", "auth_global",
+    ]
+
+
+def test_client_address():
+    def scope(peer, *forwarded):
+        return {
+            "client": (peer, 5000),
+            "headers": [
+                (b"x-forwarded-for", value.encode()) for value in forwarded
+            ],
+        }
+
+    trusted = parse_networks("10.0.0.1, 192.168.0.0/16")
+    # Without trusted proxies the header is ignored
+    assert client_address(scope("10.0.0.1", "1.2.3.4")) == "10.0.0.1"
+    assert client_address(scope("8.8.8.8", "1.2.3.4"), trusted) == "8.8.8.8"
+    assert client_address(scope("10.0.0.1", "1.2.3.4"), trusted) == "1.2.3.4"
+    # Hops added by trusted proxies are skipped; ones before the client's
+    # own address could be forged
+    assert client_address(
+        scope("10.0.0.1", "6.6.6.6, 1.2.3.4", "192.168.1.7"), trusted
+    ) == "1.2.3.4"
+    assert client_address(scope("10.0.0.1"), trusted) == "10.0.0.1"
+    assert client_address({"client": None, "headers": []}, trusted) == ""
+
+
+def test_token_subject():
+    token = auth.create_access_token({"sub": "ratelimited"})
+    assert token_subject(token) == "ratelimited"
+    assert token_subject(token) == "ratelimited"
+    assert token_subject("not-a-token") is None
+    assert token_subject(None) is None
+
+
+def limited_app(limiter):
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+    calls = []
+
+    @app.post("/token")
+    def login():
+        calls.append("login")
+        return {}
+
+    @app.get("/notes/")
+    def read_notes():
+        return []
+
+    return app, calls
+
+
+@pytest.mark.asyncio
+async def test_middleware_sheds_before_the_app():
+    limiter = RateLimiter(
+        [Rule("auth", "ip", 1 / 60, 2, "auth")], MemoryStore()
+    )
+    app, calls = limited_app(limiter)
+    before = metrics.RATE_LIMITED.get(("auth",))
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        statuses = [(await client.post("/token")).status_code
+                    for _ in range(3)]
+        response = await client.post("/token")
+        # Other route classes have their own buckets
+        assert (await client.get("/notes/")).status_code == 200
+
+    assert statuses == [200, 200, 429]
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 60
+    assert response.json() == {"detail": "Too many requests"}
+    assert calls == ["login", "login"]
+    assert metrics.RATE_LIMITED.get(("auth",)) == before + 2
+    assert metrics.RATE_LIMIT_DECISION_DURATION.count(("auth",)) >= 4
+
+
+@pytest.mark.asyncio
+async def test_middleware_limits_users_across_workers():
+    timer = FakeTimer()
+    store = SharedStore(timer)
+    rules = [Rule("user", "user", 1.0, 2)]
+    workers = [limited_app(RateLimiter(rules, store))[0] for _ in range(2)]
+    alice = {
+        "Authorization": "Bearer "
+        + auth.create_access_token({"sub": "alice"})
+    }
+
+    statuses = []
+    for app in workers * 2:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            statuses.append(
+                (await client.get("/notes/", headers=alice)).status_code
+            )
+    # Anonymous requests are left to the per-address rules
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=workers[0]), base_url="http://test"
+    ) as client:
+        anonymous = (await client.get("/notes/")).status_code
+
+    assert statuses == [200, 200, 429, 429]
+    assert anonymous == 200
+    assert store.calls == 5
+
+
+@pytest.mark.asyncio
+async def test_middleware_counts_users_behind_one_address_apart():
+    limiter = RateLimiter(
+        [Rule("ip", "ip", 1 / 60, 2), Rule("user", "user", 1 / 60, 2)],
+        MemoryStore(),
+    )
+    app, _ = limited_app(limiter)
+    users = [
+        {"Authorization": "Bearer "
+         + auth.create_access_token({"sub": name})}
+        for name in ("carol", "dave")
+    ]
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        statuses = [
+            (await client.get("/notes/", headers=headers)).status_code
+            for headers in users * 2
+        ]
+        # Anonymous requests from the same address have their own limit
+        anonymous = [(await client.get("/notes/")).status_code
+                     for _ in range(3)]
+
+    assert statuses == [200] * 4
+    assert anonymous == [200, 200, 429]
+
+
+@pytest.mark.asyncio
+async def test_middleware_trusts_forwarded_for_from_proxies():
+    limiter = RateLimiter([Rule("ip", "ip", 1 / 60, 1)], MemoryStore())
+    app = FastAPI()
+    app.add_middleware(
+        RateLimitMiddleware, limiter=limiter,
+        trusted_proxies=parse_networks("127.0.0.1"),
+    )
+
+    @app.get("/notes/")
+    def read_notes():
+        return []
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app, client=("127.0.0.1", 5000)),
+        base_url="http://test",
+    ) as client:
+        statuses = [
+            (await client.get(
+                "/notes/", headers={"X-Forwarded-For": address}
+            )).status_code
+            for address in ("1.1.1.1", "2.2.2.2", "1.1.1.1")
+        ]
+
+    assert statuses == [200, 200, 429]
+
+
+@pytest.mark.asyncio
+async def test_middleware_disabled():
+    limiter = RateLimiter([Rule("ip", "ip", 1.0, 1)], MemoryStore(),
+                          enabled=False)
+    app, calls = limited_app(limiter)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        for _ in range(3):
+            assert (await client.post("/token")).status_code == 200
+    assert limiter.store.stats()["admitted"] == 0
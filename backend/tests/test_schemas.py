@@ -5,8 +5,13 @@ from app.schemas import (
     User,
     NoteCreate,
     Note,
+    NoteBatchCreate,
+    NoteBatchResult,
     TranslationRequest,
+    MAX_BATCH_SIZE,
 )
+import pytest
+from pydantic import ValidationError
 
 
 def test_token_schema():
@@ -47,3 +52,20 @@ def test_note_schema_with_config():
 def test_translation_request_schema():
     req = TranslationRequest(text="Translate me")
     assert req.text == "Translate me"
+
+
+def test_note_batch_create_schema():
+    batch = NoteBatchCreate(notes=[{"title": "A", "content": "B"}])
+    assert batch.notes[0].title == "A"
+
+    with pytest.raises(ValidationError):
+        NoteBatchCreate(notes=[])
+    with pytest.raises(ValidationError):
+        NoteBatchCreate(
+            notes=[{"title": "A", "content": "B"}] * (MAX_BATCH_SIZE + 1)
+        )
+
+
+def test_note_batch_result_schema():
+    result = NoteBatchResult(id=3, status="not_found")
+    assert result.note is None
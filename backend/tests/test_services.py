@@ -1,19 +1,281 @@
+import asyncio
+import httpx
 import pytest
+import pytest_asyncio
 from unittest.mock import patch
-from app.services import translate_text
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
 
+from app import services
+from app.migrations import apply_migrations
+from app.services import chunk_texts, translate_text, translate_texts
+from app.translation_backends import FallbackBackend, LocalBackend
+from app.translation_cache import TranslationCache, cache_key, normalize_text
 
-@patch("app.services.requests.post")
-def test_translate_text_success(mock_post):
-    mock_post.return_value.json.return_value = {
+from .fake_translate import FakeTranslateServer
+
+
+@pytest_asyncio.fixture
+async def cache_engine():
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:", poolclass=StaticPool
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(apply_migrations)
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def translation_cache(cache_engine):
+    cache = TranslationCache(cache_engine)
+    with patch.object(services, "translation_cache", cache):
+        yield cache
+    # The shared client is bound to this test's event loop
+    await services.shutdown()
+
+
+@pytest.fixture
+def upstream():
+    with FakeTranslateServer() as server:
+        with patch.object(services, "TRANSLATE_API_URL", server.url):
+            yield server
+
+
+def use_transport(handler):
+    services._http_client = services.create_http_client(
+        transport=httpx.MockTransport(handler)
+    )
+
+
+@pytest.mark.asyncio
+async def test_translate_text_success():
+    use_transport(lambda request: httpx.Response(200, json={
         "data": {"translations": {"translatedText": ["Привет"]}}
-    }
+    }))
 
-    result = translate_text("Hello")
+    result = await translate_text("Hello")
     assert result == "Привет"
 
 
-@patch("app.services.requests.post", side_effect=Exception("API unavailable"))
-def test_translate_text_failure(mock_post):
+@pytest.mark.asyncio
+async def test_translate_text_failure():
+    def unavailable(request):
+        raise httpx.ConnectError("API unavailable")
+
+    use_transport(unavailable)
     with pytest.raises(Exception, match="Translation failed: API unavailable"):
-        translate_text("Hello")
+        await translate_text("Hello")
+
+
+@pytest.mark.asyncio
+async def test_translate_text_uses_upstream(upstream):
+    assert await translate_text("hello", "en", "ru") == "HELLO"
+    assert upstream.requests == [
+        {"q": "hello", "source": "en", "target": "ru"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_http_client_reuses_connections(upstream):
+    with patch.object(services, "TRANSLATION_CACHE_ENABLED", False):
+        for _ in range(3):
+            await translate_text("hello")
+    assert len(upstream.requests) == 3
+    assert len(upstream.connections) == 1
+
+
+def test_create_http_client_settings():
+    client = services.create_http_client()
+    assert client.timeout.connect == services.TRANSLATE_CONNECT_TIMEOUT
+    assert client.timeout.read == services.TRANSLATE_READ_TIMEOUT
+    assert client.headers["x-rapidapi-host"] == (
+        "deep-translate1.p.rapidapi.com"
+    )
+
+
+@pytest.mark.asyncio
+async def test_startup_and_shutdown():
+    await services.startup()
+    client = services.get_http_client()
+    assert services.get_http_client() is client
+    await services.shutdown()
+    assert client.is_closed
+    assert services._http_client is None
+
+
+@pytest.mark.asyncio
+async def test_translate_text_cached(upstream, translation_cache):
+    assert await translate_text("hello  world") == "HELLO  WORLD"
+    # Test normalized text, same languages: served from memory
+    assert await translate_text(" hello world ") == "HELLO  WORLD"
+    # Test different target language is a separate entry
+    assert await translate_text("hello world", target="de") == "HELLO WORLD"
+    assert len(upstream.requests) == 2
+
+    stats = translation_cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_translate_text_cache_survives_restart(
+    upstream, translation_cache, cache_engine
+):
+    await translate_text("persist me")
+    async with cache_engine.connect() as conn:
+        rows = (await conn.execute(
+            text("SELECT cache_key, translated_text FROM translation_cache")
+        )).all()
+    assert rows == [(cache_key("persist me", "en", "ru"), "PERSIST ME")]
+
+    # Test a fresh process (empty memory tier) reads the table
+    restarted = TranslationCache(cache_engine)
+    with patch.object(services, "translation_cache", restarted):
+        assert await translate_text("persist me") == "PERSIST ME"
+        assert len(upstream.requests) == 1
+        assert restarted.stats()["db_hits"] == 1
+
+        # Test a second lookup is promoted to memory
+        await translate_text("persist me")
+        assert restarted.stats()["memory_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_translate_text_cache_disabled(upstream, translation_cache):
+    with patch.object(services, "TRANSLATION_CACHE_ENABLED", False):
+        await translate_text("hello")
+        await translate_text("hello")
+    assert len(upstream.requests) == 2
+    assert translation_cache.stats()["memory_entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_translate_text_upstream_error_not_cached(upstream):
+    upstream.fail = True
+    with pytest.raises(Exception, match="Translation failed"):
+        await translate_text("hello")
+    upstream.fail = False
+    assert await translate_text("hello") == "HELLO"
+
+
+@pytest.mark.asyncio
+async def test_translation_cache_without_table():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    cache = TranslationCache(engine)
+    # Test a missing table degrades to the memory tier only
+    assert await cache.get("hi", "en", "ru") is None
+    await cache.set("hi", "en", "ru", "HI")
+    assert await cache.get("hi", "en", "ru") == "HI"
+    await engine.dispose()
+
+
+def test_cache_key_normalization():
+    assert cache_key("a  b", "en", "ru") == cache_key(" a b\n", "en", "ru")
+    assert cache_key("a b", "en", "ru") != cache_key("a b", "en", "de")
+    assert cache_key("a b", "en", "ru") != cache_key("a c", "en", "ru")
+
+
+def test_cache_key_keeps_line_breaks():
+    assert normalize_text("a  b\r\n\n c\t\n") == "a b\n\nc"
+    assert cache_key("a\n\nb", "en", "ru") == cache_key("a \n\nb", "en", "ru")
+    assert cache_key("a\n\nb", "en", "ru") != cache_key("a\nb", "en", "ru")
+    assert cache_key("a\nb", "en", "ru") != cache_key("a b", "en", "ru")
+
+
+def test_chunk_texts():
+    assert chunk_texts(["a", "b", "c"], max_texts=2, max_chars=100) == [
+        ["a", "b"], ["c"]
+    ]
+    assert chunk_texts(["aaa", "bb", "c"], max_texts=10, max_chars=4) == [
+        ["aaa"], ["bb", "c"]
+    ]
+    # Test an oversized text still gets a chunk of its own
+    assert chunk_texts(["a", "x" * 10, "b"], max_texts=10, max_chars=4) == [
+        ["a"], ["x" * 10], ["b"]
+    ]
+    assert chunk_texts([], max_texts=10, max_chars=4) == []
+
+
+@pytest.mark.asyncio
+async def test_translate_texts_chunks_in_order(upstream):
+    texts = [f"note {i}" for i in range(7)] + ["note 0"]
+    with patch.object(services, "TRANSLATE_BATCH_MAX_TEXTS", 3):
+        result = await translate_texts(texts)
+    assert result == [text.upper() for text in texts]
+    # Test duplicates are translated once, three texts per request
+    assert sorted(
+        len(request["q"]) if isinstance(request["q"], list) else 1
+        for request in upstream.requests
+    ) == [1, 3, 3]
+
+
+@pytest.mark.asyncio
+async def test_translate_texts_uses_cache(upstream, translation_cache):
+    await translate_text("cached")
+    assert await translate_texts(["cached", "fresh"]) == ["CACHED", "FRESH"]
+    assert upstream.requests[-1]["q"] == "fresh"
+
+    # Test batch results are stored, including in the database tier
+    restarted = TranslationCache(translation_cache.engine)
+    with patch.object(services, "translation_cache", restarted):
+        assert await translate_texts(["fresh", "cached"]) == [
+            "FRESH", "CACHED"
+        ]
+    assert len(upstream.requests) == 2
+    assert restarted.stats()["db_hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_translate_texts_upstream_error(upstream):
+    upstream.fail = True
+    with pytest.raises(Exception, match="Translation failed"):
+        await translate_texts(["a", "b"])
+
+
+@pytest.mark.asyncio
+async def test_translate_texts_error_cancels_other_chunks():
+    cancelled = []
+
+    async def handler(request):
+        if b"fail" in request.content:
+            return httpx.Response(500)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(request.content)
+            raise
+
+    use_transport(handler)
+    with patch.object(services, "TRANSLATE_BATCH_MAX_TEXTS", 1):
+        with pytest.raises(Exception, match="Translation failed"):
+            await translate_texts(["slow", "fail", "slower"])
+    assert len(cancelled) == 2
+
+
+@pytest.mark.asyncio
+async def test_translate_texts_count_mismatch():
+    use_transport(lambda request: httpx.Response(200, json={
+        "data": {"translations": {"translatedText": ["only one"]}}
+    }))
+    with pytest.raises(Exception, match="expected 2 translations"):
+        await translate_texts(["a", "b"])
+
+
+@pytest.mark.asyncio
+async def test_translate_text_with_local_backend():
+    with patch.object(services, "translation_backend", LocalBackend()):
+        assert await translate_text("hello world") == "привет мир"
+        assert await translate_texts(["my note", "hello"]) == [
+            "мой заметка", "привет"
+        ]
+
+
+@pytest.mark.asyncio
+async def test_translate_text_falls_back_to_local(upstream):
+    upstream.fail = True
+    backend = FallbackBackend([services.RapidAPIBackend(), LocalBackend()])
+    with patch.object(services, "translation_backend", backend):
+        assert await translate_text("hello") == "привет"
+    assert len(upstream.requests) == 1
@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import pytest
+
+from app.translation_backends import (
+    BACKENDS, FallbackBackend, LocalBackend, TranslationBackend,
+    create_backend, load_dictionary,
+)
+
+
+class FailingBackend(TranslationBackend):
+    name = "failing"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def translate(self, texts, source, target):
+        self.calls += 1
+        raise ConnectionError("upstream down")
+
+
+@pytest.mark.asyncio
+async def test_local_backend_translates_known_words():
+    backend = LocalBackend()
+    assert await backend.translate(
+        ["Hello world!", "my notes, and yours"], "en", "ru"
+    ) == ["Привет мир!", "мой заметки, и yours"]
+    # Test unknown language pairs are echoed back
+    assert await backend.translate(["Hello"], "en", "de") == ["Hello"]
+    assert backend.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_local_backend_latency():
+    backend = LocalBackend(latency=0.05)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await asyncio.gather(*(
+        backend.translate(["hello"], "en", "ru") for _ in range(5)
+    ))
+    # Test the injected latency does not block other calls
+    assert 0.05 <= loop.time() - start < 0.2
+
+
+@pytest.mark.asyncio
+async def test_fallback_backend():
+    failing, local = FailingBackend(), LocalBackend()
+    backend = FallbackBackend([failing, local])
+    assert await backend.translate(["hello"], "en", "ru") == ["привет"]
+    assert failing.calls == 1
+    assert backend.fallbacks == 1
+
+    with pytest.raises(ConnectionError):
+        await FallbackBackend([FailingBackend()]).translate(
+            ["hello"], "en", "ru"
+        )
+
+
+@pytest.mark.asyncio
+async def test_fallback_backend_timeout():
+    backend = FallbackBackend(
+        [LocalBackend(latency=1), LocalBackend()], timeout=0.05
+    )
+    assert await backend.translate(["world"], "en", "ru") == ["мир"]
+    assert backend.fallbacks == 1
+
+    with pytest.raises(TimeoutError, match="local timed out"):
+        await FallbackBackend(
+            [LocalBackend(latency=1)], timeout=0.05
+        ).translate(["world"], "en", "ru")
+
+
+def test_create_backend():
+    assert isinstance(create_backend("local"), LocalBackend)
+    chained = create_backend("rapidapi, local", fallback_timeout=2)
+    assert isinstance(chained, FallbackBackend)
+    assert [b.name for b in chained.backends] == ["rapidapi", "local"]
+    assert chained.timeout == 2
+
+    with pytest.raises(ValueError, match="Unknown translation backend"):
+        create_backend("local,nope")
+    with pytest.raises(ValueError):
+        create_backend("")
+    assert "rapidapi" in BACKENDS
+
+
+def test_load_dictionary(tmp_path):
+    path = tmp_path / "dictionary.json"
+    path.write_text(json.dumps({"en:de": {"Hello": "hallo"}}))
+    dictionary = load_dictionary(str(path))
+    assert dictionary == {("en", "de"): {"hello": "hallo"}}
+    assert LocalBackend(dictionary=dictionary).translate_one(
+        "Hello there", "en", "de"
+    ) == "Hallo there"
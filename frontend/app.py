@@ -3,6 +3,7 @@ import requests
 from requests.exceptions import RequestException
 import extra_streamlit_components as stx
 import time
+from datetime import datetime, timedelta
 
 # Backend API URL
 API_URL = "http://localhost:8000"
@@ -13,6 +14,39 @@ def init_cookie_manager():
         st.session_state.cookie_manager = stx.CookieManager()
 
 
+def store_tokens(tokens):
+    st.session_state.token = tokens["access_token"]
+    st.session_state.cookie_manager.set(
+        "auth_token", tokens["access_token"], key="set_auth_token"
+    )
+    if tokens.get("refresh_token"):
+        st.session_state.refresh_token = tokens["refresh_token"]
+        st.session_state.cookie_manager.set(
+            "refresh_token", tokens["refresh_token"],
+            expires_at=datetime.now() + timedelta(days=30),
+            key="set_refresh_token"
+        )
+
+
+# Swaps the refresh token for new tokens instead of asking for the
+# password again once the access token has expired
+def refresh_session(refresh_token):
+    if not refresh_token:
+        return False
+    try:
+        response = requests.post(
+            f"{API_URL}/token/refresh",
+            json={"refresh_token": refresh_token},
+            timeout=10
+        )
+    except RequestException:
+        return False
+    if response.status_code != 200:
+        return False
+    store_tokens(response.json())
+    return True
+
+
 def login():
     st.subheader("Login")
     username = st.text_input("Username")
@@ -25,10 +59,9 @@ def login():
                 timeout=10
             )
             if response.status_code == 200:
-                token = response.json()["access_token"]
-                st.session_state.token = token
+                tokens = response.json()
+                store_tokens(tokens)
                 st.session_state.username = username
-                st.session_state.cookie_manager.set("auth_token", token)
                 time.sleep(5)
                 st.session_state.cookie_manager.get_all(key="login")
                 st.success("Logged in successfully!")
@@ -41,26 +74,56 @@ def login():
 
 def check_login():
     cookies = st.session_state.cookie_manager.get_all("check_login")
-    if 'auth_token' in cookies:
-        token = cookies['auth_token']
+    if 'auth_token' in cookies and verify_token(cookies['auth_token']):
+        st.session_state.token = cookies['auth_token']
+        # Kept for logout, which has to revoke it after a page reload too
+        if 'refresh_token' in cookies:
+            st.session_state.refresh_token = cookies['refresh_token']
+        return True
+    # The access token has expired; carry on with the refresh token
+    if 'refresh_token' in cookies and refresh_session(
+        cookies['refresh_token']
+    ):
+        if verify_token(st.session_state.token):
+            return True
+        del st.session_state.token
+    return False
+
+
+def verify_token(token):
+    try:
+        # Verify token with backend
+        response = requests.get(
+            f"{API_URL}/users/me",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=10
+        )
+    except RequestException:
+        return False
+    if response.status_code != 200:
+        return False
+    st.session_state.username = response.json().get("username")
+    return True
+
+
+def logout():
+    cookie_manager = st.session_state.cookie_manager
+    refresh_token = (
+        st.session_state.get("refresh_token")
+        or cookie_manager.get("refresh_token")
+    )
+    if refresh_token:
         try:
-            # Verify token with backend
-            response = requests.get(
-                f"{API_URL}/users/me",
-                headers={"Authorization": f"Bearer {token}"},
+            requests.post(
+                f"{API_URL}/token/revoke",
+                json={"refresh_token": refresh_token},
                 timeout=10
             )
-            if response.status_code == 200:
-                st.session_state.token = token
-                st.session_state.username = response.json().get("username")
-                return True
         except RequestException:
             pass
-    return False
-
-
-def logout():
-    st.session_state.cookie_manager.delete("auth_token")
+    # Left behind, the cookie would sign the user straight back in
+    cookie_manager.delete("refresh_token", key="delete_refresh_token")
+    cookie_manager.delete("auth_token")
     st.session_state.clear()
     time.sleep(5)
     st.rerun()
@@ -112,15 +175,28 @@ def notes_app():
             except RequestException:
                 st.error("Could not connect to the server")
 
-    # List notes
+    # List notes, revalidating the copy kept from the previous rerun
     try:
-        notes = requests.get(
+        headers = {"Authorization": f"Bearer {st.session_state.token}"}
+        cached = st.session_state.get("notes_cache")
+        if cached:
+            headers["If-None-Match"] = cached["etag"]
+        response = requests.get(
             f"{API_URL}/notes/",
-            headers={
-                "Authorization": f"Bearer {st.session_state.token}"
-            },
+            headers=headers,
             timeout=10
-        ).json()
+        )
+        if response.status_code == 401 and refresh_session(
+            st.session_state.get("refresh_token")
+        ):
+            st.rerun()
+        if cached and response.status_code == 304:
+            notes = cached["notes"]
+        else:
+            notes = response.json()
+            etag = response.headers.get("ETag")
+            if etag:
+                st.session_state.notes_cache = {"etag": etag, "notes": notes}
 
         for note in notes:
             with st.expander(f"{note['title']}"):
@@ -127,20 +127,97 @@ class TestAuth(unittest.TestCase):
         result = notes_app.check_login()
         self.assertFalse(result)
 
+    @patch("app.requests.post")
+    @patch("app.requests.get")
+    def test_check_login_refresh(self, mock_get, mock_post):
+        st.session_state.cookie_manager.get_all.return_value = {
+            "auth_token": "expired_token",
+            "refresh_token": "refresh_token",
+        }
+        expired = MagicMock()
+        expired.status_code = 401
+        valid = MagicMock()
+        valid.status_code = 200
+        valid.json.return_value = {"username": "testuser"}
+        mock_get.side_effect = [expired, valid]
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {
+            "access_token": "new_token",
+            "refresh_token": "new_refresh_token",
+        }
+
+        result = notes_app.check_login()
+
+        self.assertTrue(result)
+        self.assertEqual(st.session_state.token, "new_token")
+        self.assertEqual(st.session_state.refresh_token, "new_refresh_token")
+        self.assertEqual(st.session_state.username, "testuser")
+
     @patch("app.time.sleep")
     @patch("app.st.rerun")
     def test_logout(self, mock_rerun, mock_sleep):
         st.session_state.token = "test_token"
         st.session_state.username = "testuser"
         cookie_manager_mock = MagicMock()
+        cookie_manager_mock.get.return_value = None
         st.session_state.cookie_manager = cookie_manager_mock
 
         notes_app.logout()
 
-        cookie_manager_mock.delete.assert_called_once_with("auth_token")
+        cookie_manager_mock.delete.assert_any_call("auth_token")
+        cookie_manager_mock.delete.assert_any_call(
+            "refresh_token", key="delete_refresh_token"
+        )
         mock_sleep.assert_called_once()
         mock_rerun.assert_called_once()
 
+    @patch("app.requests.post")
+    @patch("app.requests.get")
+    @patch("app.time.sleep")
+    @patch("app.st.rerun")
+    def test_logout_after_reload(self, mock_rerun, mock_sleep, mock_get,
+                                 mock_post):
+        # A reload starts a new session with only the cookies left
+        cookie_manager_mock = MagicMock()
+        cookie_manager_mock.get_all.return_value = {
+            "auth_token": "test_token",
+            "refresh_token": "refresh_token",
+        }
+        st.session_state.cookie_manager = cookie_manager_mock
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {"username": "testuser"}
+
+        self.assertTrue(notes_app.check_login())
+        self.assertEqual(st.session_state.refresh_token, "refresh_token")
+        notes_app.logout()
+
+        mock_post.assert_called_once_with(
+            f"{notes_app.API_URL}/token/revoke",
+            json={"refresh_token": "refresh_token"},
+            timeout=10
+        )
+        cookie_manager_mock.delete.assert_any_call(
+            "refresh_token", key="delete_refresh_token"
+        )
+        cookie_manager_mock.delete.assert_any_call("auth_token")
+
+    @patch("app.requests.post")
+    @patch("app.time.sleep")
+    @patch("app.st.rerun")
+    def test_logout_revokes_cookie_token(self, mock_rerun, mock_sleep,
+                                         mock_post):
+        cookie_manager_mock = MagicMock()
+        cookie_manager_mock.get.return_value = "cookie_refresh_token"
+        st.session_state.cookie_manager = cookie_manager_mock
+
+        notes_app.logout()
+
+        cookie_manager_mock.get.assert_called_once_with("refresh_token")
+        self.assertEqual(
+            mock_post.call_args.kwargs["json"],
+            {"refresh_token": "cookie_refresh_token"},
+        )
+
     @patch("app.requests.post")
     @patch("app.st.text_input")
     @patch("app.st.button")
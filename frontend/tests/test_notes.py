@@ -150,6 +150,34 @@ class TestNotes(unittest.TestCase):
                         mock_success.assert_called_once()
                         mock_error.assert_not_called()
 
+    @patch("app.requests.get")
+    @patch("app.st.expander")
+    def test_list_notes_not_modified(self, mock_expander, mock_get):
+        st.session_state.notes_cache = {
+            "etag": '"1-3-abc"',
+            "notes": [{"id": 1, "title": "Cached", "content": "Content"}],
+        }
+        mock_get.return_value = MagicMock()
+        mock_get.return_value.status_code = 304
+        mock_expander.return_value.__enter__.return_value = None
+
+        with patch("app.st.form") as mock_form:
+            mock_form.return_value.__enter__.return_value = None
+
+            with patch("app.st.columns") as mock_columns:
+                mock_columns.return_value = [MagicMock(), MagicMock()]
+
+                with patch("app.st.button") as mock_button:
+                    mock_button.return_value = False
+
+                    with patch("app.st.write"):
+                        notes_app.notes_app()
+
+        headers = mock_get.call_args.kwargs["headers"]
+        self.assertEqual(headers["If-None-Match"], '"1-3-abc"')
+        mock_get.return_value.json.assert_not_called()
+        mock_expander.assert_called_once_with("Cached")
+
 
 if __name__ == "__main__":
     unittest.main()